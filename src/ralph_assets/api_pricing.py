@@ -5,65 +5,106 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import datetime
+
 from django.db.models import Q
 
+from ralph_assets import models_export
+from ralph_assets.csv_export import DEFAULT_CHUNK_SIZE, iter_chunks
+from ralph_assets.deprecation import get_deprecated_ids
 from ralph_assets.models_assets import Asset, Warehouse
 
 
-def get_warehouses():
-    """Yields dicts describing all warehouses"""
-    for warehouse in Warehouse.objects.all():
+def get_warehouses(changed_since=None):
+    """Yields dicts describing all warehouses
+
+    :param changed_since: return only warehouses modified since this moment
+    """
+    warehouses = Warehouse.objects.all()
+    if changed_since:
+        warehouses = warehouses.filter(modified__gte=changed_since)
+    for warehouse in warehouses:
         yield {
             'warehouse_id': warehouse.id,
             'warehouse_name': warehouse.name,
         }
 
 
-def get_assets(date):
-    """Yields dicts describing all assets"""
-    for asset in Asset.objects_dc.filter(
+def get_assets(date, changed_since=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yields dicts describing all assets
+
+    :param changed_since: return only assets changed since this moment, see
+        :func:`get_asset_tombstones` for assets removed from the feed
+    """
+    queryset = Asset.objects_dc.filter(
         Q(invoice_date=None) | Q(invoice_date__lte=date),
         part_info=None,
-    ):
-        device_info = asset.device_info
+    )
+    if changed_since:
+        queryset = queryset.filter(
+            models_export.changed_assets_q(changed_since),
+        )
+    for chunk in iter_chunks(queryset, chunk_size):
+        deprecated = get_deprecated_ids(chunk, date)[date]
+        for asset in chunk:
+            device_info = asset.device_info
 
-        venture_info = asset.venture
-        is_blade = None
-        if asset.model and asset.model.category:
-            is_blade = asset.model.category.is_blade
+            venture_info = asset.venture
+            is_blade = None
+            if asset.model and asset.model.category:
+                is_blade = asset.model.category.is_blade
+
+            yield {
+                'asset_id': asset.id,
+                'barcode': asset.barcode,
+                'is_deprecated': asset.id in deprecated,
+                'price': asset.price,
+                'ralph_id': (
+                    device_info.ralph_device_id if device_info else None
+                ),
+                'slots': asset.slots,
+                'sn': asset.sn,
+                'price': asset.price,
+                'deprecation_rate': asset.deprecation_rate,
+                'power_consumption': asset.model.power_consumption,
+                'height_of_device': asset.model.height_of_device,
+                'warehouse_id': asset.warehouse_id,
+                'venture_id': venture_info.id if venture_info else None,
+                'is_blade': is_blade,
+                'cores_count': asset.cores_count,
+            }
+
+
+def get_asset_tombstones(since):
+    """Yields dicts describing assets deleted or liquidated since *since*"""
+    return models_export.get_asset_tombstones(since)
 
-        yield {
-            'asset_id': asset.id,
-            'barcode': asset.barcode,
-            'is_deprecated': asset.is_deprecated(date=date),
-            'price': asset.price,
-            'ralph_id': device_info.ralph_device_id if device_info else None,
-            'slots': asset.slots,
-            'sn': asset.sn,
-            'price': asset.price,
-            'deprecation_rate': asset.deprecation_rate,
-            'power_consumption': asset.model.power_consumption,
-            'height_of_device': asset.model.height_of_device,
-            'warehouse_id': asset.warehouse_id,
-            'venture_id': venture_info.id if venture_info else None,
-            'is_blade': is_blade,
-            'cores_count': asset.cores_count,
-        }
 
+def get_asset_parts(chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yields dicts describing parts of assets
 
-def get_asset_parts():
-    """Yields dicts describing parts of assets"""
-    for asset in Asset.objects_dc.all():
-        for part in asset.get_parts():
+    Parts of every chunk of DC assets are fetched with a single query,
+    together with their models and the device info of the parent asset.
+    """
+    today = datetime.date.today()
+    devices = Asset.objects_dc.values('pk')
+    for chunk in iter_chunks(devices, chunk_size):
+        parts = list(Asset.objects.filter(
+            part_info__device__in=[device['pk'] for device in chunk],
+        ).select_related(
+            'model', 'part_info__device__device_info',
+        ).order_by('part_info__device', 'pk'))
+        deprecated = get_deprecated_ids(parts, today)[today]
+        for part in parts:
+            asset = part.part_info.device
             device_info = asset.device_info
             yield {
                 'asset_id': part.id,
                 'barcode': asset.barcode,
-                'is_deprecated': part.is_deprecated(),
+                'is_deprecated': part.id in deprecated,
                 'model': part.model.name if part.model else None,
                 'price': part.price,
                 'ralph_id': device_info.ralph_device_id if device_info else None,  # noqa
                 'sn': asset.sn,
                 'deprecation_rate': asset.deprecation_rate,
-                'is_deprecated': part.is_deprecated(),
             }
@@ -6,17 +6,62 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 import logging
+from collections import defaultdict
 
 from django.db.models import Q
 
+# from ralph.discovery.models_device import Device
 from ralph.util.api import Getter
+from ralph_assets import models_export
+from ralph_assets.csv_export import DEFAULT_CHUNK_SIZE, iter_chunks
+from ralph_assets.deprecation import get_deprecated_ids
 from ralph_assets.licences.models import Licence
-from ralph_assets.models_assets import Asset, AssetModel, AssetType, Warehouse
+from ralph_assets.models_assets import (
+    Asset,
+    AssetModel,
+    AssetStatus,
+    AssetType,
+    Warehouse,
+)
 from ralph_assets.models_support import Support
 
 logger = logging.getLogger(__name__)
 
 
+class PrefetchedRelation(object):
+    """Getter field returning ids of objects related through the
+    many-to-many *relation*.
+
+    Ids for all rows of the getter are loaded with one query, on the first
+    access.
+    """
+
+    def __init__(self, relation):
+        self.relation = relation
+
+    def load(self, queryset):
+        field = queryset.model._meta.get_field(self.relation)
+        owner = field.m2m_field_name()
+        target = field.m2m_reverse_field_name()
+        pairs = field.rel.through.objects.filter(**{
+            owner + '__in': queryset.values('pk'),
+        }).values_list(owner, target).order_by('pk')
+        related_ids = defaultdict(list)
+        for owner_id, target_id in pairs:
+            related_ids[owner_id].append(target_id)
+        return related_ids
+
+    def bind(self, getter):
+        """Returns callable reading the ids of *getter* rows."""
+        loaded = {}
+
+        def get_value(obj):
+            if 'ids' not in loaded:
+                loaded['ids'] = self.load(getter.get_queryset())
+            return loaded['ids'].get(obj.id, [])
+        return get_value
+
+
 class DatedGetter(Getter):
     """
     Returns only items that have a timespan (marked by begin_field and
@@ -24,6 +69,12 @@ class DatedGetter(Getter):
 
     def __init__(self, date, *args, **kwargs):
         self.date = date
+        self.fields = [
+            (field[0], field[1].bind(self))
+            if isinstance(field, tuple) and
+            isinstance(field[1], PrefetchedRelation) else field
+            for field in self.fields
+        ]
         super(DatedGetter, self).__init__(*args, **kwargs)
 
     def get_queryset(self):
@@ -33,19 +84,28 @@ class DatedGetter(Getter):
         })
 
 
-def get_warehouses():
-    """Yields dicts describing all warehouses"""
-    for warehouse in Warehouse.objects.all():
+def get_warehouses(changed_since=None):
+    """Yields dicts describing all warehouses
+
+    :param changed_since: return only warehouses modified since this moment
+    """
+    warehouses = Warehouse.objects.all()
+    if changed_since:
+        warehouses = warehouses.filter(modified__gte=changed_since)
+    for warehouse in warehouses:
         yield {
             'warehouse_id': warehouse.id,
             'warehouse_name': warehouse.name,
         }
 
 
-def get_models():
-    for model in AssetModel.objects.filter(
+def get_models(changed_since=None):
+    models = AssetModel.objects.filter(
         type__in=AssetType.DC.choices
-    ).select_related('manufacturer', 'category'):
+    ).select_related('manufacturer', 'category')
+    if changed_since:
+        models = models.filter(modified__gte=changed_since)
+    for model in models:
         yield {
             'model_id': model.id,
             'name': model.name,
@@ -56,48 +116,66 @@ def get_models():
         }
 
 
-def get_assets(date):
-    """Yields dicts describing all assets"""
-    for asset in Asset.objects_dc.filter(
+def get_assets(date, changed_since=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yields dicts describing all assets
+
+    :param changed_since: return only assets changed since this moment, see
+        :func:`get_asset_tombstones` for assets removed from the feed
+
+    Assets are fetched in chunks; liquidation dates and depreciation are
+    loaded with one query per chunk.
+    """
+    queryset = Asset.objects_dc.filter(
         Q(invoice_date=None) | Q(invoice_date__lte=date),
         part_info=None,
-    ).select_related('model', 'device_info'):
-        if not asset.device_info_id:
-            logger.error('Asset {0} has no device'.format(asset.id))
-            continue
-        if not asset.service_id:
-            logger.error('Asset {0} has no service'.format(asset.id))
-            continue
-        if not asset.device_environment_id:
-            logger.error('Asset {0} has no environment'.format(asset.id))
-            continue
-        if asset.is_liquidated(date):
-            logger.info("Skipping asset {} - it's liquidated")
-            continue
-        device_info = asset.device_info
-        hostname = None
-        if device_info:
-            ralph_device = device_info.get_ralph_device()
-            if ralph_device:
-                hostname = ralph_device.name
-
-        yield {
-            'asset_id': asset.id,
-            'device_id': device_info.ralph_device_id if device_info else None,
-            'asset_name': hostname,
-            'service_id': asset.service_id,
-            'environment_id': asset.device_environment_id,
-            'sn': asset.sn,
-            'barcode': asset.barcode,
-            'warehouse_id': asset.warehouse_id,
-            'cores_count': asset.cores_count,
-            'power_consumption': asset.model.power_consumption,
-            'collocation': asset.model.height_of_device,
-            'depreciation_rate': asset.deprecation_rate,
-            'is_depreciated': asset.is_deprecated(date=date),
-            'price': asset.price,
-            'model_id': asset.model_id,
-        }
+    ).select_related('model', 'device_info')
+    if changed_since:
+        queryset = queryset.filter(
+            models_export.changed_assets_q(changed_since),
+        )
+    for chunk in iter_chunks(queryset, chunk_size):
+        liquidation_dates = Asset.get_liquidation_dates([
+            asset.id for asset in chunk
+            if asset.status == AssetStatus.liquidated
+        ])
+        deprecated = get_deprecated_ids(chunk, date)[date]
+        for asset in chunk:
+            if not asset.device_info_id:
+                logger.error('Asset {0} has no device'.format(asset.id))
+                continue
+            if not asset.service_id:
+                logger.error('Asset {0} has no service'.format(asset.id))
+                continue
+            if not asset.device_environment_id:
+                logger.error('Asset {0} has no environment'.format(asset.id))
+                continue
+            if asset.is_liquidated(date, liquidation_dates):
+                logger.info("Skipping asset {} - it's liquidated")
+                continue
+            device_info = asset.device_info
+            yield {
+                'asset_id': asset.id,
+                'device_id': device_info.ralph_device_id,
+                # names of Ralph devices are not available here
+                'asset_name': None,
+                'service_id': asset.service_id,
+                'environment_id': asset.device_environment_id,
+                'sn': asset.sn,
+                'barcode': asset.barcode,
+                'warehouse_id': asset.warehouse_id,
+                'cores_count': asset.cores_count,
+                'power_consumption': asset.model.power_consumption,
+                'collocation': asset.model.height_of_device,
+                'depreciation_rate': asset.deprecation_rate,
+                'is_depreciated': asset.id in deprecated,
+                'price': asset.price,
+                'model_id': asset.model_id,
+            }
+
+
+def get_asset_tombstones(since):
+    """Yields dicts describing assets deleted or liquidated since *since*"""
+    return models_export.get_asset_tombstones(since)
 
 
 class get_supports(DatedGetter):
@@ -114,9 +192,7 @@ class get_supports(DatedGetter):
         'price',
         'date_from',
         'date_to',
-        ('assets', (lambda support: [
-            asset.id for asset in support.assets.all()
-        ]))
+        ('assets', PrefetchedRelation('assets')),
     ]
 
 
@@ -134,7 +210,5 @@ class get_licences(DatedGetter):
         'price',
         'invoice_date',
         'valid_thru',
-        ('assets', (lambda licence: [
-            asset.id for asset in licence.assets.all()
-        ]))
+        ('assets', PrefetchedRelation('assets')),
     ]
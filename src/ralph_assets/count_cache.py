@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+
+"""Cache of search result counts.
+
+Counts are keyed by a canonical fingerprint of the search filter (so changing
+the sort order or page never counts again) and by the regions of the current
+user. Saving or deleting any object of this app bumps a generation number,
+which makes all cached counts stale at once.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Q
+from django.db.models.query import QuerySet
+from django.utils.encoding import force_unicode
+
+from ralph import middleware
+
+
+GENERATION_KEY = 'ralph_assets:search_count:generation'
+
+
+def _new_generation():
+    # time based, so a generation lost by the cache backend is never reused
+    return int(time.time() * 1000)
+
+
+def get_generation():
+    generation = cache.get(GENERATION_KEY)
+    if generation is None:
+        generation = _new_generation()
+        if not cache.add(GENERATION_KEY, generation):
+            generation = cache.get(GENERATION_KEY, generation)
+    return generation
+
+
+def bump_generation():
+    """Invalidate all cached counts."""
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, _new_generation())
+
+
+def _canonical_value(value):
+    if isinstance(value, QuerySet):
+        sql, params = value.query.sql_with_params()
+        return ('queryset', sql, _canonical_value(params))
+    if isinstance(value, (set, frozenset)):
+        return tuple(sorted(_canonical_value(item) for item in value))
+    if isinstance(value, (list, tuple)):
+        return tuple(_canonical_value(item) for item in value)
+    if hasattr(value, '_meta'):
+        return (value._meta.db_table, value.pk)
+    if isinstance(value, basestring):
+        return force_unicode(value)
+    return value
+
+
+def canonical_query(query):
+    """Order independent representation of *query* (a ``Q`` object).
+
+    Children of every node are sorted, so ``Q(a=1) & Q(b=2)`` and
+    ``Q(b=2) & Q(a=1)`` are represented the same way.
+    """
+    if isinstance(query, Q):
+        return (
+            query.connector,
+            query.negated,
+            tuple(sorted(canonical_query(child) for child in query.children)),
+        )
+    lookup, value = query
+    return (force_unicode(lookup), _canonical_value(value))
+
+
+def get_region_ids():
+    """Sorted ids of regions of the current user."""
+    return tuple(
+        sorted(region.id for region in middleware.get_actual_regions())
+    )
+
+
+def query_fingerprint(model, query, variant=None):
+    data = repr((
+        model._meta.db_table, get_region_ids(), variant,
+        canonical_query(query),
+    ))
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+
+def cached_count(model, query, count, variant=None):
+    """Returns result of *count* (a callable counting *model* objects
+    filtered by *query*) and caches it.
+
+    :param variant: distinguishes different counting methods of the same
+        query (e.g. with a limit)
+    """
+    timeout = settings.ASSETS_SEARCH['COUNT_CACHE_TIMEOUT']
+    if not timeout:
+        return count()
+    key = 'ralph_assets:search_count:{}:{}'.format(
+        get_generation(), query_fingerprint(model, query, variant),
+    )
+    result = cache.get(key)
+    if result is None:
+        result = count()
+        cache.set(key, result, timeout)
+    return result
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+
+"""Helpers for streaming big CSV exports to disk.
+
+Rows are produced lazily, written straight into a file in
+``ASSETS_REPORTS['TEMP_STORAGE_PATH']`` and served from there, so neither
+the rq worker nor the web worker keeps the whole export in memory. A
+finished job may be served many times, so files stay until they are
+removed by the ``remove_old_exports`` command.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import csv
+import errno
+import os
+import re
+import time
+import uuid
+
+from django.conf import settings
+from django.core.servers.basehttp import FileWrapper
+from django.http import HttpResponse
+from django.utils.encoding import smart_str
+
+from ralph.util.reports import set_progress
+
+
+DEFAULT_CHUNK_SIZE = 1000
+# names of CSV files from ``get_export_path`` (other exports, e.g. rows of
+# imports, are removed by their owners)
+EXPORT_NAME_RE = re.compile(r'^[0-9a-f]{32}-.*\.csv$')
+
+
+def iter_chunks(queryset, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Yield lists of objects from *queryset* ordered by ``pk``.
+
+    Every chunk is fetched with a separate ``pk > last_pk`` query, so deep
+    chunks are as cheap as the first one and only one chunk is kept in
+    memory at a time.
+    """
+    last_pk = None
+    queryset = queryset.order_by('pk')
+    while True:
+        chunk_qs = queryset
+        if last_pk is not None:
+            chunk_qs = chunk_qs.filter(pk__gt=last_pk)
+        chunk = list(chunk_qs[:chunk_size])
+        if not chunk:
+            return
+        yield chunk
+        if len(chunk) < chunk_size:
+            return
+        last_pk = _get_pk(chunk[-1])
+
+
+def _get_pk(item):
+    if isinstance(item, dict):
+        return item['pk'] if 'pk' in item else item['id']
+    return item.pk
+
+
+class ProgressReporter(object):
+    """Throttled ``set_progress`` for rq jobs.
+
+    Progress is stored only every *every_rows* processed rows or every
+    *every_seconds* seconds, whichever comes first.
+    """
+
+    def __init__(self, job, total, every_rows=500, every_seconds=2):
+        self.job = job
+        self.total = total
+        self.every_rows = every_rows
+        self.every_seconds = every_seconds
+        self.processed = 0
+        self._reported_rows = 0
+        self._reported_at = time.time()
+
+    def step(self, count=1):
+        self.processed += count
+        if not self.job or not self.total:
+            return
+        now = time.time()
+        if (
+            self.processed - self._reported_rows >= self.every_rows or
+            now - self._reported_at >= self.every_seconds
+        ):
+            self._reported_rows = self.processed
+            self._reported_at = now
+            set_progress(self.job, min(self.processed / self.total, 1))
+
+    def finish(self):
+        if self.job:
+            set_progress(self.job, 1)
+
+
+def get_export_path(filename):
+    """Returns an unique path for *filename* in the reports storage."""
+    return os.path.join(
+        settings.ASSETS_REPORTS['TEMP_STORAGE_PATH'],
+        '{}-{}'.format(uuid.uuid4().hex, filename),
+    )
+
+
+def remove_old_exports(max_age=None):
+    """Remove CSV files written to :func:`get_export_path` more than
+    *max_age* seconds ago (by default ``ASSETS_EXPORTS['MAX_AGE']``).
+
+    :returns: number of removed files
+    """
+    if max_age is None:
+        max_age = settings.ASSETS_EXPORTS['MAX_AGE']
+    directory = settings.ASSETS_REPORTS['TEMP_STORAGE_PATH']
+    limit = time.time() - max_age
+    removed = 0
+    for name in os.listdir(directory):
+        if not EXPORT_NAME_RE.match(name):
+            continue
+        path = os.path.join(directory, name)
+        try:
+            if os.path.getmtime(path) < limit:
+                os.remove(path)
+                removed += 1
+        except OSError:
+            # removed concurrently
+            continue
+    return removed
+
+
+def write_csv(rows, path):
+    """Write *rows* (any iterable) into a UTF-8 encoded CSV file."""
+    with open(path, 'wb') as csv_file:
+        writer = csv.writer(csv_file)
+        for row in rows:
+            writer.writerow([smart_str(cell) for cell in row])
+    return path
+
+
+def make_csv_file_response(path, filename, rebuild=None):
+    """Serve CSV file from *path* in blocks instead of reading it at once.
+
+    :param rebuild: function writing the export again and returning its
+        path, called when the file was already removed (see
+        :func:`remove_old_exports`)
+    """
+    try:
+        csv_file = open(path, 'rb')
+    except IOError as exc:
+        if exc.errno != errno.ENOENT or rebuild is None:
+            raise
+        csv_file = open(rebuild(), 'rb')
+    response = HttpResponse(FileWrapper(csv_file), content_type='text/csv')
+    response['Content-Length'] = os.fstat(csv_file.fileno()).st_size
+    response['Content-Disposition'] = 'attachment; filename={}'.format(
+        filename,
+    )
+    return response
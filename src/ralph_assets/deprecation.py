@@ -0,0 +1,77 @@
+# -*- coding: utf-8 -*-
+
+"""Depreciation of many assets at once.
+
+Billing feeds need to know whether thousands of assets are deprecated on a
+given day (or on every day of a backfilled period). The end of depreciation
+of every asset is computed once per batch, sharing the ``relativedelta``
+arithmetic between assets bought on the same day with the same rate, and
+then compared with every requested date.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import datetime
+
+from dateutil.relativedelta import relativedelta
+
+
+def get_deprecation_months(deprecation_rate):
+    return int(
+        (1 / (deprecation_rate / 100) * 12)
+        if deprecation_rate else 0
+    )
+
+
+def get_deprecation_end(
+    invoice_date, deprecation_rate, deprecation_end_date=None,
+    force_deprecation=False,
+):
+    """Returns the date when the depreciation ends or None if the asset is
+    always treated as deprecated."""
+    if force_deprecation or not invoice_date:
+        return None
+    if deprecation_end_date:
+        return deprecation_end_date
+    return invoice_date + relativedelta(
+        months=get_deprecation_months(deprecation_rate),
+    )
+
+
+def get_deprecation_ends(assets):
+    """Returns list of :func:`get_deprecation_end` results of *assets*."""
+    computed = {}
+    ends = []
+    for asset in assets:
+        key = (
+            asset.invoice_date,
+            asset.deprecation_rate,
+            asset.deprecation_end_date,
+            asset.force_deprecation,
+        )
+        if key not in computed:
+            computed[key] = get_deprecation_end(*key)
+        ends.append(computed[key])
+    return ends
+
+
+def get_deprecated_ids(assets, dates):
+    """Returns dict mapping every date of *dates* to the set of ids of
+    *assets* deprecated on that date.
+
+    :param dates: a date or a sequence of dates
+    """
+    if isinstance(dates, datetime.date):
+        dates = [dates]
+    ids = [asset.id for asset in assets]
+    ends = get_deprecation_ends(assets)
+    result = {}
+    for date in dates:
+        result[date] = set(
+            asset_id for asset_id, end in zip(ids, ends)
+            if end is None or end < date
+        )
+    return result
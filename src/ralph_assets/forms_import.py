@@ -5,18 +5,42 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 import csv
+import json
+import os
 import xlrd
 import itertools as it
+from collections import namedtuple
 
 from django import forms
 from django.db.models.fields import NOT_PROVIDED
 from django.contrib.contenttypes.models import ContentType
+from django.core.files.uploadedfile import TemporaryUploadedFile
 from django.template.defaultfilters import slugify
 from django.utils.translation import ugettext_lazy as _
 
 from ralph_assets.models_assets import AssetType
 
 
+# a row of an uploaded sheet; *object_id* is set for rows of updates,
+# *number* is counted from 1 (the header)
+ImportRow = namedtuple('ImportRow', ['sheet', 'number', 'object_id', 'data'])
+
+# content type of uploads converted by :meth:`SpreadsheetReader.to_rows_file`
+ROWS_CONTENT_TYPE = 'application/x-ralph-assets-rows'
+
+
+def dump_row(row):
+    """A line of JSON with :class:`ImportRow` *row*."""
+    return json.dumps(row._asdict()) + b'\n'
+
+
+def load_row(line):
+    """:class:`ImportRow` from a line written by :func:`dump_row`."""
+    return ImportRow(**dict(
+        (str(key), value) for key, value in json.loads(line).items()
+    ))
+
+
 def get_amendment_model(mode):
     return {
         'dc': ('device_info', 'ralph_assets.deviceinfo'),
@@ -35,81 +59,176 @@ def detect_delimiter(csv_file):
     return delimiter
 
 
-class DataUploadField(forms.FileField):
-    """A field that gets the uploaded XLS or CSV data and returns data
-    prepared for add/update."""
+def _get_path(file_):
+    """Path of *file_* on disk (or None if it's kept in memory)."""
+    if hasattr(file_, 'temporary_file_path'):
+        return file_.temporary_file_path()
+    name = getattr(getattr(file_, 'file', None), 'name', None)
+    if isinstance(name, basestring) and os.path.isfile(name):
+        return name
 
-    def _process_xls(self, file_):
-        book = xlrd.open_workbook(
-            filename=file_.name,
-            file_contents=file_.read(),
-        )
-        names_per_sheet = {}
-        update_per_sheet = {}
-        add_per_sheet = {}
-        for sheet_name, sheet in (
-            (sheet_name, book.sheet_by_name(sheet_name)) for
-            sheet_name in book.sheet_names()
-        ):
-            if not sheet.nrows:
-                continue
-            name_row = sheet.row(0)
-            update = name_row[0].value == 'id'
-            if update:
-                name_row = name_row[1:]
-            names_per_sheet[sheet_name] = col_names = [
-                cell.value for cell in name_row
-            ]
-            update_per_sheet[sheet_name] = {}
-            add_per_sheet[sheet_name] = []
-            if update:
-                for row in (sheet.row(i) for i in xrange(1, sheet.nrows)):
-                    asset_id = int(row[0].value)
-                    update_per_sheet[sheet_name][asset_id] = {}
-                    for key, cell in it.izip(col_names, row[1:]):
-                        update_per_sheet[sheet_name][asset_id][slugify(key)] =\
-                            cell.value
+
+def _decode_csv_rows(reader):
+    for row in reader:
+        try:
+            yield [cell.decode('utf-8') for cell in row]
+        except UnicodeDecodeError:
+            raise forms.ValidationError(
+                'Problems with character encoding. Use UTF-8'
+            )
+
+
+class SpreadsheetReader(object):
+    """Rows of an uploaded XLS or CSV file.
+
+    xlrd parses a whole XLSX workbook when it's opened, so the workbook is
+    opened once per reader. The wizard converts the upload once with
+    :meth:`to_rows_file`; later steps read that file (filetype ``rows``),
+    one row at a time, so they neither parse the spreadsheet again nor hold
+    all rows in memory.
+
+    :attr names_per_sheet: dict of column names (without ``id``)
+    :attr update_per_sheet: dict telling which sheets update objects
+    """
+
+    def __init__(self, file_, filetype):
+        self.file = file_
+        self.filetype = filetype
+        self.names_per_sheet = {}
+        self.update_per_sheet = {}
+        self._book = None
+        if filetype == 'xls':
+            self._read_xls_headers()
+        elif filetype == 'rows':
+            self._read_rows_headers()
+        else:
+            self._read_csv_headers()
+
+    @property
+    def update(self):
+        return any(self.update_per_sheet.values())
+
+    def _open_workbook(self):
+        if self._book is None:
+            path = _get_path(self.file)
+            if path:
+                self._book = xlrd.open_workbook(filename=path)
             else:
-                for row in (sheet.row(i) for i in xrange(1, sheet.nrows)):
-                    asset_data = {}
-                    add_per_sheet[sheet_name].append(asset_data)
-                    for key, cell in it.izip(col_names, row):
-                        asset_data[slugify(key)] = cell.value
-
-        return names_per_sheet, update_per_sheet, add_per_sheet
-
-    def _process_csv(self, file_):
-        def unicode_rows(reader):
-            for row in reader:
-                try:
-                    yield [cell.decode('utf-8') for cell in row]
-                except UnicodeDecodeError:
-                    raise forms.ValidationError(
-                        'Problems with character encoding. Use UTF-8'
-                    )
-        delimiter = detect_delimiter(file_)
-        reader = unicode_rows(csv.reader(file_, delimiter=str(delimiter)))
-        update_per_sheet = {'csv': {}}
-        add_per_sheet = {'csv': []}
-        name_row = next(reader)
+                self.file.seek(0)
+                self._book = xlrd.open_workbook(
+                    filename=self.file.name,
+                    file_contents=self.file.read(),
+                )
+        return self._book
+
+    def _read_xls_headers(self):
+        book = self._open_workbook()
+        for sheet_name in book.sheet_names():
+            sheet = book.sheet_by_name(sheet_name)
+            if sheet.nrows:
+                name_row = [cell.value for cell in sheet.row(0)]
+                update = name_row[0] == 'id'
+                self.update_per_sheet[sheet_name] = update
+                self.names_per_sheet[sheet_name] = name_row[
+                    1 if update else 0:
+                ]
+
+    def _iter_xls_rows(self):
+        book = self._open_workbook()
+        for sheet_name in book.sheet_names():
+            if sheet_name not in self.names_per_sheet:
+                continue
+            sheet = book.sheet_by_name(sheet_name)
+            col_names = self.names_per_sheet[sheet_name]
+            update = self.update_per_sheet[sheet_name]
+            for i in xrange(1, sheet.nrows):
+                row = sheet.row(i)
+                if update:
+                    object_id = int(row[0].value)
+                    row = row[1:]
+                else:
+                    object_id = None
+                yield ImportRow(sheet_name, i + 1, object_id, dict(
+                    (slugify(key), cell.value)
+                    for key, cell in it.izip(col_names, row)
+                ))
+
+    def _get_csv_reader(self):
+        self.file.seek(0)
+        delimiter = detect_delimiter(self.file)
+        return _decode_csv_rows(
+            csv.reader(self.file, delimiter=str(delimiter)),
+        )
+
+    def _read_csv_headers(self):
+        name_row = next(self._get_csv_reader(), [])
         update = 'id' in name_row
         if update:
-            id_index = name_row.index('id')
-            del name_row[id_index]
-            for row in reader:
-                asset_id = int(row[id_index])
-                update_per_sheet['csv'].setdefault(asset_id, {})
-                del row[id_index]
-                for key, value in it.izip(name_row, row):
-                    update_per_sheet['csv'][asset_id][key] = value
-        else:
-            for row in reader:
-                asset_data = {}
-                add_per_sheet['csv'].append(asset_data)
-                for key, value in it.izip(name_row, row[:]):
-                    asset_data[key] = value
-        names_per_sheet = {'csv': name_row}
-        return names_per_sheet, update_per_sheet, add_per_sheet
+            name_row.remove('id')
+        self.update_per_sheet['csv'] = update
+        self.names_per_sheet['csv'] = name_row
+
+    def _iter_csv_rows(self):
+        reader = self._get_csv_reader()
+        name_row = next(reader, [])
+        id_index = name_row.index('id') if 'id' in name_row else None
+        for number, row in enumerate(reader, 2):
+            if not row:
+                continue
+            if id_index is not None:
+                object_id = int(row.pop(id_index))
+            else:
+                object_id = None
+            yield ImportRow('csv', number, object_id, dict(
+                it.izip(self.names_per_sheet['csv'], row)
+            ))
+
+    def _read_rows_headers(self):
+        self.file.seek(0)
+        headers = json.loads(self.file.readline())
+        self.names_per_sheet = headers['names_per_sheet']
+        self.update_per_sheet = headers['update_per_sheet']
+
+    def _iter_saved_rows(self):
+        for line in it.islice(self.file, 1, None):
+            yield load_row(line)
+
+    def iter_rows(self):
+        """Yields :class:`ImportRow` of all sheets."""
+        if self.filetype == 'xls':
+            return self._iter_xls_rows()
+        if self.filetype == 'rows':
+            return self._iter_saved_rows()
+        return self._iter_csv_rows()
+
+    def to_rows_file(self):
+        """Write the headers and all rows into an uploaded file of the
+        ``rows`` filetype (to be kept by the wizard storage instead of the
+        spreadsheet)."""
+        rows_file = TemporaryUploadedFile(
+            'import.json', ROWS_CONTENT_TYPE, 0, None,
+        )
+        rows_file.write(json.dumps({
+            'names_per_sheet': self.names_per_sheet,
+            'update_per_sheet': self.update_per_sheet,
+        }) + b'\n')
+        for row in self.iter_rows():
+            rows_file.write(dump_row(row))
+        rows_file.size = rows_file.tell()
+        rows_file.seek(0)
+        return rows_file
+
+    def validate(self):
+        """Check the encoding of the whole CSV file (reading one line at a
+        time)."""
+        if self.filetype == 'csv':
+            for row in self._get_csv_reader():
+                pass
+
+
+class DataUploadField(forms.FileField):
+    """A field that gets the uploaded XLS or CSV file and returns its
+    :class:`SpreadsheetReader`."""
 
     def to_python(self, value):
         file_ = super(DataUploadField, self).to_python(value)
@@ -124,14 +243,15 @@ class DataUploadField(forms.FileField):
                 'text/csv': 'csv',
                 'application/csv': 'csv',
                 'application/vnd.ms-excel': 'csv',  # Browsers Y U NO RFC 4180?
+                ROWS_CONTENT_TYPE: 'rows',
             }[file_.content_type]
         except KeyError:
             raise forms.ValidationError(
                 'Unsupported file type. Use CSV of Excel.'
             )
-        return (
-            self._process_xls if filetype == 'xls' else self._process_csv
-        )(file_)
+        reader = SpreadsheetReader(file_, filetype)
+        reader.validate()
+        return reader
 
 
 class ModelChoiceField(forms.ChoiceField):
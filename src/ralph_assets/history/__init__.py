@@ -7,7 +7,12 @@ from __future__ import unicode_literals
 
 from django.db.models import signals
 
-from ralph_assets.history.receivers import m2m_changed, post_save, pre_save
+from ralph_assets.history.receivers import (
+    m2m_changed,
+    post_init,
+    post_save,
+    pre_save,
+)
 
 
 registry = {}
@@ -27,6 +32,7 @@ def register(model, exclude=None, m2m=False):
         fields = set([field.name for field in model._meta.fields])
         fields.difference_update(set(exclude))
         registry[model] = fields
+        signals.post_init.connect(post_init, sender=model)
         signals.pre_save.connect(pre_save, sender=model)
         signals.post_save.connect(post_save, sender=model)
     else:
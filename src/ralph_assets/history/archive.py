@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+
+"""Retention of history.
+
+Changes older than ``ASSETS_HISTORY['ARCHIVE_AFTER_MONTHS']`` are moved
+from :class:`History` to :class:`HistoryArchive`, so the main table (and
+its indexes) holds only recent changes. Before that, intermediate snapshots
+of many-to-many relations are collapsed into one change per object and
+relation.
+
+Some old changes stay in the main table, because they are read when new
+history is written:
+
+* changes of ``ASSETS_HISTORY['KEEP_FIELDS']`` (e.g. status, used to find
+  when an asset was liquidated),
+* the latest snapshot of every many-to-many relation (the base of the next
+  snapshot).
+
+:func:`apply_retention` is meant to be run periodically, by the
+``archive_history`` command (e.g. from cron) or as an rq job.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import datetime
+
+from dateutil.relativedelta import relativedelta
+from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
+from django.db.models import Count, Max
+from lck.django.common import nested_commit_on_success
+
+from ralph_assets.csv_export import DEFAULT_CHUNK_SIZE, iter_chunks
+from ralph_assets.history.models import History, HistoryArchive
+
+
+ARCHIVED_FIELDS = (
+    'date', 'user_id', 'content_type_id', 'object_id', 'field_name',
+    'old_value', 'new_value',
+)
+
+
+def get_cutoff(months=None):
+    """Changes older than returned datetime can be archived (None if
+    archiving is disabled)."""
+    if months is None:
+        months = settings.ASSETS_HISTORY['ARCHIVE_AFTER_MONTHS']
+    if not months:
+        return None
+    return datetime.datetime.now() - relativedelta(months=months)
+
+
+def _get_m2m_field_names(content_type):
+    model = content_type.model_class()
+    if model is None:
+        return set()
+    names = set(field.name for field in model._meta.many_to_many)
+    names.update(
+        related.get_accessor_name()
+        for related in model._meta.get_all_related_many_to_many_objects()
+    )
+    return names
+
+
+def _get_m2m_changes(cutoff=None):
+    """Yields content types and querysets of their m2m snapshots."""
+    content_type_ids = History.objects.values_list(
+        'content_type', flat=True,
+    ).order_by().distinct()
+    for content_type in ContentType.objects.filter(pk__in=content_type_ids):
+        field_names = _get_m2m_field_names(content_type)
+        if not field_names:
+            continue
+        changes = History.objects.filter(
+            content_type=content_type,
+            field_name__in=field_names,
+        )
+        if cutoff:
+            changes = changes.filter(date__lt=cutoff)
+        yield content_type, changes
+
+
+@nested_commit_on_success
+def _collapse(changes):
+    """Replace *changes* (ordered from the oldest) by the last one, with the
+    value from before the first one."""
+    first_old_value = changes[0][1]
+    last_id = changes[-1][0]
+    History.objects.filter(pk__in=[
+        change_id for change_id, __ in changes[:-1]
+    ]).delete()
+    History.objects.filter(pk=last_id).update(old_value=first_old_value)
+    return len(changes) - 1
+
+
+def compact_history(cutoff):
+    """Collapse snapshots of m2m relations older than *cutoff*.
+
+    :returns: number of removed changes
+    """
+    removed = 0
+    for content_type, changes in _get_m2m_changes(cutoff):
+        groups = changes.values('object_id', 'field_name').annotate(
+            num=Count('id'),
+        ).filter(num__gt=1).order_by()
+        for group in groups:
+            removed += _collapse(list(changes.filter(
+                object_id=group['object_id'],
+                field_name=group['field_name'],
+            ).order_by('date', 'id').values_list('id', 'old_value')))
+    return removed
+
+
+def _get_kept_ids():
+    """Ids of latest m2m snapshots of every object and relation."""
+    kept_ids = set()
+    for content_type, changes in _get_m2m_changes():
+        kept_ids.update(
+            group['last_id'] for group in changes.values(
+                'object_id', 'field_name',
+            ).annotate(last_id=Max('id')).order_by()
+        )
+    return kept_ids
+
+
+@nested_commit_on_success
+def _move(changes):
+    HistoryArchive.objects.bulk_create([
+        HistoryArchive(**dict(
+            (field, getattr(change, field)) for field in ARCHIVED_FIELDS
+        ))
+        for change in changes
+    ])
+    History.objects.filter(pk__in=[change.id for change in changes]).delete()
+
+
+def archive_history(cutoff, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Move changes older than *cutoff* to the archive.
+
+    :returns: number of archived changes
+    """
+    kept_ids = _get_kept_ids()
+    queryset = History.objects.filter(date__lt=cutoff).exclude(
+        field_name__in=settings.ASSETS_HISTORY['KEEP_FIELDS'],
+    )
+    archived = 0
+    for chunk in iter_chunks(queryset, chunk_size):
+        changes = [change for change in chunk if change.id not in kept_ids]
+        if changes:
+            _move(changes)
+            archived += len(changes)
+    return archived
+
+
+def apply_retention(months=None, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Compact and archive history older than *months* (by default
+    ``ASSETS_HISTORY['ARCHIVE_AFTER_MONTHS']``).
+
+    :returns: tuple of numbers of removed and archived changes
+    """
+    cutoff = get_cutoff(months)
+    if cutoff is None:
+        return 0, 0
+    removed = compact_history(cutoff)
+    archived = archive_history(cutoff, chunk_size)
+    return removed, archived
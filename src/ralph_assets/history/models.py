@@ -6,12 +6,13 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 import json
-from collections import namedtuple
+import threading
+from collections import defaultdict, namedtuple
 
 from datetime import datetime
+from functools import wraps
 
-from django.db import models
-from django.core import serializers
+from django.db import connection, models
 from django.core.urlresolvers import reverse
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes.generic import GenericForeignKey
@@ -22,7 +23,10 @@ DEFAULT_HISTORY_FIELD_EXCLUDE = ('created', 'modified', 'invoice_date',
                                  'cache_version', 'rght', 'level', 'lft',
                                  'tree_id', 'loan_end_date')
 
-serializer = serializers.get_serializer("python")()
+# history changes waiting for the end of ``buffered_history`` blocks
+_local = threading.local()
+# instance attribute with last known pks of m2m relations, by field name
+M2M_SNAPSHOT_ATTR = '_m2m_history_pks'
 
 Snapshot = namedtuple(
     'Snapshot',
@@ -54,6 +58,37 @@ class HistoryManager(models.Manager):
             **kwargs
         )
 
+    def latest_changes(self, model, object_ids, field_name):
+        """Returns dict mapping ids of *model* objects to their latest
+        change of *field_name*, loaded for all *object_ids* with one query.
+        Objects without such changes are skipped."""
+        object_ids = list(object_ids)
+        if not object_ids:
+            return {}
+        content_type = ContentType.objects.get_for_model(model)
+        query = """
+            SELECT history.* FROM {table} history
+            INNER JOIN (
+                SELECT object_id, MAX(date) AS last_date FROM {table}
+                WHERE content_type_id = %s AND field_name = %s
+                    AND object_id IN ({object_ids})
+                GROUP BY object_id
+            ) latest ON history.object_id = latest.object_id
+                AND history.date = latest.last_date
+            WHERE history.content_type_id = %s AND history.field_name = %s
+            ORDER BY history.id
+        """.format(
+            table=connection.ops.quote_name(self.model._meta.db_table),
+            object_ids=', '.join(['%s'] * len(object_ids)),
+        )
+        params = (
+            [content_type.id, field_name] + object_ids +
+            [content_type.id, field_name]
+        )
+        return dict(
+            (change.object_id, change) for change in self.raw(query, params)
+        )
+
     def log_changes(self, obj, user, diff_data):
         if not obj:
             return
@@ -71,10 +106,65 @@ class HistoryManager(models.Manager):
                     new_value=data['new'] if data['new'] else '-',
                 )
             )
-        self.model.objects.bulk_create(changed_items)
+        if not _buffer_stack():
+            self.model.objects.bulk_create(changed_items)
+        else:
+            _buffer_stack()[-1].extend(changed_items)
+
+
+def _buffer_stack():
+    if not hasattr(_local, 'buffers'):
+        _local.buffers = []
+    return _local.buffers
+
+
+class buffered_history(object):
+    """Collects history changes logged inside the block (or the decorated
+    function) and saves them with a single query when it ends. Changes are
+    dropped when the block raises an exception, so inside
+    ``commit_on_success`` they are saved only with the rest of the
+    transaction. Nested blocks are flushed by the outermost one.
+
+    Changes logged inside the block are not visible in the database until
+    it ends.
+    """
+
+    def __enter__(self):
+        _buffer_stack().append([])
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        changed_items = _buffer_stack().pop()
+        if exc_type is not None:
+            return
+        if _buffer_stack():
+            _buffer_stack()[-1].extend(changed_items)
+        elif changed_items:
+            History.objects.bulk_create(changed_items)
 
+    def __call__(self, func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with self:
+                return func(*args, **kwargs)
+        return wrapper
 
-class History(models.Model):
+
+def _get_buffered_change(obj, field_name):
+    """Latest change of *field_name* of *obj* waiting in history buffers."""
+    if not _buffer_stack():
+        return None
+    content_type = ContentType.objects.get_for_model(obj.__class__)
+    for changed_items in reversed(_buffer_stack()):
+        for history in reversed(changed_items):
+            if (
+                history.content_type_id == content_type.id and
+                history.object_id == obj.id and
+                history.field_name == field_name
+            ):
+                return history
+
+
+class BaseHistory(models.Model):
     date = models.DateTimeField(verbose_name=_('date'), default=datetime.now)
     user = models.ForeignKey(
         'auth.User', verbose_name=_('user'), null=True,
@@ -82,17 +172,13 @@ class History(models.Model):
     )
     content_type = models.ForeignKey(ContentType)
     object_id = models.PositiveIntegerField()
-    content_object = GenericForeignKey('content_type', 'object_id')
     field_name = models.CharField(max_length=64, default='')
     old_value = models.TextField(default='')
     new_value = models.TextField(default='')
     objects = HistoryManager()
 
     class Meta:
-        app_label = 'ralph_assets'
-        verbose_name = _('history change')
-        verbose_name_plural = _('history changes')
-        ordering = ('-date',)
+        abstract = True
 
     def __unicode__(self):
         return 'in {} (id: {}) change {}: {} -> {}'.format(
@@ -103,6 +189,16 @@ class History(models.Model):
             self.new_value
         )
 
+
+class History(BaseHistory):
+    content_object = GenericForeignKey('content_type', 'object_id')
+
+    class Meta:
+        app_label = 'ralph_assets'
+        verbose_name = _('history change')
+        verbose_name_plural = _('history changes')
+        ordering = ('-date',)
+
     @classmethod
     def get_history_url_for_object(cls, obj):
         content_type = ContentType.objects.get_for_model(obj.__class__)
@@ -112,6 +208,30 @@ class History(models.Model):
         })
 
 
+class HistoryArchive(BaseHistory):
+    """Old changes moved out of :class:`History`, see
+    :mod:`ralph_assets.history.archive`."""
+
+    class Meta:
+        app_label = 'ralph_assets'
+        verbose_name = _('archived history change')
+        verbose_name_plural = _('archived history changes')
+        ordering = ('-date',)
+
+
+def get_full_history(obj, field_name=None):
+    """Returns list of changes of *obj* from both :class:`History` and
+    :class:`HistoryArchive`, newest first."""
+    changes = list(History.objects.get_history_for_this_object(
+        obj, field_name,
+    ))
+    changes.extend(HistoryArchive.objects.get_history_for_this_object(
+        obj, field_name,
+    ))
+    changes.sort(key=lambda change: change.date, reverse=True)
+    return changes
+
+
 class HistoryMixin(object):
     """Django's raw m2m_change signal sucks when working with forms."""
 
@@ -134,16 +254,41 @@ class HistoryMixin(object):
             field_name=field_name,
         )
 
-    def get_snapshot(self, obj, manager, field_name):
-        """Method returns snapshot from current state of object."""
-        snapshot = serializer.serialize(manager.all(), fields=())
-        try:
-            history = obj.get_history(field_name=field_name)[0]
-        except (IndexError, AttributeError):
-            history = None
+    def _get_previous_pks(self, obj, field_name, latest_changes=None):
+        """Last known pks of objects related to *obj* through *field_name*.
+
+        :param latest_changes: result of :meth:`HistoryManager.latest_changes`
+            preloaded for many objects
+        """
+        known_pks = getattr(obj, M2M_SNAPSHOT_ATTR, {})
+        if field_name in known_pks:
+            return known_pks[field_name]
+        history = _get_buffered_change(obj, field_name)
+        if history is None and latest_changes is not None:
+            history = latest_changes.get(obj.id)
+        elif history is None:
+            try:
+                history = obj.get_history(field_name=field_name)[0]
+            except (IndexError, AttributeError):
+                history = None
         previous = getattr(history, 'new_value', None)
-        previous = previous and json.loads(previous) or []
-        current = [s['pk'] for s in snapshot]
+        return previous and json.loads(previous) or []
+
+    def get_snapshot(
+        self, obj, manager, field_name, current=None, latest_changes=None,
+    ):
+        """Method returns snapshot from current state of object.
+
+        :param current: pks of related objects, if already known
+        """
+        if current is None:
+            current = list(manager.values_list('pk', flat=True))
+        previous = self._get_previous_pks(obj, field_name, latest_changes)
+        known_pks = getattr(obj, M2M_SNAPSHOT_ATTR, None)
+        if known_pks is None:
+            known_pks = {}
+            setattr(obj, M2M_SNAPSHOT_ATTR, known_pks)
+        known_pks[field_name] = current
         deleted = set(previous) - set(current)
         added = set(current) - set(previous)
         changed = not set(current) == set(previous)
@@ -164,10 +309,27 @@ class HistoryMixin(object):
             )
 
     def _save_related_objects_history(self, manager, related_pks, field_name):
-        for obj in manager.filter(pk__in=related_pks):
-            manager = getattr(obj, field_name)
-            snapshot = self.get_snapshot(obj, manager, field_name)
-            self.save_history_from_snapshot(snapshot)
+        if not related_pks:
+            return
+        field = manager.model._meta.get_field(field_name)
+        source = field.m2m_field_name()
+        target = field.m2m_reverse_field_name()
+        current_pks = defaultdict(list)
+        for source_id, target_id in field.rel.through.objects.filter(**{
+            source + '__in': related_pks,
+        }).values_list(source, target).order_by(target):
+            current_pks[source_id].append(target_id)
+        latest_changes = History.objects.latest_changes(
+            manager.model, related_pks, field_name,
+        )
+        with buffered_history():
+            for obj in manager.filter(pk__in=related_pks):
+                snapshot = self.get_snapshot(
+                    obj, None, field_name,
+                    current=current_pks[obj.id],
+                    latest_changes=latest_changes,
+                )
+                self.save_history_from_snapshot(snapshot)
 
     def save_reverse_relation_history(self):
         """Save history to related objects reverse."""
@@ -5,7 +5,11 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
-from ralph_assets.history.utils import HistoryContext
+from ralph_assets.history.utils import HistoryContext, take_snapshot
+
+
+def post_init(sender, instance, **kwargs):
+    take_snapshot(instance)
 
 
 def pre_save(sender, instance, **kwargs):
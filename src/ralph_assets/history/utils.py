@@ -5,9 +5,11 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
-from django.core import serializers
+import copy
+
 from django.db.models.fields import FieldDoesNotExist
 from django.db.models.fields.related import RelatedField
+from django.utils.encoding import is_protected_type
 
 from ralph_assets.history.models import History
 
@@ -84,40 +86,88 @@ class DictDiffer(object):
                 yield change
 
 
+SNAPSHOT_ATTR = '_history_snapshot'
+
+
+def _get_local_fields(obj):
+    return obj._meta.concrete_model._meta.local_fields
+
+
+def take_snapshot(obj):
+    """Remember current values of fields of *obj*, so the next save can be
+    compared with them without reading the row again. Deferred fields are
+    not loaded."""
+    setattr(obj, SNAPSHOT_ATTR, dict(
+        (field.attname, obj.__dict__[field.attname])
+        for field in _get_local_fields(obj)
+        if field.attname in obj.__dict__
+    ))
+
+
 class HistoryContext(object):
 
     def __init__(self):
-        self.serializer = serializers.get_serializer("python")()
         self.obj = None
 
-    def get_fields_snapshot(self, objs):
-        if not any(objs):
-            return
-        kwargs = {}
-        fields = self.registry.get(objs[0].__class__, [])
-        if fields:
-            kwargs.update({'fields': fields})
-        return self.serializer.serialize(objs, **kwargs)
+    def get_fields_snapshot(self, obj):
+        """Values of registered fields of *obj*, as the python serializer
+        would return them."""
+        fields = self.registry.get(obj.__class__)
+        snapshot = {}
+        for field in _get_local_fields(obj):
+            if not field.serialize or (fields and field.name not in fields):
+                continue
+            if field.rel is None:
+                value = field._get_val_from_obj(obj)
+                if not is_protected_type(value):
+                    value = field.value_to_string(obj)
+            else:
+                value = getattr(obj, field.get_attname())
+            snapshot[field.name] = value
+        return snapshot
 
     @property
     def registry(self):
         from ralph_assets.history import registry
         return registry
 
+    def get_pre_obj(self):
+        """Returns *obj* as it was loaded from the database.
+
+        It is rebuilt in memory from the snapshot taken when the object was
+        loaded (or last saved); the row is read again only for objects
+        without a complete snapshot.
+        """
+        if self.obj.pk is None:
+            return None
+        snapshot = getattr(self.obj, SNAPSHOT_ATTR, None)
+        local_fields = _get_local_fields(self.obj)
+        if (
+            self.obj._state.adding or not snapshot or
+            len(snapshot) != len(local_fields)
+        ):
+            try:
+                return self.model._default_manager.get(pk=self.obj.pk)
+            except self.model.DoesNotExist:
+                return None
+        pre_obj = copy.copy(self.obj)
+        for field in local_fields:
+            if field.rel:
+                pre_obj.__dict__.pop(field.get_cache_name(), None)
+        pre_obj.__dict__.update(snapshot)
+        return pre_obj
+
     def pre_save(self):
-        self.pre_obj = None
-        try:
-            self.pre_obj = self.model._default_manager.get(pk=self.obj.pk)
-        except self.model.DoesNotExist:
+        self.pre_obj = self.get_pre_obj()
+        if not self.pre_obj:
             return
-        self.past_snapshot = self.get_fields_snapshot(
-            [self.pre_obj]
-        )[0]['fields']
+        self.past_snapshot = self.get_fields_snapshot(self.pre_obj)
 
     def post_save(self):
+        take_snapshot(self.obj)
         if not self.pre_obj:
             return
-        current_snapshot = self.get_fields_snapshot([self.obj])[0]['fields']
+        current_snapshot = self.get_fields_snapshot(self.obj)
 
         fields_diff = DictDiffer(
             current_snapshot, self.past_snapshot
@@ -7,8 +7,12 @@ from __future__ import unicode_literals
 
 from django.db.models.fields import FieldDoesNotExist
 
-from ralph_assets.history.models import History
-from ralph_assets.views.base import AssetsBase, ContentTypeMixin, PaginateMixin
+from ralph_assets.history.models import History, HistoryArchive
+from ralph_assets.views.base import (
+    AssetsBase,
+    ContentTypeMixin,
+    KeysetPaginateMixin,
+)
 from ralph_assets.models_assets import ASSET_TYPE2MODE
 
 
@@ -37,18 +41,21 @@ class HistoryBase(AssetsBase):
         return context
 
 
-class HistoryListForModel(PaginateMixin, ContentTypeMixin, HistoryBase):
+class HistoryListForModel(KeysetPaginateMixin, ContentTypeMixin, HistoryBase):
     """View for history of object."""
     template_name = 'assets/history/history_for_model.html'
+    paginate_order_by = '-date'
 
     def dispatch(self, request, *args, **kwargs):
         self.status = bool(request.GET.get('status', ''))
+        self.archive = bool(request.GET.get('archive', ''))
         return super(HistoryListForModel, self).dispatch(
             request, *args, **kwargs
         )
 
     def get_paginate_queryset(self):
-        history = History.objects.get_history_for_this_content_type(
+        model = HistoryArchive if self.archive else History
+        history = model.objects.get_history_for_this_content_type(
             content_type=self.content_type,
             object_id=self.object_id,
         )
@@ -65,6 +72,7 @@ class HistoryListForModel(PaginateMixin, ContentTypeMixin, HistoryBase):
         context = super(HistoryListForModel, self).get_context_data(**kwargs)
         context.update({
             'status': self.status,
+            'archive': self.archive,
             'show_status_button': self.show_status_button,
         })
         return context
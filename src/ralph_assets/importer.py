@@ -0,0 +1,964 @@
+# -*- coding: utf-8 -*-
+
+"""Import of assets and licences from uploaded spreadsheets.
+
+:class:`ImportEngine` writes rows parsed by ``forms_import``. Before any row
+is processed, every distinct value of related columns (users, regions,
+warehouses, services...) is looked up with one query per related model
+(see :class:`RelatedValueResolver`), asset models are resolved together
+with their categories and manufacturers (see :class:`AssetModelResolver`)
+and assets to update are loaded with ``in_bulk``, so processing a row costs
+no lookup queries. History of a chunk of rows is saved with a single query.
+
+The wizard doesn't import rows itself: it saves them to a file and creates
+an :class:`ImportTask` processed by :func:`run_import_task` in an rq job.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import datetime
+import itertools as it
+import json
+import os
+from collections import defaultdict
+
+import django_rq
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.exceptions import ObjectDoesNotExist, ValidationError
+from django.db import connection, transaction
+from django.db.models.fields import (
+    BooleanField,
+    CharField,
+    DateField,
+    DecimalField,
+    TextField,
+)
+from django.db.models.fields.related import RelatedField, ManyToManyField
+from django.template.defaultfilters import slugify
+from django.utils.dateparse import parse_date, parse_datetime
+from lck.django.common.models import Named
+from ralph.account.models import Region
+from ralph.cmdb.models_ci import DeviceEnvironment, ServiceCatalog
+from rq import get_current_job
+from rq.exceptions import NoSuchJobError
+from rq.job import Job
+from rq.worker import Worker
+
+from ralph_assets.csv_export import ProgressReporter, get_export_path
+from ralph_assets.forms_import import (
+    dump_row,
+    get_amendment_model,
+    get_model_by_name,
+    load_row,
+)
+from ralph_assets.history.models import buffered_history
+from ralph_assets.models_assets import (
+    MODE2ASSET_TYPE,
+    Asset,
+    AssetCategory,
+    AssetCategoryType,
+    AssetManufacturer,
+    AssetModel,
+    CreatableFromString,
+    Sluggy,
+)
+from ralph_assets.models_import import ImportRowError, ImportStatus, ImportTask
+from ralph_assets.models_util import add_problem, ProblemSeverity
+
+
+# keeps the number of query parameters below the limits of all backends
+LOOKUP_CHUNK_SIZE = 500
+
+RESOLVABLE_MODELS = (
+    Named, Named.NonUnique, User, Sluggy, DeviceEnvironment, ServiceCatalog,
+)
+
+# columns describing the asset model (see :class:`AssetModelResolver`)
+CATALOG_FIELDS = ('model', 'model.category', 'model.manufacturer')
+
+MODE2ASSET_CATEGORY_TYPE = {
+    'dc': AssetCategoryType.data_center,
+    'back_office': AssetCategoryType.back_office,
+}
+
+
+class RequiredFieldError(Exception):
+    pass
+
+
+def _chunks(items, size=LOOKUP_CHUNK_SIZE):
+    items = iter(items)
+    while True:
+        chunk = list(it.islice(items, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+class RelatedValueResolver(object):
+    """Finds objects referenced by name in imported cells.
+
+    All distinct values referring to a model are looked up at once by
+    :meth:`preload` and cached for the whole import. Names are matched
+    case-insensitively (like ``name__iexact``), slugs exactly.
+    """
+
+    def __init__(self, asset_type):
+        self.asset_type = asset_type
+        self._cache = {}
+
+    @staticmethod
+    def is_resolvable(field):
+        return (
+            isinstance(field, RelatedField) and
+            issubclass(field.rel.to, RESOLVABLE_MODELS)
+        )
+
+    @staticmethod
+    def _get_lookup_field(model):
+        if issubclass(model, User):
+            return 'username'
+        if issubclass(model, Sluggy):
+            return 'slug'
+        return 'name'
+
+    @staticmethod
+    def _get_key(model, value):
+        return value if issubclass(model, Sluggy) else value.lower()
+
+    def _filter(self, model, values):
+        field_name = self._get_lookup_field(model)
+        if issubclass(model, Sluggy):
+            return model.objects.filter(**{field_name + '__in': values})
+        qn = connection.ops.quote_name
+        column = '{}.{}'.format(
+            qn(model._meta.db_table),
+            qn(model._meta.get_field(field_name).column),
+        )
+        return model.objects.extra(
+            where=['UPPER({}) IN ({})'.format(
+                column, ', '.join(['UPPER(%s)'] * len(values)),
+            )],
+            params=values,
+        )
+
+    def preload(self, model, values):
+        """Look up all *values* (names) of *model* not cached yet."""
+        cache = self._cache.setdefault(model, {})
+        missing = {}
+        for value in values:
+            key = self._get_key(model, value)
+            if key not in cache:
+                missing[key] = value
+        field_name = self._get_lookup_field(model)
+        for chunk in _chunks(missing.values()):
+            for obj in self._filter(model, chunk):
+                key = self._get_key(model, getattr(obj, field_name))
+                if key in missing:
+                    cache.setdefault(key, []).append(obj)
+        for key in missing:
+            cache.setdefault(key, [])
+
+    def get_objects(self, model, value):
+        self.preload(model, [value])
+        return self._cache[model][self._get_key(model, value)]
+
+    def check(self, field, value):
+        """Returns the error :meth:`resolve` would raise for *value* (None if
+        the object would be found or created). Nothing is created."""
+        model = field.rel.to
+        objects = self.get_objects(model, value)
+        if len(objects) == 1:
+            return None
+        if objects:
+            return 'Value {!r} is ambiguous for key {!r}'.format(
+                value, field.name,
+            )
+        if (
+            issubclass(model, (Region, ServiceCatalog, DeviceEnvironment)) or
+            not issubclass(model, CreatableFromString)
+        ):
+            return 'Couldn\'t find value {!r} for key {!r}'.format(
+                value, field.name,
+            )
+
+    def resolve(self, field, value):
+        """Returns the object referenced by *value* in related *field*.
+
+        Missing objects are created when the model is
+        :class:`CreatableFromString`, otherwise ``DoesNotExist`` or
+        :class:`RequiredFieldError` is raised.
+        """
+        model = field.rel.to
+        objects = self.get_objects(model, value)
+        if len(objects) == 1:
+            return objects[0]
+        not_found = 'Couldn\'t find value {!r} for key {!r}'.format(
+            value, field.name,
+        )
+        if issubclass(model, (ServiceCatalog, DeviceEnvironment)):
+            if not objects:
+                raise RequiredFieldError(not_found)
+            raise RequiredFieldError(
+                'Not ambiguous value {} for key {}'.format(value, field.name),
+            )
+        if objects:
+            raise model.MultipleObjectsReturned(
+                'Value {!r} matches {} objects of {}'.format(
+                    value, len(objects), model._meta.object_name,
+                ),
+            )
+        if issubclass(model, Region):
+            raise RequiredFieldError(not_found)
+        if not issubclass(model, CreatableFromString):
+            raise model.DoesNotExist(not_found)
+        obj = model.create_from_string(
+            asset_type=self.asset_type,
+            string_name=value,
+        )
+        obj.save()
+        objects.append(obj)
+        return obj
+
+
+def _lower_key(key):
+    return (key[0].lower(),) + key[1:]
+
+
+def _index_by_name(objects, get_key):
+    """Dict of *objects* by keys starting with names, also with lowercase
+    names, so it matches like the (maybe case-insensitive) database did."""
+    index = {}
+    for obj in objects:
+        key = get_key(obj)
+        index.setdefault(key, obj)
+        index.setdefault(_lower_key(key), obj)
+    return index
+
+
+def _find_in_index(index, key):
+    return index.get(key) or index.get(_lower_key(key))
+
+
+def _unique_by_name(keys):
+    """*keys* without those differing only by the case of the name, so the
+    same object isn't created twice."""
+    unique = {}
+    for key in keys:
+        unique.setdefault(_lower_key(key), key)
+    return list(unique.values())
+
+
+class AssetModelResolver(object):
+    """Per-import cache of asset models named in imported rows, with their
+    categories and manufacturers.
+
+    :meth:`preload` looks up all distinct combinations of names of a chunk
+    of rows at once and creates missing manufacturers and models in
+    batches, so rows are processed without catalog queries. Categories are
+    never created.
+    """
+
+    def __init__(self, mode):
+        self.asset_type = MODE2ASSET_TYPE[mode]
+        self.category_type = MODE2ASSET_CATEGORY_TYPE[mode]
+        self._categories = {}
+        self._manufacturers = {}
+        self._models = {}
+
+    def load_categories(self, names):
+        missing = set(names) - set(self._categories)
+        found = {}
+        for chunk in _chunks(missing):
+            found.update(_index_by_name(
+                AssetCategory.objects.filter(
+                    name__in=chunk,
+                    type=self.category_type,
+                ),
+                lambda category: (category.name,),
+            ))
+        for name in missing:
+            self._categories[name] = _find_in_index(found, (name,))
+
+    def get_category(self, name):
+        """Category named *name* (None if it doesn't exist)."""
+        self.load_categories([name])
+        return self._categories[name]
+
+    def _find_manufacturers(self, names):
+        found = {}
+        for chunk in _chunks(names):
+            found.update(_index_by_name(
+                AssetManufacturer.objects.filter(name__in=chunk),
+                lambda manufacturer: (manufacturer.name,),
+            ))
+        return found
+
+    def _load_manufacturers(self, names):
+        missing = set(names) - set(self._manufacturers)
+        if not missing:
+            return
+        found = self._find_manufacturers(missing)
+        new = _unique_by_name(
+            (name,) for name in missing if not _find_in_index(found, (name,))
+        )
+        if new:
+            AssetManufacturer.objects.bulk_create([
+                AssetManufacturer(name=key[0]) for key in new
+            ])
+            found = self._find_manufacturers(missing)
+        for name in missing:
+            self._manufacturers[name] = _find_in_index(found, (name,))
+
+    def _find_models(self, names):
+        found = {}
+        for chunk in _chunks(names):
+            found.update(_index_by_name(
+                AssetModel.objects.filter(
+                    name__in=chunk,
+                    type=self.asset_type,
+                ).order_by('pk'),
+                lambda model: (
+                    model.name, model.category_id, model.manufacturer_id,
+                ),
+            ))
+        return found
+
+    def preload(self, names):
+        """Find (or create) models for all *names*: triples of model,
+        category and manufacturer names."""
+        wanted = {}
+        for model, category, manufacturer in names:
+            key = (model, category or None, manufacturer or None)
+            if model and key not in self._models:
+                wanted[key] = None
+        if not wanted:
+            return
+        self.load_categories(
+            category for __, category, __ in wanted if category
+        )
+        self._load_manufacturers(
+            manufacturer for __, __, manufacturer in wanted if manufacturer
+        )
+        for key in list(wanted):
+            model, category, manufacturer = key
+            if category and self._categories[category] is None:
+                del wanted[key]
+                continue
+            wanted[key] = (
+                model,
+                self._categories[category].id if category else None,
+                self._manufacturers[manufacturer].id if manufacturer else None,
+            )
+        model_names = set(name for name, __, __ in wanted.values())
+        found = self._find_models(model_names)
+        new = _unique_by_name(
+            id_key for id_key in wanted.values()
+            if not _find_in_index(found, id_key)
+        )
+        if new:
+            AssetModel.objects.bulk_create([
+                AssetModel(
+                    name=name,
+                    type=self.asset_type,
+                    category_id=category_id,
+                    manufacturer_id=manufacturer_id,
+                ) for name, category_id, manufacturer_id in new
+            ])
+            found = self._find_models(model_names)
+        for key, id_key in wanted.items():
+            self._models[key] = _find_in_index(found, id_key)
+
+    def check(self, model, category=None, manufacturer=None):
+        """Returns the error :meth:`get_model` would raise (None if the model
+        would be found or created). Nothing is created."""
+        if category and self.get_category(category) is None:
+            return "Category '{0}' does not exists".format(category)
+
+    def get_model(self, model, category=None, manufacturer=None):
+        """Returns the asset model, creating it if needed.
+
+        Raise AssetCategory.DoesNotExist if category name is provided but
+        not exists.
+        """
+        error = self.check(model, category, manufacturer)
+        if error:
+            raise AssetCategory.DoesNotExist(error)
+        key = (model, category or None, manufacturer or None)
+        self.preload([key])
+        return self._models[key]
+
+
+class ImportEngine(object):
+    """Adds and updates objects of *model_name* with rows of a spreadsheet.
+
+    :param mappings: dict mapping slugified column names to field names
+    """
+
+    def __init__(self, model_name, mode, mappings):
+        self.model_name = model_name
+        self.mode = mode
+        self.mappings = mappings
+        self.Model = get_model_by_name(model_name)
+        if model_name == 'ralph_assets.asset':
+            self.amd_field, amd_model = get_amendment_model(mode)
+            self.AmdModel = get_model_by_name(amd_model)
+        else:
+            self.amd_field = self.AmdModel = None
+        self.resolver = RelatedValueResolver(MODE2ASSET_TYPE[mode])
+        if 'model.category' in mappings.values():
+            self.catalog = AssetModelResolver(mode)
+        else:
+            self.catalog = None
+
+    def get_field(self, field_name):
+        if '.' in field_name:
+            Model = self.AmdModel
+            _, field_name = field_name.split('.', 1)
+        else:
+            Model = self.Model
+        return Model._meta.get_field_by_name(field_name)[0]
+
+    def get_field_name(self, row, key):
+        if row.object_id is None:
+            return self.mappings.get(slugify(key))
+        return self.mappings.get(key.lower())
+
+    def convert_value(self, field, value):
+        """Parse non-empty *value* of *field* (related objects are not looked
+        up)."""
+        if isinstance(field, BooleanField):
+            value = False if value.lower() in ["0", "false"] else True
+        if isinstance(field, DecimalField):
+            if value.count(',') == 1 and '.' not in value:
+                value = value.replace(',', '.')
+        if isinstance(field, DateField):
+            value = parse_datetime(value) or parse_date(value) or None
+        if field.choices:
+            value_lower = value.lower().strip()
+            for k, v in field.choices:
+                if value_lower == v.lower().strip():
+                    value = k
+                    break
+        return value
+
+    def get_field_value(self, field_name, value):
+        """Transform a pure string into the value to be put into the
+        field."""
+        field = self.get_field(field_name)
+        field_name = field.name
+        if not value:
+            if isinstance(field, ManyToManyField):
+                return []
+            elif (
+                isinstance(field, (TextField, CharField)) and
+                field_name not in ('imei', 'sn', 'barcode')
+            ):
+                return ''
+            else:
+                return
+        value = self.convert_value(field, value)
+        if (
+            isinstance(value, basestring) and
+            self.resolver.is_resolvable(field)
+        ):
+            value = self.resolver.resolve(field, value)
+        if isinstance(field, ManyToManyField):
+            value = [value]
+        return value
+
+    def preload(self, rows):
+        """Look up all distinct related values of *rows* at once."""
+        values = defaultdict(set)
+        for row in rows:
+            for key, value in row.data.items():
+                field_name = self.get_field_name(row, key)
+                if not field_name or not value:
+                    continue
+                if field_name in ('model.category', 'model.manufacturer'):
+                    continue
+                if field_name == 'model' and self.catalog is not None:
+                    continue
+                if not isinstance(value, basestring):
+                    continue
+                field = self.get_field(field_name)
+                if self.resolver.is_resolvable(field) and not field.choices:
+                    values[field.rel.to].add(value)
+        for model, model_values in values.items():
+            self.resolver.preload(model, model_values)
+        if self.catalog is not None:
+            self.catalog.preload(self.get_catalog_names(row) for row in rows)
+
+    def get_catalog_keys(self, row):
+        """Keys of model, category and manufacturer columns of *row*."""
+        keys = {}
+        for key in row.data:
+            field_name = self.get_field_name(row, key)
+            if field_name in CATALOG_FIELDS:
+                keys[field_name] = key
+        return keys
+
+    def get_catalog_names(self, row):
+        keys = self.get_catalog_keys(row)
+        return tuple(
+            row.data.get(keys.get(field_name)) for field_name in CATALOG_FIELDS
+        )
+
+    def get_or_create_asset_model(self, row):
+        """Returns data of *row* with the asset model resolved and an error
+        message (or None)."""
+        asset_data = dict(row.data)
+        if self.catalog is None:
+            return asset_data, None
+        keys = self.get_catalog_keys(row)
+        model, category, manufacturer = self.get_catalog_names(row)
+        asset_data.pop(keys.get('model.category'), None)
+        asset_data.pop(keys.get('model.manufacturer'), None)
+        if not model:
+            return asset_data, None
+        try:
+            asset_data[keys['model']] = self.catalog.get_model(
+                model, category, manufacturer,
+            )
+        except AssetCategory.DoesNotExist:
+            return asset_data, "Category '{0}' does not exists".format(
+                category,
+            )
+        return asset_data, None
+
+    def get_update_targets(self, rows):
+        """Returns dict of objects updated by *rows*, loaded in chunks."""
+        targets = {}
+        for chunk in _chunks(set(
+            row.object_id for row in rows if row.object_id is not None
+        )):
+            targets.update(self.Model.objects.in_bulk(chunk))
+        return targets
+
+    def update_row(self, asset, row):
+        asset_data, error = self.get_or_create_asset_model(row)
+        if error:
+            return error
+        try:
+            for key, value in asset_data.items():
+                field_name = self.get_field_name(row, key)
+                new_value = self.get_field_value(field_name, value)
+                setattr(asset, field_name, new_value)
+            asset.save()
+        except Exception as exc:
+            return repr(exc)
+
+    def add_row(self, row):
+        asset_data, error = self.get_or_create_asset_model(row)
+        if error:
+            return error
+        not_found_messages = []
+        kwargs = {}
+        amd_kwargs = {}
+        m2m = {}
+        for key, value in asset_data.items():
+            field_name = self.get_field_name(row, key)
+            if field_name is None:
+                continue
+            try:
+                value = self.get_field_value(field_name, value)
+            except RequiredFieldError as exc:
+                return repr(exc.message)
+            except ObjectDoesNotExist:
+                not_found_messages.append(
+                    'Cannot find value for {}. '
+                    'Resource {} not found.'.format(
+                        key,
+                        value,
+                    )
+                )
+                value = self.get_field_value(field_name, '')
+
+            if self.amd_field and field_name.startswith(
+                self.amd_field + '.'
+            ):
+                _, field_name = field_name.split('.', 1)
+                amd_kwargs[field_name] = value
+            elif isinstance(value, list):
+                m2m[field_name] = value
+            else:
+                kwargs[field_name] = value
+        try:
+            if 'region' not in kwargs:
+                kwargs['region'] = Region.get_default_region()
+            asset = self.Model(**kwargs)
+            if self.AmdModel is not None:
+                amd_model_object = self.AmdModel(**amd_kwargs)
+                amd_model_object.save()
+                setattr(asset, self.amd_field, amd_model_object)
+            if isinstance(asset, Asset):
+                asset.type = MODE2ASSET_TYPE[self.mode]
+                device = asset.find_device_to_link()
+                if not device and self.mode == 'dc':
+                    msg = (
+                        "Unable to match asset nor"
+                        "'barcode' {!r} nor sn {!r}".format(
+                            asset.barcode, asset.sn,
+                        )
+                    )
+                    raise Exception(msg)
+            else:
+                asset.asset_type = MODE2ASSET_TYPE[self.mode]
+            asset.save()
+        except Exception as exc:
+            return repr(exc)
+        for message in not_found_messages:
+            add_problem(
+                asset,
+                ProblemSeverity.correct_me,
+                message
+            )
+        for key, value in m2m.items():
+            getattr(asset, key).add(*value)
+
+    @buffered_history()
+    def import_rows(self, rows):
+        """Update and add objects with *rows* (:class:`ImportRow`).
+
+        :returns: list of pairs of failed rows and error messages
+        """
+        self.preload(rows)
+        targets = self.get_update_targets(rows)
+        errors = []
+        for row in rows:
+            if row.object_id is None:
+                error = self.add_row(row)
+            elif row.object_id not in targets:
+                error = 'Object {} does not exist'.format(row.object_id)
+            else:
+                error = self.update_row(targets[row.object_id], row)
+            if error:
+                errors.append((row, error))
+        return errors
+
+
+class ImportValidator(object):
+    """Dry run of an import: reports problems of rows without writing
+    anything.
+
+    Rows are checked in chunks, column by column. Every distinct value of a
+    column is parsed once, related objects are looked up by the engine's
+    :class:`RelatedValueResolver` and values of unique fields are checked
+    against the database with one query per column and chunk. Asset models
+    are checked row by row with the engine's :class:`AssetModelResolver`,
+    when it resolves them.
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self._value_errors = {}
+        self._seen_unique = defaultdict(dict)
+
+    def get_columns(self, rows):
+        columns = defaultdict(list)
+        for row in rows:
+            for key, value in row.data.items():
+                field_name = self.engine.get_field_name(row, key)
+                if field_name and value not in ('', None):
+                    columns[field_name].append((row, value))
+        return columns
+
+    def check_value(self, field, value):
+        """Error message for a non-related *value* of *field* (or None)."""
+        try:
+            converted = self.engine.convert_value(field, value)
+            if isinstance(field, DateField) and converted is None:
+                return 'Invalid date {!r}'.format(value)
+            converted = field.to_python(converted)
+            if field.choices and converted not in dict(field.flatchoices):
+                return 'Invalid choice {!r}'.format(value)
+        except ValidationError as exc:
+            return '{!r}: {}'.format(value, ' '.join(exc.messages))
+        except Exception as exc:
+            return '{!r}: {!r}'.format(value, exc)
+
+    def check_related(self, field, values):
+        strings = [value for value in values if isinstance(value, basestring)]
+        self.engine.resolver.preload(field.rel.to, strings)
+        return dict(
+            (value, self.engine.resolver.check(field, value))
+            for value in strings
+        )
+
+    def check_catalog(self, rows):
+        """Problems of asset models (with categories and manufacturers) of
+        *rows*."""
+        catalog = self.engine.catalog
+        names = [(row, self.engine.get_catalog_names(row)) for row in rows]
+        catalog.load_categories(set(
+            category for row, (model, category, __) in names
+            if model and category
+        ))
+        errors = []
+        for row, (model, category, manufacturer) in names:
+            if not model:
+                continue
+            error = catalog.check(model, category, manufacturer)
+            if error:
+                errors.append((row, 'model.category: {}'.format(error)))
+        return errors
+
+    def check_unique(self, field, cells):
+        """Values of unique *field* used by other objects (or other rows)."""
+        existing = dict(self.engine.Model._base_manager.filter(**{
+            field.name + '__in': set(value for row, value in cells),
+        }).values_list(field.name, 'pk'))
+        seen = self._seen_unique[field.name]
+        errors = []
+        for row, value in cells:
+            owner_id = existing.get(value)
+            if owner_id is not None and owner_id != row.object_id:
+                errors.append((row, '{} {!r} is used by object {}'.format(
+                    field.name, value, owner_id,
+                )))
+            elif value in seen:
+                errors.append((row, '{} {!r} is repeated (row {})'.format(
+                    field.name, value, seen[value].number,
+                )))
+            else:
+                seen[value] = row
+        return errors
+
+    def check_column(self, field_name, cells):
+        if field_name in ('model.category', 'model.manufacturer'):
+            return []
+        if field_name == 'model' and self.engine.catalog is not None:
+            # see check_catalog
+            return []
+        values = set(value for row, value in cells)
+        field = self.engine.get_field(field_name)
+        if self.engine.resolver.is_resolvable(field) and not field.choices:
+            value_errors = self.check_related(field, values)
+        else:
+            value_errors = {}
+            for value in values:
+                key = (field_name, value)
+                if key not in self._value_errors:
+                    self._value_errors[key] = self.check_value(field, value)
+                value_errors[value] = self._value_errors[key]
+        errors = [
+            (row, '{}: {}'.format(field_name, value_errors[value]))
+            for row, value in cells if value_errors.get(value)
+        ]
+        if (
+            field.unique and
+            field.model is self.engine.Model and
+            not isinstance(field, RelatedField)
+        ):
+            errors.extend(self.check_unique(field, [
+                (row, value) for row, value in cells
+                if isinstance(value, basestring)
+            ]))
+        return errors
+
+    def check_rows(self, rows):
+        """Returns pairs of rows and problems of *rows* (in their order)."""
+        errors = []
+        ids = set(row.object_id for row in rows if row.object_id is not None)
+        if ids:
+            found = set(self.engine.Model.objects.filter(
+                pk__in=ids,
+            ).values_list('pk', flat=True))
+            errors.extend(
+                (row, 'Object {} does not exist'.format(row.object_id))
+                for row in rows
+                if row.object_id is not None and row.object_id not in found
+            )
+        for field_name, cells in self.get_columns(rows).items():
+            errors.extend(self.check_column(field_name, cells))
+        if self.engine.catalog is not None:
+            errors.extend(self.check_catalog(rows))
+        positions = dict((id(row), i) for i, row in enumerate(rows))
+        return sorted(errors, key=lambda error: positions[id(error[0])])
+
+    def validate(self, rows):
+        """Yields pairs of rows and problems found in *rows*."""
+        for chunk in _chunks(rows, settings.ASSETS_IMPORT['CHUNK_SIZE']):
+            for error in self.check_rows(chunk):
+                yield error
+
+
+def save_rows(rows):
+    """Write *rows* into a file in the reports storage.
+
+    :returns: path of the file and the number of rows
+    """
+    path = get_export_path('import.json')
+    count = 0
+    with open(path, 'wb') as rows_file:
+        for row in rows:
+            rows_file.write(dump_row(row))
+            count += 1
+    return path, count
+
+
+def load_rows(path):
+    """Yields rows saved by :func:`save_rows`."""
+    with open(path, 'rb') as rows_file:
+        for line in rows_file:
+            yield load_row(line)
+
+
+def create_import_task(user, model_name, mode, mappings, rows):
+    path, count = save_rows(rows)
+    task = ImportTask.objects.create(
+        user=user,
+        model_name=model_name,
+        mode=mode,
+        mappings=json.dumps(mappings),
+        rows_path=path,
+        total_rows=count,
+    )
+    enqueue_import_task(task)
+    return task
+
+
+def _get_queue():
+    return django_rq.get_queue(settings.ASSETS_IMPORT['QUEUE'])
+
+
+def enqueue_import_task(task):
+    """Run (or resume) *task* in an rq job, or right away when
+    ``ASSETS_IMPORT['QUEUE']`` is None."""
+    if settings.ASSETS_IMPORT['QUEUE'] is None:
+        run_import_task(task.id)
+        return
+    job = _get_queue().enqueue_call(
+        func=run_import_task,
+        args=(task.id,),
+        timeout=settings.ASSETS_IMPORT['JOB_TIMEOUT'],
+    )
+    ImportTask.objects.filter(pk=task.pk).update(job_id=job.id)
+
+
+def _is_job_dead(job):
+    """True if started *job* is not run by any worker (e.g. the worker was
+    killed) or should have timed out long ago."""
+    timeout = settings.ASSETS_IMPORT['JOB_TIMEOUT']
+    if (
+        job.started_at and
+        job.started_at < datetime.datetime.utcnow() - datetime.timedelta(
+            seconds=timeout,
+        )
+    ):
+        return True
+    workers = Worker.all(connection=job.connection)
+    return not any(
+        worker.get_current_job_id() == job.id for worker in workers
+    )
+
+
+def is_task_stalled(task):
+    """True if *task* is not finished and no job is going to run it (e.g.
+    the worker was restarted), so it has to be resumed."""
+    if task.status == ImportStatus.finished.id:
+        return False
+    if task.status == ImportStatus.failed.id:
+        return True
+    if not task.job_id:
+        return False
+    try:
+        job = Job.fetch(task.job_id, connection=_get_queue().connection)
+    except NoSuchJobError:
+        return True
+    if job.is_failed:
+        return True
+    return job.is_started and _is_job_dead(job)
+
+
+def resume_import_task(task):
+    """Enqueue stalled *task* again.
+
+    The task is claimed with a conditional update first, so concurrent
+    requests enqueue it only once.
+
+    :returns: True if the task was enqueued
+    """
+    if not is_task_stalled(task):
+        return False
+    claimed = ImportTask.objects.filter(
+        pk=task.pk,
+        status=task.status,
+        job_id=task.job_id,
+    ).update(status=ImportStatus.pending.id, job_id='')
+    if not claimed:
+        return False
+    enqueue_import_task(task)
+    return True
+
+
+class ImportConflict(Exception):
+    """Rows of a chunk were already imported by another job."""
+
+
+@transaction.commit_on_success
+def _import_chunk(task, engine, rows, offset):
+    """Import *rows* starting at *offset* of the task's rows."""
+    processed_rows = ImportTask.objects.select_for_update().filter(
+        pk=task.pk,
+    ).values_list('processed_rows', flat=True)[0]
+    if processed_rows != offset:
+        raise ImportConflict(
+            "Rows from {} were imported by another job.".format(offset),
+        )
+    errors = engine.import_rows(rows)
+    ImportRowError.objects.bulk_create([
+        ImportRowError(
+            task=task,
+            sheet=row.sheet,
+            row=row.number,
+            object_id=row.object_id,
+            message=message,
+        ) for row, message in errors
+    ])
+    ImportTask.objects.filter(pk=task.pk).update(
+        processed_rows=offset + len(rows),
+    )
+
+
+def run_import_task(task_id):
+    """Import rows of :class:`ImportTask` committing every
+    ``ASSETS_IMPORT['CHUNK_SIZE']`` rows.
+
+    Rows committed by a previous (interrupted) run of the task are skipped.
+    The file with rows is removed when the task is finished.
+    """
+    task = ImportTask.objects.get(pk=task_id)
+    if task.status == ImportStatus.finished.id:
+        return
+    ImportTask.objects.filter(pk=task.pk).update(
+        status=ImportStatus.running.id,
+    )
+    engine = ImportEngine(task.model_name, task.mode, task.get_mappings())
+    progress = ProgressReporter(get_current_job(), task.total_rows)
+    progress.step(task.processed_rows)
+    offset = task.processed_rows
+    rows = it.islice(load_rows(task.rows_path), offset, None)
+    try:
+        for chunk in _chunks(rows, settings.ASSETS_IMPORT['CHUNK_SIZE']):
+            _import_chunk(task, engine, chunk, offset)
+            offset += len(chunk)
+            progress.step(len(chunk))
+    except ImportConflict:
+        # the task is run by another job
+        return
+    except Exception:
+        ImportTask.objects.filter(pk=task.pk).update(
+            status=ImportStatus.failed.id,
+        )
+        raise
+    ImportTask.objects.filter(pk=task.pk).update(
+        status=ImportStatus.finished.id,
+        rows_path='',
+    )
+    os.remove(task.rows_path)
+    progress.finish()
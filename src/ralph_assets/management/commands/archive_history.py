@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import textwrap
+
+from django.core.management.base import BaseCommand
+from optparse import make_option
+
+from ralph_assets.history.archive import apply_retention
+
+
+class Command(BaseCommand):
+    """Compact old history of changes and move it to the archive table.
+    Meant to be run periodically (e.g. from cron)."""
+    help = textwrap.dedent(__doc__).strip()
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--months',
+            type='int',
+            dest='months',
+            default=None,
+            help="Archive changes older than this number of months "
+                 "(default: ASSETS_HISTORY['ARCHIVE_AFTER_MONTHS'])",
+        ),
+        make_option(
+            '--chunk-size',
+            type='int',
+            dest='chunk_size',
+            default=1000,
+            help="Number of changes archived in one transaction",
+        ),
+    )
+
+    def handle(self, *args, **options):
+        removed, archived = apply_retention(
+            options['months'], options['chunk_size'],
+        )
+        self.stdout.write(
+            'Removed {} collapsed and archived {} changes.\n'.format(
+                removed, archived,
+            )
+        )
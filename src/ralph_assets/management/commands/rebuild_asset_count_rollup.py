@@ -0,0 +1,22 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import textwrap
+
+from django.core.management.base import BaseCommand
+
+from ralph_assets.models_rollup import rebuild_rollup
+
+
+class Command(BaseCommand):
+    """Recount asset counts used by reports (e.g. after the rollup table was
+    created or assets were changed outside of Django)."""
+    help = textwrap.dedent(__doc__).strip()
+
+    def handle(self, *args, **options):
+        rows = rebuild_rollup()
+        self.stdout.write('Stored {} rollup rows.\n'.format(rows))
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import textwrap
+
+from django.core.management.base import BaseCommand
+from optparse import make_option
+
+from ralph_assets.csv_export import iter_chunks
+from ralph_assets.models_assets import Asset
+from ralph_assets.models_search import INDEXED_FIELDS, update_search_index
+
+
+class Command(BaseCommand):
+    """Rebuild trigram search index of all assets (e.g. after the index
+    table was created)."""
+    help = textwrap.dedent(__doc__).strip()
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--chunk-size',
+            type='int',
+            dest='chunk_size',
+            default=1000,
+            help="Number of assets indexed in one transaction",
+        ),
+    )
+
+    def handle(self, *args, **options):
+        queryset = Asset.admin_objects.only('id', *INDEXED_FIELDS)
+        indexed = 0
+        for chunk in iter_chunks(queryset, options['chunk_size']):
+            update_search_index(chunk)
+            indexed += len(chunk)
+        self.stdout.write('Indexed {} assets.\n'.format(indexed))
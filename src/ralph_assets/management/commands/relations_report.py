@@ -6,14 +6,13 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 import csv
-import cStringIO
 import textwrap
 
 from django.core.management.base import BaseCommand
 from django.utils.encoding import smart_str
 from optparse import make_option
 
-from ralph_assets.others import get_assets_rows, get_licences_rows
+from ralph_assets.others import get_relations_rows
 
 
 class Command(BaseCommand):
@@ -62,13 +61,14 @@ class Command(BaseCommand):
             self.stdout.write(
                 'Arguments required, type --help for more informations\n',
             )
-        output = cStringIO.StringIO()
-        writer = csv.writer(output)
         if only_assets and not only_licences:
-            for row in get_assets_rows(filter_type):
-                writer.writerow([smart_str(item) for item in row])
-            self.stdout.write(output.getvalue())
+            report = 'assets'
         elif only_licences and not only_assets:
-            for row in get_licences_rows(filter_type, only_assigned_licences):
-                writer.writerow([smart_str(item) for item in row])
-            self.stdout.write(output.getvalue())
+            report = 'licences'
+        else:
+            return
+        writer = csv.writer(self.stdout)
+        for row in get_relations_rows(
+            report, filter_type, only_assigned_licences,
+        ):
+            writer.writerow([smart_str(item) for item in row])
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import textwrap
+
+from django.core.management.base import BaseCommand
+from optparse import make_option
+
+from ralph_assets.csv_export import remove_old_exports
+
+
+class Command(BaseCommand):
+    """Remove old CSV exports from the reports storage. Meant to be run
+    periodically (e.g. from cron)."""
+    help = textwrap.dedent(__doc__).strip()
+    option_list = BaseCommand.option_list + (
+        make_option(
+            '--max-age',
+            type='int',
+            dest='max_age',
+            default=None,
+            help="Remove exports older than this number of seconds "
+                 "(default: ASSETS_EXPORTS['MAX_AGE'])",
+        ),
+    )
+
+    def handle(self, *args, **options):
+        removed = remove_old_exports(options['max_age'])
+        self.stdout.write('Removed {} exports.\n'.format(removed))
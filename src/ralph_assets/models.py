@@ -6,8 +6,6 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
-import difflib
-
 from django.contrib.auth.models import User
 from django.core.urlresolvers import reverse
 from django.utils.html import escape
@@ -46,6 +44,15 @@ from ralph_assets.licences.models import (
     LicenceType,
     SoftwareCategory,
 )
+from ralph_assets.models_export import AssetTombstone
+from ralph_assets.models_import import ImportRowError, ImportTask
+from ralph_assets.models_rollup import AssetCountRollup
+from ralph_assets.models_search import (
+    AssetSearchTrigram,
+    find_similar_assets,
+    model_name_q,
+    search_index_q,
+)
 from ralph_assets.models_support import Support
 from ralph_assets.models_transition import (
     Action,
@@ -168,7 +175,7 @@ class DeviceLookup(RestrictedLookupChannel):
             Q(device_info__gt=0) & Q(
                 Q(barcode__istartswith=q) |
                 Q(sn__istartswith=q) |
-                Q(model__name__icontains=q)
+                model_name_q(q)
             )
         )
         return self.get_base_objects().filter(query).order_by('sn')[:10]
@@ -343,8 +350,8 @@ class AssetLookupBase(RestrictedLookupChannel):
 
     def get_query(self, q, request):
         return Asset.objects.filter(
-            Q(barcode__icontains=q) |
-            Q(sn__icontains=q)
+            search_index_q('barcode', q) |
+            search_index_q('sn', q)
         ).order_by('sn', 'barcode')[:10]
 
     def get_result(self, obj):
@@ -358,9 +365,9 @@ class AssetLookup(AssetLookupBase):
 
     def get_query(self, q, request):
         return Asset.objects.filter(
-            Q(model__name__icontains=q) |
-            Q(barcode__icontains=q) |
-            Q(sn__icontains=q)
+            model_name_q(q) |
+            search_index_q('barcode', q) |
+            search_index_q('sn', q)
         ).order_by('sn', 'barcode')[:10]
 
     def format_item_display(self, obj):
@@ -460,37 +467,7 @@ class BODeviceLookup(DeviceLookup):
 
 class AssetLookupFuzzy(AssetLookupBase):
     def get_query(self, query, request):
-        # FIXME?
-        # dev_ids = Device.objects.filter(
-            # model__type=DeviceType.unknown,
-        # ).values_list('id', flat=True)
-        assets = Asset.objects.select_related(
-            'model__name',
-        ).filter(
-            # Q(device_info__ralph_device_id=None) |
-            # Q(device_info__ralph_device_id__in=dev_ids),
-        )#.filter(part_info=None)
-
-        def comparator(asset):
-            seq = "".join(
-                [part or '' for part in
-                    [
-                        asset.sn,
-                        asset.barcode,
-                        asset.model.name,
-                    ]]
-            ).replace(" ", "").lower()
-            ratio = difflib.SequenceMatcher(
-                None,
-                seq,
-                query.replace(" ", "").lower(),
-            ).ratio()
-            if ratio:
-                return 1 / ratio
-            return 999
-
-        assets = sorted(assets, key=comparator)
-        return assets[:10]
+        return find_similar_assets(query)
 
     def format_match(self, obj):
         ret = obj.__unicode__()
@@ -559,11 +536,14 @@ __all__ = [
     'Asset',
     'AssetCategory',
     'AssetCategoryType',
+    'AssetCountRollup',
     'AssetManufacturer',
     'AssetModel',
     'AssetOwner',
+    'AssetSearchTrigram',
     'AssetSource',
     'AssetStatus',
+    'AssetTombstone',
     'AssetType',
     'BOAssetModelLookup',
     'BODeviceLookup',
@@ -572,6 +552,8 @@ __all__ = [
     'DCDeviceLookup',
     'DeviceInfo',
     'DeviceLookup',
+    'ImportRowError',
+    'ImportTask',
     'Licence',
     'LicenceType',
     'OfficeInfo',
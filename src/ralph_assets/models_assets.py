@@ -9,7 +9,6 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 from collections import namedtuple
-from dateutil.relativedelta import relativedelta
 from itertools import chain
 import datetime
 import ipaddr
@@ -48,16 +47,22 @@ from mptt.models import MPTTModel
 from uuid import uuid4
 
 from django.conf import settings
+from django.contrib.contenttypes.models import ContentType
 from django.core.exceptions import ImproperlyConfigured
 from django.core.urlresolvers import reverse
 from django.db import models
+from django.db.models import Max
 from django.db.models.signals import pre_save
 from django.dispatch import receiver
 from django.template import Context, Template
 from django.utils.translation import ugettext_lazy as _
 
 
-from ralph_assets.history.models import HistoryMixin
+from ralph_assets.deprecation import (
+    get_deprecation_end,
+    get_deprecation_months,
+)
+from ralph_assets.history.models import History, HistoryMixin
 from ralph_assets.history.utils import field_changes
 from ralph_assets.models_util import (
     Regionalized,
@@ -1050,30 +1055,32 @@ class Asset(
         super(Asset, self).__init__(*args, **kwargs)
 
     def get_deprecation_months(self):
-        return int(
-            (1 / (self.deprecation_rate / 100) * 12)
-            if self.deprecation_rate else 0
-        )
+        return get_deprecation_months(self.deprecation_rate)
 
     def is_deprecated(self, date=None):
         date = date or datetime.date.today()
-        if self.force_deprecation or not self.invoice_date:
-            return True
-        if self.deprecation_end_date:
-            deprecation_date = self.deprecation_end_date
-        else:
-            deprecation_date = self.invoice_date + relativedelta(
-                months=self.get_deprecation_months(),
-            )
-        return deprecation_date < date
+        deprecation_date = get_deprecation_end(
+            self.invoice_date,
+            self.deprecation_rate,
+            self.deprecation_end_date,
+            self.force_deprecation,
+        )
+        return deprecation_date is None or deprecation_date < date
 
-    def is_liquidated(self, date=None):
+    def is_liquidated(self, date=None, liquidation_dates=None):
+        """
+        :param liquidation_dates: optional result of
+            :meth:`get_liquidation_dates` preloaded for many assets
+        """
         date = date or datetime.date.today()
         # check if asset has status 'liquidated' and if yes, check if it has
         # this status on given date
-        if self.status == AssetStatus.liquidated and self._liquidated_at(date):
-            return True
-        return False
+        if self.status != AssetStatus.liquidated:
+            return False
+        if liquidation_dates is None:
+            return bool(self._liquidated_at(date))
+        liquidated = liquidation_dates.get(self.id)
+        return bool(liquidated and liquidated.date() <= date)
 
     def _liquidated_at(self, date):
         liquidated_history = self.get_history().filter(
@@ -1082,6 +1089,26 @@ class Asset(
         ).order_by('-date')[:1]
         return liquidated_history and liquidated_history[0].date.date() <= date
 
+    @classmethod
+    def get_liquidation_dates(cls, asset_ids):
+        """Returns dict mapping id of asset to the date of its last change
+        of status to liquidated, using one query for all *asset_ids*.
+
+        History is logged under the class of the instance, so changes of
+        all asset classes are searched.
+        """
+        content_types = [
+            ContentType.objects.get_for_model(model)
+            for model in (Asset, DCAsset, BOAsset)
+        ]
+        rows = History.objects.filter(
+            content_type__in=content_types,
+            object_id__in=asset_ids,
+            field_name='status',
+            new_value='liquidated',
+        ).values('object_id').annotate(last_date=Max('date')).order_by()
+        return dict((row['object_id'], row['last_date']) for row in rows)
+
     def delete_with_info(self, *args, **kwargs):
         """
         Remove Asset with linked info-tables alltogether, because cascade
@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+
+"""Incremental exports for billing feeds.
+
+Feeds run with ``changed_since`` return only assets modified (or having
+history entries) since that moment. Assets which disappeared from the feed
+in the meantime are reported by :func:`get_asset_tombstones`: deleted assets
+are remembered in :class:`AssetTombstone`, soft deleted and liquidated ones
+are found by ``modified`` and the history of status changes.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from datetime import datetime
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import models
+from django.db.models import Q
+from django.utils.translation import ugettext_lazy as _
+
+from ralph_assets.history.models import History
+from ralph_assets.models_assets import Asset, BOAsset, DCAsset
+
+
+TOMBSTONE_DELETED = 'deleted'
+TOMBSTONE_LIQUIDATED = 'liquidated'
+
+
+class AssetTombstone(models.Model):
+    asset_id = models.PositiveIntegerField()
+    deleted_at = models.DateTimeField(default=datetime.now, db_index=True)
+
+    class Meta:
+        app_label = 'ralph_assets'
+        verbose_name = _("asset tombstone")
+
+
+def _asset_history(since):
+    content_types = [
+        ContentType.objects.get_for_model(model)
+        for model in (Asset, DCAsset, BOAsset)
+    ]
+    return History.objects.filter(
+        content_type__in=content_types,
+        date__gte=since,
+    )
+
+
+def changed_assets_q(since):
+    """Q matching assets changed since *since*."""
+    return Q(modified__gte=since) | Q(
+        pk__in=_asset_history(since).values('object_id'),
+    )
+
+
+def get_asset_tombstones(since):
+    """Yields dicts describing assets deleted or liquidated since *since*."""
+    for tombstone in AssetTombstone.objects.filter(deleted_at__gte=since):
+        yield {
+            'asset_id': tombstone.asset_id,
+            'reason': TOMBSTONE_DELETED,
+            'date': tombstone.deleted_at,
+        }
+    for asset_id, modified in Asset._base_manager.filter(
+        deleted=True,
+        modified__gte=since,
+    ).values_list('id', 'modified'):
+        yield {
+            'asset_id': asset_id,
+            'reason': TOMBSTONE_DELETED,
+            'date': modified,
+        }
+    for asset_id, date in _asset_history(since).filter(
+        field_name='status',
+        new_value='liquidated',
+    ).values_list('object_id', 'date'):
+        yield {
+            'asset_id': asset_id,
+            'reason': TOMBSTONE_LIQUIDATED,
+            'date': date,
+        }
@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+
+"""Spreadsheet imports running in the background.
+
+The import wizard stores confirmed rows in a file and creates an
+:class:`ImportTask`, which is processed by an rq job in chunks (see
+:func:`ralph_assets.importer.run_import_task`). Every chunk is committed
+together with its :class:`ImportRowError` rows and the number of processed
+rows, so an interrupted import is resumed from the last committed chunk.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import json
+
+from dj.choices import Choices
+from django.contrib.auth.models import User
+from django.db import models
+from django.utils.translation import ugettext_lazy as _
+from lck.django.common.models import TimeTrackable
+
+
+class ImportStatus(Choices):
+    _ = Choices.Choice
+
+    pending = _("pending")
+    running = _("running")
+    finished = _("finished")
+    failed = _("failed")
+
+
+class ImportTask(TimeTrackable):
+    user = models.ForeignKey(User, null=True, blank=True)
+    model_name = models.CharField(max_length=64)
+    mode = models.CharField(max_length=16)
+    mappings = models.TextField()
+    rows_path = models.CharField(max_length=1024)
+    status = models.PositiveSmallIntegerField(
+        choices=ImportStatus(),
+        default=ImportStatus.pending.id,
+    )
+    total_rows = models.PositiveIntegerField(default=0)
+    processed_rows = models.PositiveIntegerField(default=0)
+    job_id = models.CharField(max_length=64, blank=True)
+
+    class Meta:
+        app_label = 'ralph_assets'
+        verbose_name = _("import task")
+
+    def get_mappings(self):
+        return json.loads(self.mappings)
+
+    @property
+    def progress(self):
+        if not self.total_rows:
+            return 1
+        return self.processed_rows / self.total_rows
+
+    @property
+    def is_done(self):
+        return self.status in (
+            ImportStatus.finished.id, ImportStatus.failed.id,
+        )
+
+
+class ImportRowError(models.Model):
+    task = models.ForeignKey(ImportTask, related_name='row_errors')
+    sheet = models.CharField(max_length=255, blank=True)
+    row = models.PositiveIntegerField(null=True, blank=True)
+    object_id = models.PositiveIntegerField(null=True, blank=True)
+    message = models.TextField()
+
+    class Meta:
+        app_label = 'ralph_assets'
+        verbose_name = _("import row error")
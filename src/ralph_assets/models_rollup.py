@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+
+"""Materialized asset counts for reports.
+
+:class:`AssetCountRollup` keeps the number of assets for every combination
+of asset type, region, data center, model and status. Category and
+manufacturer are reached through the model. Rows are updated incrementally
+when assets are saved or deleted, so reports read a few hundred rows instead
+of grouping the whole asset table; ``rebuild_asset_count_rollup`` recounts
+everything from scratch.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from django.contrib.contenttypes.models import ContentType
+from django.db import models
+from django.db.models import Count, F
+from django.utils.translation import ugettext_lazy as _
+from lck.django.common import nested_commit_on_success
+
+from ralph_assets.models_assets import (
+    Asset,
+    AssetModel,
+    AssetStatus,
+    AssetType,
+    BOAsset,
+    DCAsset,
+    VirtualAsset,
+)
+from ralph_assets.models_dc_assets import DataCenter, Rack
+from ralph_assets.models_util import Regionalized
+
+
+# models whose instances are counted (by their ``type``)
+ROLLUP_MODELS = (Asset, DCAsset, BOAsset, VirtualAsset)
+# asset attribute keeping state of the asset as counted in the rollup
+STATE_ATTR = '_rollup_state'
+
+
+class AssetCountRollup(Regionalized):
+    type = models.PositiveIntegerField(choices=AssetType())
+    data_center = models.ForeignKey(DataCenter, null=True)
+    model = models.ForeignKey(AssetModel, related_name='count_rollups')
+    status = models.PositiveSmallIntegerField(
+        choices=AssetStatus(), null=True,
+    )
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        app_label = 'ralph_assets'
+        verbose_name = _("asset count rollup")
+        unique_together = ('region', 'type', 'data_center', 'model', 'status')
+
+
+def _is_counted(asset):
+    """Parent rows of polymorphic assets (e.g. deleted together with the
+    child) are loaded as plain :class:`Asset` instances; only the instance
+    of the real class of the asset is counted."""
+    ctype_id = asset.polymorphic_ctype_id
+    return (
+        not ctype_id or
+        ctype_id == ContentType.objects.get_for_model(asset.__class__).id
+    )
+
+
+def _get_state(asset):
+    return (
+        asset.type,
+        asset.region_id,
+        asset.model_id,
+        asset.status,
+        getattr(asset, 'rack_id', None),
+    )
+
+
+def _get_key(state):
+    asset_type, region_id, model_id, status, rack_id = state
+    data_center_id = None
+    if rack_id:
+        data_center_id = Rack.objects.filter(pk=rack_id).values_list(
+            'data_center_id', flat=True,
+        )[0]
+    return {
+        'region_id': region_id,
+        'type': asset_type,
+        'data_center_id': data_center_id,
+        'model_id': model_id,
+        'status': status,
+    }
+
+
+@nested_commit_on_success
+def _adjust(key, delta):
+    rows = AssetCountRollup.admin_objects.filter(**key)
+    if rows.update(count=F('count') + delta) or delta < 0:
+        return
+    # NULLs (data center, status) never collide in the unique index, so
+    # creating rows is serialised by locking the asset model of the key
+    list(AssetModel.objects.select_for_update().filter(
+        pk=key['model_id'],
+    ).values_list('pk', flat=True))
+    if not rows.update(count=F('count') + delta):
+        AssetCountRollup.admin_objects.create(count=delta, **key)
+
+
+def remember_state(asset):
+    """Store state of freshly loaded *asset* for later rollup updates."""
+    if asset.pk:
+        setattr(asset, STATE_ATTR, _get_state(asset))
+
+
+def update_rollup(asset, created=False, deleted=False):
+    """Move *asset* between rollup rows after it was saved or deleted."""
+    if not _is_counted(asset):
+        return
+    old_state = None if created else getattr(asset, STATE_ATTR, None)
+    new_state = None if deleted else _get_state(asset)
+    if old_state == new_state:
+        return
+    if old_state:
+        _adjust(_get_key(old_state), -1)
+    if new_state:
+        _adjust(_get_key(new_state), 1)
+        setattr(asset, STATE_ATTR, new_state)
+
+
+@nested_commit_on_success
+def rebuild_rollup():
+    """Recount all rows of the rollup."""
+    AssetCountRollup.admin_objects.all().delete()
+    counts = Asset._base_manager.values(
+        'region', 'type', 'model', 'status', 'dcasset__rack__data_center',
+    ).annotate(num=Count('pk')).order_by()
+    rows = [
+        AssetCountRollup(
+            region_id=item['region'],
+            type=item['type'],
+            data_center_id=item['dcasset__rack__data_center'],
+            model_id=item['model'],
+            status=item['status'],
+            count=item['num'],
+        ) for item in counts
+    ]
+    AssetCountRollup.admin_objects.bulk_create(rows)
+    return len(rows)
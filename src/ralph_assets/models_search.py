@@ -0,0 +1,228 @@
+# -*- coding: utf-8 -*-
+
+"""Trigram index for substring searches over assets.
+
+``LIKE '%term%'`` can not use a B-tree index, so for every indexed text
+column of an asset all its lowercase trigrams are stored in
+:class:`AssetSearchTrigram`. A substring search first finds assets having
+all trigrams of the term (an indexed lookup) and runs ``icontains`` only on
+these candidates.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import difflib
+import hashlib
+import operator
+
+from django.core.cache import cache
+from django.db import models
+from django.db.models import Count, Q
+from django.utils.translation import ugettext_lazy as _
+from lck.django.common import nested_commit_on_success
+
+from ralph_assets.count_cache import get_generation, get_region_ids
+from ralph_assets.models_assets import (
+    Asset,
+    AssetModel,
+    BOAsset,
+    DCAsset,
+    VirtualAsset,
+)
+
+
+TRIGRAM_LENGTH = 3
+
+# instances of every concrete asset class are indexed
+INDEXED_MODELS = (Asset, DCAsset, BOAsset, VirtualAsset)
+INDEXED_FIELDS = (
+    'barcode', 'hostname', 'niw', 'purchase_order', 'remarks', 'sn',
+)
+# asset attribute keeping indexed values as they were loaded or indexed
+INDEXED_STATE_ATTR = '_search_index_state'
+
+
+def get_trigrams(value):
+    """Set of lowercase trigrams of *value*."""
+    value = (value or '').lower()
+    return {
+        value[i:i + TRIGRAM_LENGTH]
+        for i in xrange(len(value) - TRIGRAM_LENGTH + 1)
+    }
+
+
+class AssetSearchTrigram(models.Model):
+    asset = models.ForeignKey(Asset, related_name='search_trigrams')
+    field = models.CharField(max_length=32)
+    trigram = models.CharField(max_length=TRIGRAM_LENGTH)
+
+    class Meta:
+        app_label = 'ralph_assets'
+        verbose_name = _("asset search trigram")
+        # the unique index starts with ``trigram`` so searches can use it
+        unique_together = ('trigram', 'field', 'asset')
+
+
+def _asset_trigrams(asset):
+    for field in INDEXED_FIELDS:
+        for trigram in get_trigrams(getattr(asset, field)):
+            yield AssetSearchTrigram(
+                asset_id=asset.pk, field=field, trigram=trigram,
+            )
+
+
+@nested_commit_on_success
+def update_search_index(assets):
+    """Replace trigrams of *assets* with their current values."""
+    assets = list(assets)
+    AssetSearchTrigram.objects.filter(
+        asset__in=[asset.pk for asset in assets],
+    ).delete()
+    AssetSearchTrigram.objects.bulk_create([
+        trigram for asset in assets for trigram in _asset_trigrams(asset)
+    ])
+
+
+def _get_indexed_values(asset):
+    """Indexed values of *asset* (None if some of them are deferred)."""
+    if any(field not in asset.__dict__ for field in INDEXED_FIELDS):
+        return None
+    return tuple(asset.__dict__[field] for field in INDEXED_FIELDS)
+
+
+def remember_indexed_values(asset):
+    """Store indexed values of freshly loaded *asset*, so saves which don't
+    change them skip the reindex."""
+    if asset.pk:
+        setattr(asset, INDEXED_STATE_ATTR, _get_indexed_values(asset))
+
+
+def update_asset_search_index(asset, created=False):
+    """Reindex saved *asset* if its indexed values changed."""
+    values = _get_indexed_values(asset)
+    if (
+        not created and values is not None and
+        getattr(asset, INDEXED_STATE_ATTR, None) == values
+    ):
+        return
+    update_search_index([asset])
+    setattr(asset, INDEXED_STATE_ATTR, values)
+
+
+def search_index_q(field, term, contains='icontains'):
+    """``Q`` matching assets whose *field* contains *term*, narrowed by the
+    trigram index when possible.
+
+    :param contains: substring lookup checked on the candidates
+    """
+    contains_q = Q(**{'{}__{}'.format(field, contains): term})
+    trigrams = get_trigrams(term)
+    if field not in INDEXED_FIELDS or not trigrams:
+        return contains_q
+    # a subquery, so nothing is fetched until the search itself runs
+    candidates = AssetSearchTrigram.objects.filter(
+        field=field, trigram__in=sorted(trigrams),
+    ).values('asset').annotate(
+        matched=Count('trigram'),
+    ).filter(
+        matched=len(trigrams),
+    ).values('asset')
+    return Q(pk__in=candidates) & contains_q
+
+
+def model_name_q(term, lookup='model__name'):
+    """Asset ``Q`` for a substring of a model (or manufacturer) name.
+
+    Models are few, so their ids are resolved first and assets are matched
+    with the indexed ``model_id`` column.
+    """
+    model_lookup = lookup.split('__', 1)[1]
+    model_ids = AssetModel.objects.filter(**{
+        '{}__icontains'.format(model_lookup): term,
+    }).values_list('pk', flat=True)
+    return Q(model__in=list(model_ids))
+
+
+FUZZY_FIELDS = ('barcode', 'sn')
+# number of assets ranked by ``difflib`` for one lookup
+FUZZY_CANDIDATES = 300
+FUZZY_MODELS = 5
+FUZZY_CACHE_TIMEOUT = 300
+
+
+def _normalize(value):
+    return (value or '').replace(' ', '').lower()
+
+
+def _similar_model_ids(trigrams):
+    """Ids of models whose names share the most trigrams with the term."""
+    names = AssetModel.objects.filter(
+        reduce(operator.or_, (Q(name__icontains=t) for t in trigrams)),
+    ).values_list('id', 'name')
+    scored = sorted(
+        (len(trigrams & get_trigrams(_normalize(name))), id)
+        for id, name in names
+    )
+    return [id for score, id in reversed(scored[-FUZZY_MODELS:])]
+
+
+def _fuzzy_candidates(term):
+    """Assets to rank: the best trigram matches and assets of similar
+    models, fetched as two separately limited lists (so assets of a popular
+    model can't push out the best matches)."""
+    assets = Asset.objects.select_related('model')
+    trigrams = get_trigrams(term)
+    if not trigrams:
+        return list(assets.filter(
+            Q(sn__istartswith=term) | Q(barcode__istartswith=term),
+        )[:FUZZY_CANDIDATES])
+    rows = AssetSearchTrigram.objects.filter(
+        field__in=FUZZY_FIELDS, trigram__in=trigrams,
+    ).values('asset').annotate(
+        shared=Count('trigram'),
+    ).order_by('-shared')[:FUZZY_CANDIDATES]
+    candidates = dict(
+        (asset.pk, asset)
+        for asset in assets.filter(pk__in=[row['asset'] for row in rows])
+    )
+    for asset in assets.filter(
+        model__in=_similar_model_ids(trigrams),
+    )[:FUZZY_CANDIDATES]:
+        candidates.setdefault(asset.pk, asset)
+    return candidates.values()
+
+
+def _similarity(asset, term):
+    seq = _normalize(''.join(
+        part or '' for part in (asset.sn, asset.barcode, asset.model.name)
+    ))
+    return difflib.SequenceMatcher(None, seq, term).ratio()
+
+
+def find_similar_assets(query, limit=10):
+    """Assets most similar to *query* (by serial number, barcode and model
+    name), best matches first.
+
+    Candidates come from the trigram index; only they are ranked with
+    ``difflib``. Results are cached per query until any asset changes.
+    """
+    term = _normalize(query)
+    if not term:
+        return []
+    key = 'ralph_assets:fuzzy_lookup:{}:{}'.format(
+        get_generation(),
+        hashlib.sha1(repr((get_region_ids(), limit, term))).hexdigest(),
+    )
+    ids = cache.get(key)
+    if ids is None:
+        candidates = _fuzzy_candidates(term)
+        ranked = sorted(
+            candidates, key=lambda asset: -_similarity(asset, term),
+        )
+        ids = [asset.pk for asset in ranked[:limit]]
+        cache.set(key, ids, FUZZY_CACHE_TIMEOUT)
+    assets = Asset.objects.in_bulk(ids)
+    return [assets[id] for id in ids if id in assets]
@@ -6,10 +6,27 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 
-from django.db.models.signals import post_save
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_init,
+    post_save,
+)
 from django.dispatch import receiver
 
-from ralph_assets.models import Asset
+from ralph_assets.count_cache import bump_generation
+from ralph_assets.licences.models import LicenceAsset, LicenceUser
+from ralph_assets.models import Asset, AssetTombstone, Licence, Support
+from ralph_assets.models_rollup import (
+    ROLLUP_MODELS,
+    remember_state,
+    update_rollup,
+)
+from ralph_assets.models_search import (
+    INDEXED_MODELS,
+    remember_indexed_values,
+    update_asset_search_index,
+)
 
 
 SAVE_PRIORITY = 215
@@ -118,3 +135,92 @@ SAVE_PRIORITY = 215
 # )
 # def asset_device_info_post_save(sender, instance, **kwargs):
 #     update_core_localization(asset_dev_info=instance)
+
+
+# models (and m2m through tables) whose changes make cached search counts
+# stale; bookkeeping models (imports, rollups, search index) are left out
+SEARCH_COUNT_MODELS = INDEXED_MODELS + (
+    Licence, LicenceAsset, LicenceUser, Support,
+)
+SEARCH_COUNT_M2M = (Support.assets.through,)
+
+
+def invalidate_search_counts(sender, **kwargs):
+    bump_generation()
+
+
+def _invalidate_search_counts_m2m(sender, action, **kwargs):
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        bump_generation()
+
+
+def _search_index_post_init(sender, instance, **kwargs):
+    remember_indexed_values(instance)
+
+
+def _search_index_post_save(sender, instance, created, **kwargs):
+    update_asset_search_index(instance, created=created)
+
+
+@receiver(post_delete, sender=Asset, dispatch_uid='assets.tombstone')
+def remember_deleted_asset(sender, instance, **kwargs):
+    AssetTombstone.objects.create(asset_id=instance.id)
+
+
+def _rollup_post_init(sender, instance, **kwargs):
+    remember_state(instance)
+
+
+def _rollup_post_save(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        update_rollup(instance, created=created)
+
+
+def _rollup_post_delete(sender, instance, **kwargs):
+    update_rollup(instance, deleted=True)
+
+
+for model in ROLLUP_MODELS:
+    name = model._meta.module_name
+    post_init.connect(
+        _rollup_post_init, sender=model,
+        dispatch_uid='assets.{}.rollup.post_init'.format(name),
+    )
+    post_save.connect(
+        _rollup_post_save, sender=model,
+        dispatch_uid='assets.{}.rollup.post_save'.format(name),
+    )
+    post_delete.connect(
+        _rollup_post_delete, sender=model,
+        dispatch_uid='assets.{}.rollup.post_delete'.format(name),
+    )
+
+for model in INDEXED_MODELS:
+    name = model._meta.module_name
+    post_init.connect(
+        _search_index_post_init, sender=model,
+        dispatch_uid='assets.{}.search_index.post_init'.format(name),
+    )
+    post_save.connect(
+        _search_index_post_save, sender=model,
+        dispatch_uid='assets.{}.search_index.post_save'.format(name),
+    )
+
+for model in SEARCH_COUNT_MODELS:
+    name = model._meta.module_name
+    post_save.connect(
+        invalidate_search_counts, sender=model,
+        dispatch_uid='assets.{}.search_count.post_save'.format(name),
+    )
+    post_delete.connect(
+        invalidate_search_counts, sender=model,
+        dispatch_uid='assets.{}.search_count.post_delete'.format(name),
+    )
+
+for through in SEARCH_COUNT_M2M:
+    m2m_changed.connect(
+        _invalidate_search_counts_m2m, sender=through,
+        dispatch_uid='assets.{}.search_count.m2m_changed'.format(
+            through._meta.module_name,
+        ),
+    )
@@ -5,8 +5,17 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import hashlib
+import os
+from collections import defaultdict
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.utils.encoding import smart_str
 
+from ralph_assets.count_cache import get_generation, get_region_ids
+from ralph_assets.csv_export import get_export_path, iter_chunks, write_csv
 from ralph_assets.models import Asset, Licence
 from ralph_assets.models_assets import MODE2ASSET_TYPE
 
@@ -60,6 +69,14 @@ LICENCES_USERS_COLUMNS = [
 ]
 
 
+def _group_by_licence(queryset, licence_field, columns):
+    """Map licence id -> list of *columns* values of related objects."""
+    grouped = defaultdict(list)
+    for item in queryset.values(licence_field, *columns):
+        grouped[item[licence_field]].append(item)
+    return grouped
+
+
 def get_licences_rows(filter_type='all', only_assigned=False):
     if filter_type == 'all':
         queryset = Licence.objects.all()
@@ -67,6 +84,7 @@ def get_licences_rows(filter_type='all', only_assigned=False):
         queryset = Licence.objects.filter(
             asset_type=MODE2ASSET_TYPE[filter_type]
         )
+    queryset = queryset.select_related('software_category')
     yield (
         LICENCES_COLUMNS +
         LICENCES_ASSETS_COLUMNS +
@@ -76,37 +94,60 @@ def get_licences_rows(filter_type='all', only_assigned=False):
 
     fill_empty_assets = [''] * len(LICENCES_ASSETS_COLUMNS)
     fill_empty_licences = [''] * len(LICENCES_USERS_COLUMNS)
-    for licence in queryset:
-        row = []
-        row = [str(getattr(licence, column)) for column in LICENCES_COLUMNS]
-        base_row = row
-
-        row = row + fill_empty_assets + fill_empty_licences
-        if only_assigned:
-            if not(licence.assets.exists() or licence.users.exists()):
-                yield row
-        else:
-            yield row
-        if licence.number_bought > 0 and licence.price:
-            single_licence_cost = str(licence.price / licence.number_bought)
-        else:
-            single_licence_cost = ''
-        for asset in licence.assets.all().values(*LICENCES_ASSETS_COLUMNS):
-            row = []
-            row = [
-                smart_str(
-                    asset.get(column),
-                ) for column in LICENCES_ASSETS_COLUMNS
-            ]
-            yield base_row + row + fill_empty_assets + fill_empty_licences
-        for user in licence.users.all().values(*LICENCES_USERS_COLUMNS):
-            row = []
+    for licences in iter_chunks(queryset):
+        # assigned assets and users of the whole chunk are fetched at once
+        ids = [licence.id for licence in licences]
+        assets = _group_by_licence(
+            Asset.objects.filter(
+                licenceasset__licence__in=ids,
+            ).order_by('licenceasset__id'),
+            'licenceasset__licence',
+            LICENCES_ASSETS_COLUMNS,
+        )
+        users = _group_by_licence(
+            User.objects.filter(
+                licences__licence__in=ids,
+            ).order_by('licences__id'),
+            'licences__licence',
+            LICENCES_USERS_COLUMNS,
+        )
+        for licence in licences:
             row = [
-                smart_str(
-                    user.get(column),
-                ) for column in LICENCES_USERS_COLUMNS
+                str(getattr(licence, column)) for column in LICENCES_COLUMNS
             ]
-            yield base_row + fill_empty_assets + row + [single_licence_cost]
+            base_row = row
+
+            row = row + fill_empty_assets + fill_empty_licences
+            if only_assigned:
+                if not (assets[licence.id] or users[licence.id]):
+                    yield row
+            else:
+                yield row
+            if licence.number_bought > 0 and licence.price:
+                single_licence_cost = str(
+                    licence.price / licence.number_bought
+                )
+            else:
+                single_licence_cost = ''
+            for asset in assets[licence.id]:
+                row = [
+                    smart_str(
+                        asset.get(column),
+                    ) for column in LICENCES_ASSETS_COLUMNS
+                ]
+                yield (
+                    base_row + row + fill_empty_assets + fill_empty_licences
+                )
+            for user in users[licence.id]:
+                row = [
+                    smart_str(
+                        user.get(column),
+                    ) for column in LICENCES_USERS_COLUMNS
+                ]
+                yield (
+                    base_row + fill_empty_assets + row +
+                    [single_licence_cost]
+                )
 
 
 def get_assets_rows(filter_type='all'):
@@ -117,7 +158,53 @@ def get_assets_rows(filter_type='all'):
             type=MODE2ASSET_TYPE[filter_type]
         ).values(*ASSETS_COLUMNS)
     yield ASSETS_COLUMNS
-    for asset in queryset:
-        row = []
-        row = [asset.get(column) for column in ASSETS_COLUMNS]
-        yield row
+    for assets in iter_chunks(queryset):
+        for asset in assets:
+            yield [asset.get(column) for column in ASSETS_COLUMNS]
+
+
+RELATIONS_EXPORT_TIMEOUT = 60 * 60
+
+
+def get_relations_rows(
+    report, filter_type='all', only_assigned_licences=False,
+):
+    """Rows of the ``'assets'`` or ``'licences'`` relations report."""
+    if report == 'assets':
+        return get_assets_rows(filter_type)
+    return get_licences_rows(filter_type, only_assigned_licences)
+
+
+def export_relations(report, filter_type='all', only_assigned_licences=False):
+    """Write relations report into a CSV file and return its path.
+
+    The file is reused until any asset, licence or assignment changes (and
+    at most for ``RELATIONS_EXPORT_TIMEOUT`` seconds). Writing a new one
+    removes the previous file of the same parameters.
+    """
+    params = hashlib.sha1(repr((
+        report, filter_type, only_assigned_licences, get_region_ids(),
+    ))).hexdigest()
+    key = 'ralph_assets:relations_export:{}:{}'.format(
+        get_generation(), params,
+    )
+    path = cache.get(key)
+    if path and os.path.exists(path):
+        return path
+    path = write_csv(
+        get_relations_rows(report, filter_type, only_assigned_licences),
+        get_export_path('{}_relations.csv'.format(report)),
+    )
+    cache.set(key, path, RELATIONS_EXPORT_TIMEOUT)
+    # the latest file outlives the generation in the key; older ones are
+    # removed by ``remove_old_exports`` anyway
+    latest_key = 'ralph_assets:relations_export:latest:{}'.format(params)
+    previous = cache.get(latest_key)
+    cache.set(latest_key, path, settings.ASSETS_EXPORTS['MAX_AGE'])
+    if previous and previous != path:
+        try:
+            os.remove(previous)
+        except OSError:
+            # already removed
+            pass
+    return path
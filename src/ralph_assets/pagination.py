@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+
+"""Keyset (seek) pagination for big querysets.
+
+Instead of ``OFFSET n`` every page is fetched with a ``WHERE`` condition
+continuing after the last row of the previous page, so page 500 costs the
+same as page 1. Position is passed between requests as an opaque cursor.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import base64
+import datetime
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+
+NEXT = 'n'
+PREVIOUS = 'p'
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class CursorEncoder(DjangoJSONEncoder):
+    """Keeps microseconds of datetimes, so seeking by them is exact."""
+
+    def default(self, o):
+        if isinstance(o, datetime.datetime):
+            return o.isoformat()
+        return super(CursorEncoder, self).default(o)
+
+
+def encode_cursor(data):
+    return base64.urlsafe_b64encode(
+        json.dumps(data, cls=CursorEncoder, separators=(',', ':'))
+    ).rstrip('=')
+
+
+def decode_cursor(token):
+    try:
+        padding = '=' * (-len(token) % 4)
+        data = json.loads(base64.urlsafe_b64decode(str(token + padding)))
+    except (TypeError, ValueError, UnicodeEncodeError):
+        raise InvalidCursor(token)
+    if not isinstance(data, dict) or not {'o', 'v', 'd'} <= set(data):
+        raise InvalidCursor(token)
+    return data
+
+
+def capped_count(queryset, limit):
+    """Count rows of *queryset*, but stop counting after *limit* rows.
+
+    :returns: tuple ``(count, capped)``; ``capped`` is True when there are
+        more rows than *limit* (then ``count == limit``)
+    """
+    found = len(queryset.values_list('pk', flat=True).order_by()[:limit + 1])
+    if found > limit:
+        return limit, True
+    return found, False
+
+
+def _get_value(obj, path):
+    for attr in path.split('__'):
+        if obj is None:
+            return None
+        obj = getattr(obj, attr)
+    if hasattr(obj, '_meta'):
+        return obj.pk
+    return obj
+
+
+def _seek_q(field, value, pk, forward_asc):
+    """Rows placed after (*value*, *pk*) in ``field, pk`` ordering.
+
+    NULLs are treated as smaller than any value (MySQL ordering).
+    """
+    if forward_asc:
+        if value is None:
+            return Q(**{field + '__isnull': False}) | Q(**{
+                field + '__isnull': True, 'pk__gt': pk,
+            })
+        return Q(**{field + '__gt': value}) | Q(**{field: value, 'pk__gt': pk})
+    if value is None:
+        return Q(**{field + '__isnull': True, 'pk__lt': pk})
+    return (
+        Q(**{field + '__lt': value}) |
+        Q(**{field: value, 'pk__lt': pk}) |
+        Q(**{field + '__isnull': True})
+    )
+
+
+class KeysetPage(object):
+    """Page of results, a minimal ``django.core.paginator.Page`` look-alike."""
+
+    def __init__(self, object_list, paginator, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+
+class KeysetPaginator(object):
+    """Paginate *queryset* ordered by *order_by* (e.g. ``'-barcode'``) and
+    ``pk`` as a tie breaker.
+
+    :param order_by: ordering expression or None to order only by ``pk``
+    """
+
+    def __init__(self, queryset, per_page, order_by=None):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.order_by = order_by or 'pk'
+        self.descending = self.order_by.startswith('-')
+        self.field = self.order_by.lstrip('-')
+
+    def _ordering(self, reverse=False):
+        descending = self.descending != reverse
+        prefix = '-' if descending else ''
+        if self.field == 'pk':
+            return [prefix + 'pk']
+        return [prefix + self.field, prefix + 'pk']
+
+    def _make_cursor(self, obj, direction):
+        value = None if self.field == 'pk' else _get_value(obj, self.field)
+        return encode_cursor({
+            'o': self.order_by,
+            'v': [value, obj.pk],
+            'd': direction,
+        })
+
+    def _seek(self, queryset, value, pk, reverse):
+        forward_asc = self.descending == reverse
+        if self.field == 'pk':
+            return queryset.filter(
+                **{'pk__gt' if forward_asc else 'pk__lt': pk}
+            )
+        return queryset.filter(_seek_q(self.field, value, pk, forward_asc))
+
+    def page(self, cursor=None):
+        """Returns :class:`KeysetPage` for *cursor* (first page if None).
+
+        Cursors built for different ordering are ignored.
+        """
+        data = None
+        if cursor:
+            try:
+                data = decode_cursor(cursor)
+            except InvalidCursor:
+                data = None
+            if data and data['o'] != self.order_by:
+                data = None
+        backwards = bool(data) and data['d'] == PREVIOUS
+        queryset = self.queryset.order_by(*self._ordering(reverse=backwards))
+        if data:
+            value, pk = data['v']
+            queryset = self._seek(queryset, value, pk, reverse=backwards)
+        rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if backwards:
+            rows.reverse()
+            has_previous, has_next = has_more, True
+        else:
+            has_previous, has_next = bool(data), has_more
+        next_cursor = previous_cursor = None
+        if rows and has_next:
+            next_cursor = self._make_cursor(rows[-1], NEXT)
+        if rows and has_previous:
+            previous_cursor = self._make_cursor(rows[0], PREVIOUS)
+        return KeysetPage(rows, self, next_cursor, previous_cursor)
@@ -0,0 +1,312 @@
+# -*- coding: utf-8 -*-
+
+"""Declarative search query compiler for asset searches.
+
+Every searchable field is described once (at import time) by a *kind* which
+knows how to turn a raw GET value into a ``Q`` object. The compiler walks the
+spec in one pass and returns a single ``Q`` for the whole request.
+"""
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import re
+
+from django.db.models import Q
+
+from ralph_assets.models_search import model_name_q, search_index_q
+
+
+QUOTATION_MARKS = re.compile(r"^\".+\"$")
+SEARCH_DELIMITERS = re.compile(r";|\|")
+
+
+def _any_of(queries):
+    """OR given queries together, ``None`` if there are none."""
+    result = None
+    for q in queries:
+        result = q if result is None else result | q
+    return result
+
+
+class SearchValue(object):
+    """Raw search term with exact/multi flags resolved once."""
+
+    def __init__(self, raw, allow_multi=False):
+        self.exact = False
+        self.multi = False
+        self.value = raw
+        if QUOTATION_MARKS.search(raw):
+            # if search term is enclosed in "", we want exact matches
+            self.exact = True
+            self.value = raw[1:-1]
+        elif allow_multi and SEARCH_DELIMITERS.search(raw):
+            self.multi = True
+
+    @property
+    def values(self):
+        """Non-empty terms of a multi value search."""
+        return [
+            value.strip() for value in SEARCH_DELIMITERS.split(self.value)
+            if value.strip()
+        ]
+
+
+class SearchKind(object):
+    """Base class of all search field kinds."""
+    allow_multi = False
+
+    def to_q(self, term):
+        raise NotImplementedError()
+
+
+class Lookup(SearchKind):
+    """Apply a single lookup with the term as is."""
+
+    def __init__(self, lookup):
+        self.lookup = lookup
+
+    def to_q(self, term):
+        return Q(**{self.lookup: term.value})
+
+
+class Text(SearchKind):
+    """Exact match for quoted terms, substring match otherwise.
+
+    :param contains: substring lookup used for unquoted terms
+    :param multi: if True, terms separated by ``;`` or ``|`` are OR-ed
+    """
+
+    def __init__(self, lookup, contains='icontains', multi=False):
+        self.lookup = lookup
+        self.contains = contains
+        self.allow_multi = multi
+
+    def to_q(self, term):
+        if term.exact:
+            return Q(**{self.lookup: term.value})
+        if term.multi:
+            return _any_of(
+                Q(**{self.lookup: value}) for value in term.values
+            )
+        return self.contains_q(term.value)
+
+    def contains_q(self, value):
+        return Q(**{'{}__{}'.format(self.lookup, self.contains): value})
+
+
+class IndexedText(Text):
+    """Text of an asset column covered by the trigram search index."""
+
+    def contains_q(self, value):
+        return search_index_q(self.lookup, value, contains=self.contains)
+
+
+class ModelNameText(Text):
+    """Text matched against asset model (or manufacturer) names."""
+
+    def contains_q(self, value):
+        return model_name_q(value, lookup=self.lookup)
+
+
+class Enum(SearchKind):
+    """Map a fixed set of values to prepared queries; ignore the rest."""
+
+    def __init__(self, mapping):
+        self.mapping = mapping
+
+    def to_q(self, term):
+        return self.mapping.get(term.value)
+
+
+class Flag(SearchKind):
+    """Apply ``query`` when checkbox is set to ``on``."""
+
+    def __init__(self, query):
+        self.query = query
+
+    def to_q(self, term):
+        if term.value.lower() == 'on':
+            return self.query
+
+
+class Choice(SearchKind):
+    """Compare ``lookup`` with ``value == true_value``."""
+
+    def __init__(self, lookup, true_value):
+        self.lookup = lookup
+        self.true_value = true_value
+
+    def to_q(self, term):
+        return Q(**{self.lookup: term.value == self.true_value})
+
+
+class IdList(SearchKind):
+    """Comma separated list of ids."""
+
+    def __init__(self, lookup):
+        self.lookup = lookup
+
+    def to_q(self, term):
+        return Q(**{
+            '{}__in'.format(self.lookup): [
+                int(id) for id in term.value.split(',')
+            ],
+        })
+
+
+class AnyOf(SearchKind):
+    """Equality against any of the given lookups."""
+
+    def __init__(self, *lookups):
+        self.lookups = lookups
+
+    def to_q(self, term):
+        return _any_of(Q(**{lookup: term.value}) for lookup in self.lookups)
+
+
+class Hook(SearchKind):
+    """Delegate to the view method ``method_name(value)``."""
+
+    def __init__(self, method_name):
+        self.method_name = method_name
+
+    def to_q(self, term, view=None):
+        return getattr(view, self.method_name)(term.value)
+
+
+class DateRange(SearchKind):
+    """Date range read from ``<field>_from`` and ``<field>_to``."""
+
+    def __init__(self, lookup):
+        self.lookup = lookup
+
+    def range_to_q(self, start, end):
+        q = Q()
+        if start:
+            q &= Q(**{self.lookup + '__gte': start})
+        if end:
+            q &= Q(**{self.lookup + '__lte': end})
+        return q
+
+
+_empty_location = (
+    Q(device_info__data_center=None) |
+    Q(device_info__server_room=None) |
+    Q(device_info__rack=None) |
+    Q(device_info__position=None) |
+    Q(device_info__orientation=None)
+)
+
+ASSET_SEARCH_SPEC = {
+    'barcode': IndexedText('barcode', contains='contains', multi=True),
+    'budget_info': Text('budget_info__name'),
+    'category': Hook('get_search_category_part'),
+    'company': Lookup('owner__profile__company__icontains'),
+    'cost_center': Lookup('owner__profile__cost_center'),
+    'deleted': Flag(Q(deleted__in=(True, False))),
+    'department': Lookup('owner__profile__department__icontains'),
+    'deprecation_rate': Enum({
+        'null': Q(deprecation_rate__isnull=True),
+        'deprecated': Q(deprecation_rate=0),
+        '6': Q(deprecation_rate__gt=0, deprecation_rate__lte=6),
+        '12': Q(deprecation_rate__gt=6, deprecation_rate__lte=12),
+        '24': Q(deprecation_rate__gt=12, deprecation_rate__lte=24),
+        '48': Q(deprecation_rate__gt=24, deprecation_rate__lte=48),
+        '48<': Q(deprecation_rate__gt=48),
+    }),
+    'device_environment': Text('device_environment__name'),
+    'device_info': Lookup('device_info'),
+    'employee_id': Lookup('owner__profile__employee_id'),
+    'guardian': Lookup('guardian__id'),
+    'hostname': IndexedText('hostname', contains='contains', multi=True),
+    'id': IdList('id'),
+    'imei': Text('office_info__imei'),
+    'invoice_no': Text('invoice_no'),
+    'location': Lookup('location__icontains'),
+    'location_name': AnyOf(
+        'device_info__rack__name',
+        'device_info__data_center__name',
+        'device_info__server_room__name',
+        'device_info__rack__server_room__name',
+        'device_info__rack__data_center__name',
+    ),
+    'manufacturer': ModelNameText('model__manufacturer__name'),
+    'model': ModelNameText('model__name'),
+    'niw': IndexedText('niw', multi=True),
+    'order_no': Text('order_no'),
+    'owner': Lookup('owner__id'),
+    'part_info': Enum({
+        'device': Q(part_info__isnull=True),
+        'part': Q(part_info__gte=0),
+    }),
+    'profit_center': Lookup('owner__profile__profit_center'),
+    'provider': Text('provider'),
+    'purchase_order': IndexedText('purchase_order', multi=True),
+    'purpose': Lookup('office_info__purpose'),
+    'region': Lookup('region__id'),
+    'remarks': IndexedText('remarks'),
+    'required_support': Choice('required_support', 'yes'),
+    'segment': Lookup('owner__profile__segment__icontains'),
+    'service': Text('service__name'),
+    'service_name': Lookup('service_name'),
+    'sn': IndexedText('sn', multi=True),
+    'source': Lookup('source'),
+    'status': Lookup('status'),
+    'support_assigned': Choice('supports__isnull', 'none'),
+    'task_url': Text('task_url'),
+    'unlinked': Flag(
+        ~Q(device_info=None) & Q(device_info__ralph_device_id=None)
+    ),
+    'user': Lookup('user__id'),
+    'venture_department': Hook('get_search_venture_department_part'),
+    'warehouse': Lookup('warehouse__id'),
+    'without_assigned_location': Flag(
+        # asset without category and location
+        (Q(model__category=None) & Q(_empty_location)) |
+        # blade asset with empty location
+        (
+            Q(model__category__is_blade=True) &
+            Q(_empty_location | Q(device_info__slot_no=None))
+        ) |
+        # not blade asset with empty location
+        (Q(model__category__is_blade=False) & Q(_empty_location))
+    ),
+}
+
+ASSET_SEARCH_DATE_SPEC = {
+    field: DateRange(field) for field in (
+        'invoice_date', 'request_date', 'delivery_date',
+        'production_use_date', 'provider_order_date', 'loan_end_date',
+    )
+}
+
+
+def compile_search_query(
+    params, spec=ASSET_SEARCH_SPEC, date_spec=ASSET_SEARCH_DATE_SPEC,
+    view=None,
+):
+    """Compile *params* (e.g. ``request.GET``) into a single ``Q`` object.
+
+    :param view: object providing methods for :class:`Hook` fields
+    """
+    all_q = Q()
+    for field, kind in spec.iteritems():
+        raw = params.get(field)
+        if not raw:
+            continue
+        term = SearchValue(raw, allow_multi=kind.allow_multi)
+        if isinstance(kind, Hook):
+            q = kind.to_q(term, view=view)
+        else:
+            q = kind.to_q(term)
+        if q:
+            all_q &= q
+    for field, kind in date_spec.iteritems():
+        start = params.get(field + '_from')
+        end = params.get(field + '_to')
+        if start or end:
+            all_q &= kind.range_to_q(start, end)
+    return all_q
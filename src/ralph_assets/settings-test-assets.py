@@ -15,3 +15,9 @@ SOUTH_TESTS_MIGRATE = False
 ASSETS_AUTO_ASSIGN_HOSTNAME = True
 
 STATICFILES_STORAGE = 'django.contrib.staticfiles.storage.StaticFilesStorage'
+
+ASSETS_IMPORT = {
+    'QUEUE': None,
+    'CHUNK_SIZE': 500,
+    'JOB_TIMEOUT': 3600,
+}
@@ -33,6 +33,46 @@ ASSETS_TRANSITIONS = {
 
 ASSET_HIDE_ACTION_SEARCH = False
 
+# asset search grid options:
+#   KEYSET_PAGINATION - page with cursors (prev/next) instead of page numbers,
+#       deep pages are as fast as the first one
+#   COUNT_LIMIT - with keyset pagination, count results only up to this
+#       number (shown as "10000+"); None counts all of them
+#   COUNT_CACHE_TIMEOUT - seconds to cache result counts of searches (they
+#       are also invalidated by any change of assets); 0 disables the cache
+ASSETS_SEARCH = {
+    'KEYSET_PAGINATION': False,
+    'COUNT_LIMIT': 10000,
+    'COUNT_CACHE_TIMEOUT': 300,
+}
+
+# history retention (see the ``archive_history`` command):
+#   ARCHIVE_AFTER_MONTHS - changes older than this are compacted and moved to
+#       the archive table; None disables archiving
+#   KEEP_FIELDS - changes of these fields always stay in the main table
+ASSETS_HISTORY = {
+    'ARCHIVE_AFTER_MONTHS': 12,
+    'KEEP_FIELDS': ('status',),
+}
+
+# spreadsheet imports (run as rq jobs, see ``ralph_assets.importer``):
+#   QUEUE - name of the rq queue; None imports rows in the web request
+#   CHUNK_SIZE - rows imported (and committed) at once; an interrupted import
+#       is resumed after the last committed chunk
+#   JOB_TIMEOUT - seconds after which rq kills the import job
+ASSETS_IMPORT = {
+    'QUEUE': 'reports',
+    'CHUNK_SIZE': 500,
+    'JOB_TIMEOUT': 3600,
+}
+
+# CSV exports written to ASSETS_REPORTS['TEMP_STORAGE_PATH'] (see the
+# ``remove_old_exports`` command):
+#   MAX_AGE - seconds after which exports are removed
+ASSETS_EXPORTS = {
+    'MAX_AGE': 24 * 60 * 60,
+}
+
 # force locale during pdf raport genration
 GENERATED_DOCS_LOCALE = None
 
@@ -0,0 +1,6 @@
+-- History of an object is always read by content type and object id, newest
+-- first (optionally for a single field), see HistoryManager.
+CREATE INDEX ralph_assets_history_object
+    ON ralph_assets_history (content_type_id, object_id, date, id);
+CREATE INDEX ralph_assets_history_object_field
+    ON ralph_assets_history (content_type_id, object_id, field_name, date, id);
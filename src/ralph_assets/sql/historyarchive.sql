@@ -0,0 +1,3 @@
+-- Archived history is read by content type and object id, newest first.
+CREATE INDEX ralph_assets_historyarchive_object
+    ON ralph_assets_historyarchive (content_type_id, object_id, date, id);
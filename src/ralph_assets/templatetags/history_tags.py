@@ -21,7 +21,7 @@ def get_context(obj, history, limit, full_history_button, title,
         'history_for_model_url': History.get_history_url_for_object(obj),
         'history_title': title,
         'limit': limit,
-        'history': history[:limit] if history else None,
+        'history': list(history[:limit]) or None,
         'show_field_name': show_field_name,
     }
 
@@ -34,7 +34,7 @@ def short_history(obj, limit=5, full_history_button=True):
     history = obj.get_history()
     return get_context(
         obj,
-        history.order_by('-date'),
+        history.order_by('-date', '-id'),
         limit,
         full_history_button,
         _('Short history'),
@@ -49,7 +49,7 @@ def status_history(obj, limit=5, full_history_button=True):
     history = obj.get_history(field_name='status')
     return get_context(
         obj,
-        history.order_by('-date'),
+        history.order_by('-date', '-id'),
         limit,
         full_history_button,
         _('Status history'),
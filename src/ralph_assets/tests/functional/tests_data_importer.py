@@ -60,7 +60,7 @@ class TestImport(ClientMixin, TestCase):
         step3_post = {
             'xls_upload_view-current_step': 'confirm',
         }
-        response = self.client.post(self.url, step3_post)
+        response = self.client.post(self.url, step3_post, follow=True)
         self.assertContains(response, 'Import done')
 
     def test_import_csv_asset_back_office_update(self):
@@ -167,7 +167,7 @@ class TestDataImporter(object):
         step3_post = {
             'xls_upload_view-current_step': 'confirm',
         }
-        response = self.client.post(self.url, step3_post)
+        response = self.client.post(self.url, step3_post, follow=True)
         self._check_form_errors(response, step=3)
         self.assertContains(response, 'Import done')
 
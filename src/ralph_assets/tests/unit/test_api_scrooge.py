@@ -105,7 +105,7 @@ class TestApiScrooge(TestCase):
             asset,
             result[0],
             today,
-            asset.device_info.get_ralph_device().name
+            None,
         )
 
     def test_get_assets_without_invoice(self):
@@ -118,7 +118,7 @@ class TestApiScrooge(TestCase):
             asset,
             result[0],
             today,
-            asset.device_info.get_ralph_device().name
+            None,
         )
 
     def test_get_asset_without_hostname(self):
@@ -197,3 +197,20 @@ class TestApiScrooge(TestCase):
         )
         supports = get_supports(date(2013, 11, 12))
         self.assertEqual(len(list(supports)), 1)
+
+    def test_get_supports_assets(self):
+        assets = [DCAssetFactory(), DCAssetFactory()]
+        support = DCSupportFactory(
+            date_from=date(2013, 11, 12),
+            date_to=date(2014, 11, 12)
+        )
+        support.assets.add(*assets)
+        DCSupportFactory(
+            date_from=date(2013, 11, 12),
+            date_to=date(2014, 11, 12)
+        )
+        supports = get_supports(date(2013, 11, 12))
+        self.assertEqual(
+            sorted(item['assets'] for item in supports),
+            [[], [asset.id for asset in assets]],
+        )
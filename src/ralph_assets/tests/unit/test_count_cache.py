@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import mock
+from django.core.cache import get_cache
+from django.db.models import Q
+from django.test import TestCase
+
+from ralph_assets.count_cache import (
+    bump_generation,
+    cached_count,
+    canonical_query,
+)
+from ralph_assets.models_assets import Asset
+from ralph_assets.models_import import ImportTask
+from ralph_assets.tests.utils.assets import BOAssetFactory
+from ralph_assets.tests.utils.supports import BOSupportFactory
+
+
+class TestCanonicalQuery(TestCase):
+
+    def test_children_order_does_not_matter(self):
+        self.assertEqual(
+            canonical_query(Q(sn='a') & Q(barcode__in=['b', 'c'])),
+            canonical_query(Q(barcode__in=['b', 'c']) & Q(sn='a')),
+        )
+
+    def test_different_queries(self):
+        self.assertNotEqual(
+            canonical_query(Q(sn='a') | Q(barcode='b')),
+            canonical_query(Q(sn='a') & Q(barcode='b')),
+        )
+        self.assertNotEqual(
+            canonical_query(Q(sn='a')), canonical_query(~Q(sn='a')),
+        )
+
+
+@mock.patch(
+    'ralph_assets.count_cache.cache',
+    get_cache('django.core.cache.backends.locmem.LocMemCache'),
+)
+@mock.patch('ralph_assets.count_cache.middleware.get_actual_regions')
+class TestCachedCount(TestCase):
+
+    def setUp(self):
+        self.count = mock.Mock(return_value=5)
+
+    def _region(self, id):
+        region = mock.Mock()
+        region.id = id
+        return region
+
+    def test_count_is_cached(self, get_actual_regions):
+        get_actual_regions.return_value = [self._region(1)]
+        for query in (Q(sn='a') & Q(niw='b'), Q(niw='b') & Q(sn='a')):
+            self.assertEqual(cached_count(Asset, query, self.count), 5)
+        self.assertEqual(self.count.call_count, 1)
+
+    def test_regions_are_part_of_key(self, get_actual_regions):
+        get_actual_regions.return_value = [self._region(1)]
+        cached_count(Asset, Q(sn='a'), self.count)
+        get_actual_regions.return_value = [self._region(2)]
+        cached_count(Asset, Q(sn='a'), self.count)
+        self.assertEqual(self.count.call_count, 2)
+
+    def test_bump_generation_invalidates(self, get_actual_regions):
+        get_actual_regions.return_value = []
+        cached_count(Asset, Q(sn='a'), self.count)
+        bump_generation()
+        cached_count(Asset, Q(sn='a'), self.count)
+        self.assertEqual(self.count.call_count, 2)
+
+
+@mock.patch('ralph_assets.models_signals.bump_generation')
+class TestSearchCountsInvalidation(TestCase):
+
+    def test_asset_and_support_changes(self, bump_generation):
+        asset = BOAssetFactory()
+        support = BOSupportFactory()
+        bump_generation.reset_mock()
+        support.assets.add(asset)
+        self.assertTrue(bump_generation.called)
+        bump_generation.reset_mock()
+        asset.delete()
+        self.assertTrue(bump_generation.called)
+
+    def test_bookkeeping_changes(self, bump_generation):
+        ImportTask.objects.create(
+            model_name='ralph_assets.asset', mode='back_office',
+            mappings='{}', rows_path='', total_rows=0,
+        )
+        self.assertFalse(bump_generation.called)
@@ -0,0 +1,122 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import csv
+import os
+import shutil
+import tempfile
+
+import mock
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from ralph_assets.csv_export import (
+    ProgressReporter,
+    get_export_path,
+    iter_chunks,
+    make_csv_file_response,
+    remove_old_exports,
+    write_csv,
+)
+from ralph_assets.models_assets import Warehouse
+from ralph_assets.tests.utils.assets import WarehouseFactory
+
+
+class TestIterChunks(TestCase):
+
+    def test_chunks_cover_whole_queryset(self):
+        warehouses = [WarehouseFactory() for _ in xrange(7)]
+        chunks = list(iter_chunks(Warehouse.objects.all(), chunk_size=3))
+        self.assertEqual([len(chunk) for chunk in chunks], [3, 3, 1])
+        self.assertEqual(
+            [w.id for chunk in chunks for w in chunk],
+            sorted(w.id for w in warehouses),
+        )
+
+    def test_empty_queryset(self):
+        self.assertEqual(list(iter_chunks(Warehouse.objects.none())), [])
+
+
+class TestProgressReporter(TestCase):
+
+    @mock.patch('ralph_assets.csv_export.set_progress')
+    def test_progress_is_throttled(self, set_progress):
+        job = object()
+        progress = ProgressReporter(
+            job, total=100, every_rows=10, every_seconds=3600,
+        )
+        for _ in xrange(25):
+            progress.step()
+        self.assertEqual(
+            [call[0][1] for call in set_progress.call_args_list],
+            [0.1, 0.2],
+        )
+        progress.finish()
+        set_progress.assert_called_with(job, 1)
+
+    @mock.patch('ralph_assets.csv_export.set_progress')
+    def test_without_job(self, set_progress):
+        progress = ProgressReporter(None, total=10, every_rows=1)
+        progress.step(10)
+        progress.finish()
+        self.assertFalse(set_progress.called)
+
+
+class TestWriteCsv(TestCase):
+
+    def test_write_unicode_rows(self):
+        handle, path = tempfile.mkstemp()
+        os.close(handle)
+        try:
+            write_csv(iter([['name', 'id'], ['żółw', 1]]), path)
+            with open(path, 'rb') as csv_file:
+                rows = list(csv.reader(csv_file))
+        finally:
+            os.remove(path)
+        self.assertEqual(rows, [
+            ['name', 'id'],
+            ['żółw'.encode('utf-8'), '1'],
+        ])
+
+    def test_removed_file_is_rebuilt(self):
+        handle, path = tempfile.mkstemp()
+        os.close(handle)
+        os.remove(path)
+
+        def rebuild():
+            return write_csv(iter([['name'], ['x']]), path)
+        try:
+            response = make_csv_file_response(path, 'test.csv', rebuild)
+            content = b''.join(response)
+        finally:
+            os.remove(path)
+        self.assertEqual(content, b'name\r\nx\r\n')
+        self.assertEqual(response['Content-Length'], '9')
+
+
+class TestRemoveOldExports(TestCase):
+
+    def test_only_old_exports_are_removed(self):
+        directory = tempfile.mkdtemp()
+        reports = {'TEMP_STORAGE_PATH': directory}
+        with override_settings(ASSETS_REPORTS=reports):
+            old, new, rows = [
+                get_export_path(name)
+                for name in ('old.csv', 'new.csv', 'import.json')
+            ]
+            for path in (old, new, rows):
+                write_csv([], path)
+            for path in (old, rows):
+                os.utime(path, (0, 0))
+            self.assertEqual(remove_old_exports(max_age=3600), 1)
+        try:
+            self.assertEqual(
+                sorted(os.listdir(directory)),
+                sorted(os.path.basename(path) for path in (new, rows)),
+            )
+        finally:
+            shutil.rmtree(directory)
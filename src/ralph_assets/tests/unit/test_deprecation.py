@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import datetime
+from collections import namedtuple
+from decimal import Decimal
+
+from django.test import TestCase
+
+from ralph_assets.deprecation import get_deprecated_ids, get_deprecation_ends
+
+
+DeprecationData = namedtuple('DeprecationData', [
+    'id', 'invoice_date', 'deprecation_rate', 'deprecation_end_date',
+    'force_deprecation',
+])
+
+
+class TestDeprecation(TestCase):
+
+    def setUp(self):
+        invoice_date = datetime.date(2012, 11, 28)
+        self.assets = [
+            DeprecationData(1, invoice_date, Decimal(100), None, False),
+            DeprecationData(2, invoice_date, Decimal(50), None, False),
+            DeprecationData(3, invoice_date, Decimal(50), None, True),
+            DeprecationData(
+                4, invoice_date, Decimal(50), datetime.date(2014, 12, 15),
+                False,
+            ),
+            DeprecationData(5, None, Decimal(25), None, False),
+        ]
+
+    def test_deprecation_ends(self):
+        self.assertEqual(get_deprecation_ends(self.assets), [
+            datetime.date(2013, 11, 28),
+            datetime.date(2014, 11, 28),
+            None,
+            datetime.date(2014, 12, 15),
+            None,
+        ])
+
+    def test_many_dates(self):
+        dates = [datetime.date(2014, 3, 29), datetime.date(2014, 12, 20)]
+        self.assertEqual(get_deprecated_ids(self.assets, dates), {
+            dates[0]: {1, 3, 5},
+            dates[1]: {1, 2, 3, 4, 5},
+        })
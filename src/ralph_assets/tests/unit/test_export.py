@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import datetime
+
+from django.test import TestCase
+
+from ralph_assets.models_assets import Asset, AssetStatus
+from ralph_assets.models_export import (
+    TOMBSTONE_DELETED,
+    TOMBSTONE_LIQUIDATED,
+    changed_assets_q,
+    get_asset_tombstones,
+)
+from ralph_assets.tests.utils.assets import BOAssetFactory
+
+
+class TestIncrementalExport(TestCase):
+
+    def setUp(self):
+        self.since = datetime.datetime.now()
+        self.old = BOAssetFactory()
+        Asset.objects.filter(pk=self.old.pk).update(
+            modified=self.since - datetime.timedelta(days=1),
+        )
+
+    def test_changed_assets(self):
+        changed = BOAssetFactory()
+        self.assertEqual(
+            list(Asset.objects.filter(changed_assets_q(self.since))),
+            [changed],
+        )
+
+    def test_tombstones(self):
+        liquidated = BOAssetFactory()
+        liquidated.status = AssetStatus.liquidated
+        liquidated.save()
+        deleted_id = self.old.id
+        self.old.delete()
+        self.assertEqual(
+            sorted(
+                (item['asset_id'], item['reason'])
+                for item in get_asset_tombstones(self.since)
+            ),
+            sorted([
+                (deleted_id, TOMBSTONE_DELETED),
+                (liquidated.id, TOMBSTONE_LIQUIDATED),
+            ]),
+        )
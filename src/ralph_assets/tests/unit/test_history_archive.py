@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import datetime
+
+from django.test import TestCase
+
+from ralph_assets.history.archive import apply_retention
+from ralph_assets.history.models import (
+    History,
+    HistoryArchive,
+    get_full_history,
+)
+from ralph_assets.models_assets import AssetStatus
+from ralph_assets.tests.utils.assets import AssetFactory
+from ralph_assets.tests.utils.licences import LicenceFactory
+
+
+class TestHistoryRetention(TestCase):
+
+    def setUp(self):
+        self.asset = AssetFactory()
+        self.asset.sn = 'old-sn'
+        self.asset.status = AssetStatus.liquidated
+        self.asset.save()
+        History.objects.all().update(
+            date=datetime.datetime.now() - datetime.timedelta(days=1000),
+        )
+        self.asset.sn = 'new-sn'
+        self.asset.save()
+
+    def test_old_changes_are_archived(self):
+        self.assertEqual(apply_retention(months=12), (0, 1))
+        self.assertEqual(
+            sorted(History.objects.values_list('field_name', 'new_value')),
+            [('sn', 'new-sn'), ('status', AssetStatus.liquidated.desc)],
+        )
+        self.assertEqual(
+            list(HistoryArchive.objects.values_list(
+                'field_name', 'new_value',
+            )),
+            [('sn', 'old-sn')],
+        )
+        self.assertEqual(
+            [
+                change.new_value
+                for change in get_full_history(self.asset, 'sn')
+            ],
+            ['new-sn', 'old-sn'],
+        )
+        self.assertTrue(
+            self.asset.is_liquidated(datetime.date.today()),
+        )
+
+
+class TestHistoryCompaction(TestCase):
+
+    def test_m2m_snapshots_are_collapsed(self):
+        licence = LicenceFactory()
+        for old, new in (('', '[1]'), ('[1]', '[1, 2]'), ('[1, 2]', '[2]')):
+            History.objects.log_changes(licence, None, [{
+                'field': 'assets', 'old': old, 'new': new,
+            }])
+        changes = History.objects.filter(field_name='assets')
+        changes.update(
+            date=datetime.datetime.now() - datetime.timedelta(days=1000),
+        )
+        newest_id = max(changes.values_list('id', flat=True))
+        self.assertEqual(apply_retention(months=12), (2, 0))
+        self.assertEqual(
+            list(changes.values_list('id', 'old_value', 'new_value')),
+            [(newest_id, '-', '[2]')],
+        )
+        self.assertFalse(HistoryArchive.objects.exists())
@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import os
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase
+
+from ralph_assets.forms_import import ImportRow, SpreadsheetReader
+from ralph_assets.importer import (
+    AssetModelResolver,
+    ImportEngine,
+    ImportValidator,
+    RelatedValueResolver,
+    resume_import_task,
+    run_import_task,
+    save_rows,
+)
+from ralph_assets.models_assets import (
+    Asset,
+    AssetCategory,
+    AssetModel,
+    AssetType,
+    Warehouse,
+)
+from ralph_assets.models_import import ImportStatus, ImportTask
+from ralph_assets.tests.utils.assets import (
+    AssetCategoryFactory,
+    AssetModelFactory,
+    WarehouseFactory,
+)
+from ralph_assets.tests.utils.licences import LicenceFactory
+
+
+class TestRelatedValueResolver(TestCase):
+
+    def setUp(self):
+        self.resolver = RelatedValueResolver(AssetType.back_office)
+        self.field = Asset._meta.get_field('warehouse')
+
+    def test_preloaded_values_are_resolved_without_queries(self):
+        first = WarehouseFactory(name='Warehouse A')
+        second = WarehouseFactory(name='Warehouse B')
+        with self.assertNumQueries(1):
+            self.resolver.preload(
+                Warehouse, ['warehouse a', 'WAREHOUSE B', 'Warehouse C'],
+            )
+        with self.assertNumQueries(0):
+            self.assertEqual(
+                self.resolver.resolve(self.field, 'WareHouse A'), first,
+            )
+            self.assertEqual(
+                self.resolver.resolve(self.field, 'warehouse b'), second,
+            )
+
+    def test_missing_value_is_created_once(self):
+        self.resolver.preload(Warehouse, ['New warehouse'])
+        created = self.resolver.resolve(self.field, 'New warehouse')
+        self.assertEqual(
+            self.resolver.resolve(self.field, 'new WAREHOUSE'), created,
+        )
+        self.assertEqual(Warehouse.objects.filter(pk=created.pk).count(), 1)
+
+
+class TestAssetModelResolver(TestCase):
+
+    def setUp(self):
+        self.resolver = AssetModelResolver('back_office')
+        self.category = AssetCategoryFactory(name='Laptops')
+
+    def test_model_is_created_once(self):
+        self.resolver.preload([
+            ('ThinkPad', 'Laptops', 'Lenovo'),
+            ('thinkpad', 'LAPTOPS', 'lenovo'),
+        ])
+        with self.assertNumQueries(0):
+            model = self.resolver.get_model('ThinkPad', 'Laptops', 'Lenovo')
+            self.assertEqual(
+                self.resolver.get_model('thinkpad', 'LAPTOPS', 'lenovo'),
+                model,
+            )
+        self.assertEqual(model.category, self.category)
+        self.assertEqual(model.manufacturer.name, 'Lenovo')
+        self.assertEqual(AssetModel.objects.filter(name='ThinkPad').count(), 1)
+
+    def test_missing_category(self):
+        with self.assertRaises(AssetCategory.DoesNotExist):
+            self.resolver.get_model('ThinkPad', 'Tablets', 'Lenovo')
+        self.assertFalse(AssetModel.objects.filter(name='ThinkPad').exists())
+
+
+class TestImportTask(TestCase):
+
+    def test_resumed_task_skips_committed_rows(self):
+        missing_ids = [10 ** 6 + i for i in range(3)]
+        path, count = save_rows(
+            ImportRow('csv', None, object_id, {'barcode': 'X'})
+            for object_id in missing_ids
+        )
+        task = ImportTask.objects.create(
+            model_name='ralph_assets.asset',
+            mode='back_office',
+            mappings='{"barcode": "barcode"}',
+            rows_path=path,
+            total_rows=count,
+            processed_rows=1,
+        )
+        run_import_task(task.id)
+        task = ImportTask.objects.get(pk=task.pk)
+        self.assertEqual(task.status, ImportStatus.finished.id)
+        self.assertEqual(task.processed_rows, 3)
+        self.assertEqual(
+            sorted(task.row_errors.values_list('object_id', flat=True)),
+            missing_ids[1:],
+        )
+
+    def test_failed_task_is_resumed_once(self):
+        path, count = save_rows(
+            [ImportRow('csv', None, 10 ** 6, {'barcode': 'X'})],
+        )
+        task = ImportTask.objects.create(
+            model_name='ralph_assets.asset',
+            mode='back_office',
+            mappings='{"barcode": "barcode"}',
+            rows_path=path,
+            total_rows=count,
+            status=ImportStatus.failed.id,
+        )
+        self.assertTrue(resume_import_task(task))
+        self.assertFalse(resume_import_task(task))
+        task = ImportTask.objects.get(pk=task.pk)
+        self.assertEqual(task.status, ImportStatus.finished.id)
+        self.assertEqual(task.row_errors.count(), 1)
+        self.assertEqual(task.rows_path, '')
+        self.assertFalse(os.path.exists(path))
+
+
+class TestSpreadsheetReader(TestCase):
+
+    def test_csv_rows(self):
+        csv_file = SimpleUploadedFile(
+            'test.csv', b'"sn","id"\n"sn-1","5"\n\n"sn-2","7"\n',
+        )
+        reader = SpreadsheetReader(csv_file, 'csv')
+        self.assertEqual(reader.names_per_sheet, {'csv': ['sn']})
+        self.assertTrue(reader.update)
+        self.assertEqual(list(reader.iter_rows()), [
+            ImportRow('csv', 2, 5, {'sn': 'sn-1'}),
+            ImportRow('csv', 4, 7, {'sn': 'sn-2'}),
+        ])
+
+    def test_rows_file(self):
+        csv_file = SimpleUploadedFile(
+            'test.csv', b'"sn","id"\n"sn-1","5"\n"sn-2","7"\n',
+        )
+        rows_file = SpreadsheetReader(csv_file, 'csv').to_rows_file()
+        reader = SpreadsheetReader(rows_file, 'rows')
+        self.assertEqual(reader.names_per_sheet, {'csv': ['sn']})
+        self.assertTrue(reader.update)
+        self.assertEqual(list(reader.iter_rows()), [
+            ImportRow('csv', 2, 5, {'sn': 'sn-1'}),
+            ImportRow('csv', 3, 7, {'sn': 'sn-2'}),
+        ])
+
+
+class TestImportValidator(TestCase):
+
+    def test_unique_values_and_dates(self):
+        licence = LicenceFactory()
+        engine = ImportEngine(
+            'ralph_assets.licence', 'back_office',
+            {'niw': 'niw', 'invoice_date': 'invoice_date'},
+        )
+        rows = [
+            ImportRow('csv', 2, None, {'niw': 'N-1', 'invoice_date': 'x'}),
+            ImportRow('csv', 3, None, {'niw': 'N-1'}),
+            ImportRow('csv', 4, None, {'niw': licence.niw}),
+            ImportRow('csv', 5, licence.id, {'niw': licence.niw}),
+        ]
+        problems = list(ImportValidator(engine).validate(rows))
+        self.assertEqual(
+            [(row.number, message) for row, message in problems],
+            [
+                (2, 'invoice_date: Invalid date {!r}'.format('x')),
+                (3, 'niw {!r} is repeated (row 2)'.format('N-1')),
+                (4, 'niw {!r} is used by object {}'.format(
+                    licence.niw, licence.id,
+                )),
+            ],
+        )
+
+    def test_models_are_checked_with_categories(self):
+        category = AssetCategoryFactory(name='Laptops')
+        AssetModelFactory(name='ThinkPad', category=category)
+        AssetModelFactory(name='ThinkPad')
+        engine = ImportEngine(
+            'ralph_assets.asset', 'back_office',
+            {'model': 'model', 'category': 'model.category'},
+        )
+        rows = [
+            ImportRow('csv', 2, None, {
+                'model': 'ThinkPad', 'category': 'Laptops',
+            }),
+            ImportRow('csv', 3, None, {
+                'model': 'ThinkPad', 'category': 'Tablets',
+            }),
+        ]
+        problems = list(ImportValidator(engine).validate(rows))
+        self.assertEqual(
+            [(row.number, message) for row, message in problems],
+            [(3, "model.category: Category 'Tablets' does not exists")],
+        )
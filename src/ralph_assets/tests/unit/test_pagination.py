@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import datetime
+
+from django.test import TestCase
+
+from ralph_assets.models_assets import Warehouse
+from ralph_assets.pagination import (
+    InvalidCursor,
+    KeysetPaginator,
+    capped_count,
+    decode_cursor,
+    encode_cursor,
+)
+from ralph_assets.tests.utils.assets import WarehouseFactory
+
+
+class TestCursor(TestCase):
+
+    def test_roundtrip(self):
+        data = {'o': '-name', 'v': ['żółw', 12], 'd': 'n'}
+        self.assertEqual(decode_cursor(encode_cursor(data)), data)
+
+    def test_datetime_keeps_microseconds(self):
+        date = datetime.datetime(2014, 5, 6, 7, 8, 9, 123456)
+        data = decode_cursor(
+            encode_cursor({'o': '-date', 'v': [date, 1], 'd': 'n'}),
+        )
+        self.assertEqual(data['v'][0], '2014-05-06T07:08:09.123456')
+
+    def test_invalid_cursor(self):
+        for token in ('', 'not-a-cursor', encode_cursor({'o': 'pk'})):
+            with self.assertRaises(InvalidCursor):
+                decode_cursor(token)
+
+
+class TestKeysetPaginator(TestCase):
+
+    def setUp(self):
+        self.warehouses = [WarehouseFactory() for _ in xrange(7)]
+
+    def _walk(self, order_by):
+        paginator = KeysetPaginator(Warehouse.objects.all(), 3, order_by)
+        pages = [paginator.page()]
+        while pages[-1].has_next():
+            pages.append(paginator.page(pages[-1].next_cursor))
+        return paginator, pages
+
+    def test_forward_covers_ordered_queryset(self):
+        for order_by in ('name', '-name', None):
+            _, pages = self._walk(order_by)
+            expected = list(Warehouse.objects.order_by(
+                *([order_by, 'pk'] if order_by else ['pk'])
+            ))
+            self.assertEqual([len(page) for page in pages], [3, 3, 1])
+            self.assertEqual(
+                [obj for page in pages for obj in page], expected,
+            )
+
+    def test_backward_returns_previous_page(self):
+        paginator, pages = self._walk('-name')
+        previous = paginator.page(pages[-1].previous_cursor)
+        self.assertEqual(list(previous), list(pages[1]))
+        self.assertTrue(previous.has_next())
+        self.assertTrue(previous.has_previous())
+        first = paginator.page(previous.previous_cursor)
+        self.assertEqual(list(first), list(pages[0]))
+        self.assertFalse(first.has_previous())
+
+    def test_cursor_for_other_ordering_is_ignored(self):
+        _, pages = self._walk('name')
+        paginator = KeysetPaginator(Warehouse.objects.all(), 3, '-name')
+        self.assertEqual(
+            list(paginator.page(pages[0].next_cursor)),
+            list(paginator.page()),
+        )
+
+    def test_capped_count(self):
+        self.assertEqual(capped_count(Warehouse.objects.all(), 5), (5, True))
+        self.assertEqual(capped_count(Warehouse.objects.all(), 7), (7, False))
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+import json
+
+from django.test import TestCase
+
+from ralph_assets.views.report import ReportContainer
+
+
+class TestReportContainer(TestCase):
+
+    def setUp(self):
+        self.report = ReportContainer()
+        for category, model, status, count in (
+            ('Keyboard', 'K1', 'new', 2),
+            ('Keyboard', 'K1', 'in use', 3),
+            ('Mouse', 'K1', 'new', 4),
+        ):
+            node, __ = self.report.add(name=model, parent=category)
+            self.report.add(
+                name=status, parent=node, count=count, unique=False,
+            )
+        self.report.rollup()
+
+    def test_same_name_under_different_parents(self):
+        keyboard = self.report.get('Keyboard')
+        mouse = self.report.get('Mouse')
+        self.assertNotEqual(
+            self.report.get('K1', keyboard), self.report.get('K1', mouse),
+        )
+
+    def test_rollup(self):
+        self.assertEqual(
+            [(node.name, node.count) for node in self.report.rows],
+            [
+                ('Keyboard', 5), ('K1', 5), ('new', 2), ('in use', 3),
+                ('Mouse', 4), ('K1', 4), ('new', 4),
+            ],
+        )
+
+    def test_to_json(self):
+        self.assertEqual(json.loads(self.report.to_json()), [
+            ['Keyboard', 5, [['K1', 5, [['new', 2, []], ['in use', 3, []]]]]],
+            ['Mouse', 4, [['K1', 4, [['new', 4, []]]]]],
+        ])
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from django.test import TestCase
+
+from ralph_assets.models_assets import AssetStatus, AssetType
+from ralph_assets.models_rollup import (
+    AssetCountRollup,
+    _adjust,
+    rebuild_rollup,
+)
+from ralph_assets.tests.utils.assets import (
+    AssetModelFactory,
+    BOAssetFactory,
+    DCAssetFactory,
+)
+
+
+class TestAssetCountRollup(TestCase):
+
+    def setUp(self):
+        self.model = AssetModelFactory()
+        self.assets = [
+            BOAssetFactory(model=self.model, status=AssetStatus.new.id)
+            for _ in xrange(3)
+        ]
+
+    def _counts(self):
+        return dict(
+            ((row.type, row.model_id, row.status), row.count)
+            for row in AssetCountRollup.admin_objects.filter(count__gt=0)
+        )
+
+    def test_counts_follow_changes(self):
+        bo = AssetType.back_office.id
+        self.assertEqual(self._counts(), {
+            (bo, self.model.id, AssetStatus.new.id): 3,
+        })
+        self.assets[0].status = AssetStatus.in_progress.id
+        self.assets[0].save()
+        self.assets[1].delete()
+        self.assertEqual(self._counts(), {
+            (bo, self.model.id, AssetStatus.new.id): 1,
+            (bo, self.model.id, AssetStatus.in_progress.id): 1,
+        })
+
+    def test_rebuild_matches_incremental_counts(self):
+        self.assets[0].status = AssetStatus.in_progress.id
+        self.assets[0].save()
+        expected = self._counts()
+        rebuild_rollup()
+        self.assertEqual(self._counts(), expected)
+
+    def test_assets_are_counted_by_type(self):
+        dc = AssetType.data_center.id
+        dc_asset = DCAssetFactory(model=self.model, status=AssetStatus.new.id)
+        self.assertEqual(
+            self._counts()[(dc, self.model.id, AssetStatus.new.id)], 1,
+        )
+        dc_asset.delete()
+        self.assertNotIn(
+            (dc, self.model.id, AssetStatus.new.id), self._counts(),
+        )
+        self.assertEqual(
+            self._counts()[
+                (AssetType.back_office.id, self.model.id, AssetStatus.new.id)
+            ],
+            3,
+        )
+
+    def test_null_key_has_one_row(self):
+        key = {
+            'region_id': self.assets[0].region_id,
+            'type': AssetType.back_office.id,
+            'data_center_id': None,
+            'model_id': self.model.id,
+            'status': None,
+        }
+        _adjust(key, 1)
+        _adjust(key, 1)
+        rows = AssetCountRollup.admin_objects.filter(**key)
+        self.assertEqual(list(rows.values_list('count', flat=True)), [2])
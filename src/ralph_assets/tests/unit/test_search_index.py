@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from django.test import TestCase
+
+from ralph_assets.models_assets import Asset
+from ralph_assets.models_search import (
+    AssetSearchTrigram,
+    find_similar_assets,
+    get_trigrams,
+    model_name_q,
+    search_index_q,
+)
+from ralph_assets.tests.utils.assets import AssetModelFactory, BOAssetFactory
+
+
+class TestTrigrams(TestCase):
+
+    def test_get_trigrams(self):
+        self.assertEqual(get_trigrams('AbcD'), {'abc', 'bcd'})
+        self.assertEqual(get_trigrams('ab'), set())
+        self.assertEqual(get_trigrams(None), set())
+
+
+class TestSearchIndex(TestCase):
+
+    def setUp(self):
+        self.asset = BOAssetFactory(sn='SN-12345', barcode='BC-777')
+        BOAssetFactory(sn='SN-99999', barcode='BC-888')
+
+    def _search(self, field, term):
+        return list(
+            Asset.objects.filter(search_index_q(field, term)).values_list(
+                'pk', flat=True,
+            )
+        )
+
+    def test_index_follows_saves(self):
+        self.assertTrue(AssetSearchTrigram.objects.filter(
+            asset=self.asset, field='sn', trigram='123',
+        ).exists())
+        self.asset.sn = 'SN-55555'
+        self.asset.save()
+        self.assertFalse(AssetSearchTrigram.objects.filter(
+            asset=self.asset, field='sn', trigram='123',
+        ).exists())
+
+    def test_unchanged_values_are_not_reindexed(self):
+        asset = Asset.objects.get(pk=self.asset.pk)
+        AssetSearchTrigram.objects.filter(asset=asset).delete()
+        asset.location = 'new location'
+        asset.save()
+        self.assertFalse(
+            AssetSearchTrigram.objects.filter(asset=asset).exists(),
+        )
+        asset.sn = 'SN-55555'
+        asset.save()
+        self.assertTrue(AssetSearchTrigram.objects.filter(
+            asset=asset, field='sn', trigram='555',
+        ).exists())
+
+    def test_substring_search(self):
+        self.assertEqual(self._search('sn', 'n-123'), [self.asset.pk])
+        self.assertEqual(self._search('barcode', '777'), [self.asset.pk])
+        self.assertEqual(self._search('sn', '1243'), [])
+
+    def test_candidates_are_a_subquery(self):
+        with self.assertNumQueries(0):
+            search_index_q('sn', 'n-123')
+
+    def test_short_term_falls_back_to_scan(self):
+        self.assertEqual(self._search('sn', '45'), [self.asset.pk])
+
+    def test_model_name(self):
+        model = AssetModelFactory(name='Unique model name')
+        asset = BOAssetFactory(model=model)
+        self.assertEqual(
+            list(Asset.objects.filter(model_name_q('que mod'))),
+            [asset],
+        )
+
+
+class TestFindSimilarAssets(TestCase):
+
+    def test_best_match_first(self):
+        BOAssetFactory(sn='XYZ-00001', barcode='BC-00001')
+        best = BOAssetFactory(sn='ABC-12345', barcode='BC-54321')
+        BOAssetFactory(sn='ABC-99999', barcode='BC-99999')
+        found = find_similar_assets('abc 1234')
+        self.assertEqual(found[0], best)
+        self.assertLessEqual(len(find_similar_assets('abc', limit=1)), 1)
+
+    def test_empty_query(self):
+        self.assertEqual(find_similar_assets('  '), [])
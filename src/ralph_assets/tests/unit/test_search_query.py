@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+
+from __future__ import absolute_import
+from __future__ import division
+from __future__ import print_function
+from __future__ import unicode_literals
+
+from django.db.models import Q
+from django.test import TestCase
+
+from ralph_assets.search_query import (
+    ASSET_SEARCH_SPEC,
+    SearchValue,
+    compile_search_query,
+)
+
+
+class TestSearchValue(TestCase):
+
+    def test_quoted_value_is_exact(self):
+        term = SearchValue('"abc"', allow_multi=True)
+        self.assertTrue(term.exact)
+        self.assertFalse(term.multi)
+        self.assertEqual(term.value, 'abc')
+
+    def test_delimited_value_is_multi(self):
+        term = SearchValue('a; b|c;', allow_multi=True)
+        self.assertTrue(term.multi)
+        self.assertEqual(term.values, ['a', 'b', 'c'])
+
+    def test_delimiters_ignored_when_multi_not_allowed(self):
+        term = SearchValue('a;b')
+        self.assertFalse(term.multi)
+
+
+def q_tree(q):
+    """Comparable representation of ``Q`` objects."""
+    if not isinstance(q, Q):
+        return (str(q[0]), q[1])
+    return (q.connector, q.negated, [q_tree(child) for child in q.children])
+
+
+class TestCompileSearchQuery(TestCase):
+
+    def assertQEqual(self, first, second):
+        # compiled queries are always AND-ed into an empty root ``Q``
+        self.assertEqual(q_tree(first), q_tree(Q() & second))
+
+    def test_empty_params(self):
+        self.assertQEqual(compile_search_query({}), Q())
+
+    def test_text_field(self):
+        self.assertQEqual(
+            compile_search_query({'invoice_no': 'abc'}),
+            Q(invoice_no__icontains='abc'),
+        )
+        self.assertQEqual(
+            compile_search_query({'sn': '"abc"'}), Q(sn='abc'),
+        )
+        self.assertQEqual(
+            compile_search_query({'sn': 'abc;def'}),
+            Q(sn='abc') | Q(sn='def'),
+        )
+
+    def test_unknown_enum_value_is_ignored(self):
+        self.assertQEqual(
+            compile_search_query({'deprecation_rate': 'unknown'}), Q(),
+        )
+
+    def test_date_range(self):
+        self.assertQEqual(
+            compile_search_query({
+                'invoice_date_from': '2014-01-01',
+                'invoice_date_to': '2014-02-01',
+            }),
+            Q(invoice_date__gte='2014-01-01') &
+            Q(invoice_date__lte='2014-02-01'),
+        )
+
+    def test_hook_field_calls_view(self):
+        class View(object):
+            def get_search_category_part(self, value):
+                return Q(model__category_id__in=[value])
+        self.assertQEqual(
+            compile_search_query({'category': 'cat'}, view=View()),
+            Q(model__category_id__in=['cat']),
+        )
+
+    def test_spec_is_not_mutated(self):
+        before = q_tree(ASSET_SEARCH_SPEC['deleted'].query)
+        compile_search_query({'deleted': 'on', 'sn': 'abc'})
+        self.assertEqual(q_tree(ASSET_SEARCH_SPEC['deleted'].query), before)
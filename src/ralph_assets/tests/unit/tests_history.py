@@ -5,9 +5,17 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import json
+
+import mock
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection
 from django.test import TestCase
 
-from ralph_assets.tests.utils.assets import DeviceInfoFactory
+from ralph_assets.history.models import History, buffered_history
+from ralph_assets.licences.models import Licence, LicenceAsset
+from ralph_assets.tests.utils.assets import BOAssetFactory, DeviceInfoFactory
+from ralph_assets.tests.utils.licences import LicenceFactory
 
 
 class HistoryTestCase(TestCase):
@@ -17,3 +25,110 @@ class HistoryTestCase(TestCase):
         device_info.position += 1
         device_info.save()
         self.assertEqual(old_length + 1, len(device_info.get_history()))
+
+
+class TestM2MHistory(TestCase):
+
+    def setUp(self):
+        self.licence = LicenceFactory()
+        self.assets = [BOAssetFactory() for _ in xrange(2)]
+
+    def _assign(self, licence, asset):
+        LicenceAsset.objects.create(licence=licence, asset=asset)
+
+    def _snapshot(self, licence):
+        return licence.get_snapshot(licence, licence.assets, 'assets')
+
+    def _count_queries(self, func, *args):
+        connection.use_debug_cursor = True
+        try:
+            start = len(connection.queries)
+            func(*args)
+            return len(connection.queries) - start
+        finally:
+            connection.use_debug_cursor = None
+
+    def _assign_many(self, count):
+        asset = BOAssetFactory()
+        licences = [LicenceFactory() for _ in xrange(count)]
+        for licence in licences:
+            self._assign(licence, asset)
+            self._assign(licence, self.assets[0])
+        return asset, licences
+
+    def _save_related_history(self, asset, licences):
+        asset._save_related_objects_history(
+            asset.licences, [licence.id for licence in licences], 'assets',
+        )
+
+    def test_consecutive_snapshots_use_known_pks(self):
+        self._assign(self.licence, self.assets[0])
+        first = self._snapshot(self.licence)
+        self.assertEqual(first.added, {self.assets[0].id})
+        self._assign(self.licence, self.assets[1])
+        with mock.patch.object(Licence, 'get_history') as get_history:
+            second = self._snapshot(self.licence)
+        self.assertFalse(get_history.called)
+        self.assertEqual(second.previous, [self.assets[0].id])
+        self.assertEqual(second.added, {self.assets[1].id})
+
+    def test_snapshot_sees_buffered_change(self):
+        self._assign(self.licence, self.assets[0])
+        with buffered_history():
+            self.licence.save_history_from_snapshot(
+                self._snapshot(self.licence),
+            )
+            licence = Licence.admin_objects.get(pk=self.licence.pk)
+            self._assign(licence, self.assets[1])
+            snapshot = self._snapshot(licence)
+            self.assertFalse(
+                History.objects.filter(field_name='assets').exists(),
+            )
+        self.assertEqual(snapshot.previous, [self.assets[0].id])
+        self.assertEqual(snapshot.added, {self.assets[1].id})
+        self.assertEqual(
+            History.objects.filter(field_name='assets').count(), 1,
+        )
+
+    def test_related_objects_history(self):
+        asset, licences = self._assign_many(3)
+        History.objects.log_changes(licences[0], None, [{
+            'field': 'assets',
+            'old': '',
+            'new': json.dumps([self.assets[0].id]),
+        }])
+        last_id = History.objects.order_by('-id').values_list(
+            'id', flat=True,
+        )[0]
+        self._save_related_history(asset, licences)
+        current = sorted([asset.id, self.assets[0].id])
+        # the same changes as snapshots made licence by licence
+        self.assertEqual(
+            sorted(
+                (
+                    change.object_id,
+                    json.loads(change.old_value),
+                    sorted(json.loads(change.new_value)),
+                )
+                for change in History.objects.filter(
+                    field_name='assets', id__gt=last_id,
+                )
+            ),
+            sorted(
+                [(licences[0].id, [self.assets[0].id], current)] +
+                [(licence.id, [], current) for licence in licences[1:]]
+            ),
+        )
+
+    def test_related_objects_history_queries(self):
+        ContentType.objects.get_for_model(Licence)
+        few = self._count_queries(
+            self._save_related_history, *self._assign_many(2)
+        )
+        many = self._count_queries(
+            self._save_related_history, *self._assign_many(10)
+        )
+        self.assertEqual(few, many)
+        self.assertEqual(
+            History.objects.filter(field_name='assets').count(), 12,
+        )
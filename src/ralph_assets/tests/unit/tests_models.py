@@ -18,7 +18,14 @@ from ralph.discovery.models_device import Device, DeviceType
 
 from ralph.discovery.tests.util import DeviceModelFactory
 from ralph_assets.api_pricing import get_assets, get_asset_parts
-from ralph_assets.models_assets import AssetStatus, PartInfo, Rack
+from ralph_assets.history.models import History, buffered_history
+from ralph_assets.models_assets import (
+    Asset,
+    AssetStatus,
+    DCAsset,
+    PartInfo,
+    Rack,
+)
 from ralph_assets.models_dc_assets import (
     DeprecatedRalphDC,
     DeprecatedRalphRack,
@@ -125,6 +132,29 @@ class TestModelAsset(TestCase):
         self.assertFalse(self.asset.is_liquidated(date))
         self.assertFalse(self.asset.is_liquidated(date + timedelta(days=-1)))
 
+    def test_asset_is_liquidated_with_preloaded_dates(self):
+        date = datetime.date.today()
+        self.asset.status = AssetStatus.liquidated
+        self.asset.save()
+        dates = Asset.get_liquidation_dates([self.asset.id, self.asset2.id])
+        self.assertEqual(dates.keys(), [self.asset.id])
+        for day in (date + timedelta(days=-1), date):
+            self.assertEqual(
+                self.asset.is_liquidated(day, dates),
+                self.asset.is_liquidated(day),
+            )
+        self.assertFalse(self.asset2.is_liquidated(date, dates))
+
+    def test_liquidation_dates_of_dc_asset(self):
+        asset = DCAssetFactory(status=AssetStatus.liquidated)
+        # history of polymorphic instances is logged under their class
+        History.objects.log_changes(DCAsset(id=asset.id), None, [{
+            'field': 'status', 'old': 'new', 'new': 'liquidated',
+        }])
+        dates = Asset.get_liquidation_dates([asset.id])
+        self.assertEqual(dates.keys(), [asset.id])
+        self.assertTrue(asset.is_liquidated(datetime.date.today(), dates))
+
     def test_venture(self):
         venture = Venture.objects.create(name='v1')
         self.dev1.venture = venture
@@ -316,6 +346,45 @@ class TestModelHistory(TestCase):
             licence.assign(asset, i + 1)
             self.assertEqual(i + 3, history.count())
 
+    def test_latest_changes(self):
+        assets = [AssetFactory(), AssetFactory(), AssetFactory()]
+        for asset, statuses in zip(assets, [
+            [AssetStatus.in_progress, AssetStatus.used],
+            [AssetStatus.liquidated],
+            [],
+        ]):
+            for status in statuses:
+                asset.status = status
+                asset.save()
+        changes = History.objects.latest_changes(
+            Asset, [asset.id for asset in assets], 'status',
+        )
+        self.assertEqual(
+            dict((key, change.new_value) for key, change in changes.items()),
+            {
+                assets[0].id: AssetStatus.used.desc,
+                assets[1].id: AssetStatus.liquidated.desc,
+            },
+        )
+
+    def test_buffered_history(self):
+        assets = [AssetFactory(), AssetFactory()]
+        with buffered_history():
+            for asset in assets:
+                asset.sn = asset.sn + '-changed'
+                asset.save()
+            self.assertEqual(0, History.objects.count())
+        self.assertEqual(2, History.objects.count())
+
+    def test_buffered_history_dropped_on_error(self):
+        asset = AssetFactory()
+        with self.assertRaises(ValueError):
+            with buffered_history():
+                asset.sn = asset.sn + '-changed'
+                asset.save()
+                raise ValueError()
+        self.assertEqual(0, History.objects.count())
+
 
 class BladeDeviceInfoFactory(DeviceInfoFactory):
     """Creates DeviceInfo for elements in a blade system"""
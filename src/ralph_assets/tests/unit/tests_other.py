@@ -5,9 +5,13 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import csv
 import datetime
+import os
 
+import mock
 from dj.choices import Country
+from django.core.cache import get_cache
 from django.core.exceptions import ValidationError
 from django.core.management import call_command
 from django.test import TestCase
@@ -16,7 +20,12 @@ from ralph.account.models import Region
 from ralph.discovery.tests.util import DeviceFactory
 
 from ralph_assets import models_assets
-from ralph_assets.others import get_assets_rows, get_licences_rows
+from ralph_assets.count_cache import bump_generation
+from ralph_assets.others import (
+    export_relations,
+    get_assets_rows,
+    get_licences_rows,
+)
 from ralph_assets.tests.utils import UserFactory
 from ralph_assets.tests.utils.assets import (
     AssetFactory,
@@ -39,6 +48,9 @@ from ralph_assets.utils import iso2_to_iso3, iso3_to_iso2
 from ralph_assets.views.asset import ChassisBulkEdit
 
 
+LOCMEM_CACHE = get_cache('django.core.cache.backends.locmem.LocMemCache')
+
+
 class TestExportRelations(TestCase):
     @classmethod
     def setUpClass(cls):
@@ -161,6 +173,22 @@ class TestExportRelations(TestCase):
             ]
         )
 
+    @mock.patch('ralph_assets.others.cache', LOCMEM_CACHE)
+    @mock.patch('ralph_assets.count_cache.cache', LOCMEM_CACHE)
+    def test_export_relations_is_reused(self):
+        path = export_relations('assets')
+        with open(path, 'rb') as csv_file:
+            rows = list(csv.reader(csv_file))
+        self.assertEqual(rows[1][:4], [
+            str(self.asset.id), 'niw=666', 'br-666', '1111-1111-1111-1111',
+        ])
+        self.assertEqual(export_relations('assets'), path)
+        bump_generation()
+        new_path = export_relations('assets')
+        self.assertNotEqual(new_path, path)
+        self.assertFalse(os.path.exists(path))
+        self.assertTrue(os.path.exists(new_path))
+
     def test_licences_rows_only_assigned(self):
         self.licence1.assign(self.asset)
         self.licence1.assign(self.user)
@@ -37,7 +37,11 @@ from ralph_assets.views.ajax import (
     CategoryDependencyView,
     ModelDependencyView,
 )
-from ralph_assets.views.data_import import XlsUploadView
+from ralph_assets.views.data_import import (
+    ImportTaskErrorsView,
+    ImportTaskView,
+    XlsUploadView,
+)
 from ralph_assets.views.support import (
     SupportList,
     AddSupportView,
@@ -151,6 +155,16 @@ urlpatterns = patterns(
         login_required(XlsUploadView.as_view(XLS_UPLOAD_FORMS)),
         name='xls_upload',
     ),
+    url(
+        r'xls/task/(?P<task_id>[0-9]+)/$',
+        login_required(ImportTaskView.as_view()),
+        name='import_task',
+    ),
+    url(
+        r'xls/task/(?P<task_id>[0-9]+)/errors/$',
+        login_required(ImportTaskErrorsView.as_view()),
+        name='import_task_errors',
+    ),
     url(
         r'support/$',
         login_required(SupportList.as_view()),
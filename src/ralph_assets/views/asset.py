@@ -18,6 +18,7 @@ from django.utils.translation import ugettext_lazy as _
 
 from ralph_assets.licences.models import Licence
 from ralph_assets.forms import BladeSystemForm, BladeServerForm
+from ralph_assets.history.models import buffered_history
 from ralph_assets.models import Asset
 from ralph_assets.models_assets import AssetType, DCAsset, BOAsset
 from ralph_assets.views.base import (
@@ -139,7 +140,7 @@ class AssetBulkEdit(
         return idx
 
     def save_formset(self, instances, formset):
-        with transaction.commit_on_success():
+        with transaction.commit_on_success(), buffered_history():
             for instance in instances:
                 idx = self._get_formset_idx(formset, instance)
                 instance.modified_by = self.request.user.get_profile()
@@ -29,6 +29,7 @@ from ralph_assets.app import Assets as app
 from ralph_assets.models_assets import AssetType
 from ralph_assets.models import DCAsset, BOAsset, Asset
 from ralph_assets.forms import OfficeForm
+from ralph_assets.pagination import KeysetPaginator
 
 MAX_PAGE_SIZE = 65535
 HISTORY_PAGE_SIZE = 25
@@ -293,6 +294,48 @@ class PaginateMixin(object):
         return context
 
 
+class KeysetPaginateMixin(object):
+    """Like :class:`PaginateMixin`, but pages are fetched by cursors
+    (previous / next) instead of page numbers, which keeps deep pages of
+    long lists cheap."""
+    paginate_queryset = None
+    paginate_order_by = None
+    cursor_variable_name = 'cursor'
+
+    def get_paginate_queryset(self):
+        if not self.paginate_queryset:
+            raise Exception(
+                'Please specified ``paginate_queryset`` or '
+                'override ``get_paginate_queryset`` method.',
+            )
+        return self.paginate_queryset
+
+    def get_page_url(self, cursor):
+        query = self.request.GET.copy()
+        query[self.cursor_variable_name] = cursor
+        return '?' + query.urlencode()
+
+    def get_context_data(self, **kwargs):
+        context = super(KeysetPaginateMixin, self).get_context_data(**kwargs)
+        page_content = KeysetPaginator(
+            self.get_paginate_queryset(),
+            HISTORY_PAGE_SIZE,
+            self.paginate_order_by,
+        ).page(self.request.GET.get(self.cursor_variable_name))
+        context.update({
+            'page_content': page_content,
+            'keyset_next_url': (
+                self.get_page_url(page_content.next_cursor)
+                if page_content.has_next() else None
+            ),
+            'keyset_previous_url': (
+                self.get_page_url(page_content.previous_cursor)
+                if page_content.has_previous() else None
+            ),
+        })
+        return context
+
+
 class ContentTypeMixin(object):
     """Helper for views. This mixin add model, content_type, object_id,
     content_type_id."""
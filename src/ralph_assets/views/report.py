@@ -5,20 +5,23 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import json
 import logging
-import uuid
 
-from bob import csvutil
 from bob.menu import MenuItem, MenuHeader
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.urlresolvers import reverse
-from django.db.models import Count
+from django.db import connection
+from django.db.models import Sum
 from django.http import Http404
+from django.utils.encoding import force_unicode
 from django.utils.translation import ugettext_lazy as _
 
 from ralph.util.reports import Report
 # from ralph.discovery.models_device import Device
+from ralph_assets.csv_export import make_csv_file_response
 from ralph_assets.views.base import AssetsBase
-from ralph_assets.others import get_assets_rows, get_licences_rows
+from ralph_assets.others import export_relations
 from ralph_assets.models_assets import (
     Asset,
     AssetModel,
@@ -27,6 +30,7 @@ from ralph_assets.models_assets import (
     MODE2ASSET_TYPE,
 )
 from ralph_assets.models_dc_assets import DataCenter
+from ralph_assets.models_rollup import AssetCountRollup
 
 
 logger = logging.getLogger(__name__)
@@ -39,24 +43,21 @@ def get_desc(choices_class, key, default='------'):
 class ReportNode(object):
     """The basic report node. It is simple object which store name, count,
     parent and children."""
-    def __init__(self, name, count=0, parent=None, children=[],
-                 link=None, **kwargs):
+    def __init__(self, name, count=0, parent=None, link=None, uid=None):
         self.name = name
         self.count = count
-        self.parent = parent
+        self.parent = None
+        self.level = 0
         self.children = []
         self.link = link
-        self.uid = uuid.uuid1()
+        self.uid = uid
+        if parent:
+            parent.add_child(self)
 
     def add_child(self, child):
         self.children.append(child)
         child.parent = self
-
-    def add_to_count(self, count):
-        self.count += count
-
-    def update_count(self):
-        map(lambda node: node.add_to_count(self.count), self.ancestors)
+        child.level = self.level + 1
 
     @property
     def ancestors(self):
@@ -77,42 +78,70 @@ class ReportNode(object):
 
 class ReportContainer(list):
     """Container for nodes. This class provides few helpful methods to
-    manipulate on node set."""
-    def get(self, name):
-        return next((node for node in self if node.name == name), None)
-
-    def get_or_create(self, name):
-        node = self.get(name)
+    manipulate on node set.
+
+    Nodes are indexed by ``(parent uid, name)``, so the same name may be used
+    under different parents. Parents are always added before their children,
+    which lets :meth:`rollup` sum counts in one reversed pass.
+    """
+    def __init__(self, *args, **kwargs):
+        super(ReportContainer, self).__init__(*args, **kwargs)
+        self._index = {}
+
+    def _key(self, name, parent):
+        # lazy translations are not hashable by value
+        return (parent.uid if parent else None, force_unicode(name))
+
+    def _create(self, name, parent):
+        node = ReportNode(name, parent=parent, uid=len(self) + 1)
+        self.append(node)
+        return node
+
+    def get(self, name, parent=None):
+        return self._index.get(self._key(name, parent))
+
+    def get_or_create(self, name, parent=None):
+        node = self.get(name, parent)
         created = False
         if not node:
-            node = ReportNode(name)
-            self.append(node)
+            node = self._create(name, parent)
+            self._index[self._key(name, parent)] = node
             created = True
         return node, created
 
     def add(self, name, count=0, parent=None, unique=True, link=None):
+        if parent and not isinstance(parent, ReportNode):
+            parent, __ = self.get_or_create(parent)
         if unique:
-            new_node, created = self.get_or_create(name)
+            new_node, __ = self.get_or_create(name, parent)
         else:
-            new_node = ReportNode(name)
-            self.append(new_node)
-            created = True
+            new_node = self._create(name, parent)
         new_node.count = count
-        if parent:
-            if not isinstance(parent, ReportNode):
-                parent, __ = self.get_or_create(parent)
-        if created:
-            parent.add_child(new_node)
         new_node.link = link
         return new_node, parent
 
+    def rollup(self):
+        """Add counts of all nodes to their parents (bottom-up)."""
+        for node in reversed(self):
+            if node.parent:
+                node.parent.count += node.count
+
     @property
     def roots(self):
         return [node for node in self if node.parent is None]
 
     @property
     def leaves(self):
-        return [node for node in self if node.children == []]
+        return [node for node in self if not node.children]
+
+    @property
+    def rows(self):
+        """All nodes in the display order (depth-first)."""
+        stack = list(reversed(self.roots))
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(reversed(node.children))
 
     def to_dict(self):
         def traverse(node):
@@ -123,6 +152,24 @@ class ReportContainer(list):
             return ret
         return [traverse(root) for root in self.roots]
 
+    def to_json(self):
+        """Compact JSON of the tree: ``[name, count, children, link]`` lists
+        (``link`` only for nodes having one)."""
+        def traverse(node):
+            ret = [
+                force_unicode(node.name),
+                node.count,
+                [traverse(child) for child in node.children],
+            ]
+            if node.link:
+                ret.append(node.link)
+            return ret
+        return json.dumps(
+            [traverse(root) for root in self.roots],
+            cls=DjangoJSONEncoder,
+            separators=(',', ':'),
+        )
+
 
 class BaseReport(object):
     """Each report must inherit from this class."""
@@ -131,6 +178,7 @@ class BaseReport(object):
     with_counter = True
     links = False
     template_name = None
+    request = None
 
     def __init__(self):
         self.report = ReportContainer()
@@ -139,7 +187,7 @@ class BaseReport(object):
         self.mode = mode
         self.dc = dc
         self.prepare(mode, dc)
-        map(lambda x: x.update_count(), self.report.leaves)
+        self.report.rollup()
         return self.report.roots
 
     def prepare(self, mode, dc):
@@ -154,14 +202,14 @@ class CategoryModelReport(BaseReport):
     name = _('Category - model')
 
     def prepare(self, mode, *args, **kwargs):
-        queryset = Asset.objects
+        queryset = AssetCountRollup.objects.filter(count__gt=0)
         if mode:
             queryset = queryset.filter(type=mode)
-        queryset = queryset.select_related('model', 'category').values(
+        queryset = queryset.values(
             'model__category__name',
             'model__name',
         ).annotate(
-            num=Count('model')
+            num=Sum('count')
         ).order_by('model__category__name')
 
         for item in queryset:
@@ -178,15 +226,15 @@ class CategoryModelStatusReport(BaseReport):
     name = _('Category - model - status')
 
     def prepare(self, mode, *args, **kwargs):
-        queryset = Asset.objects
+        queryset = AssetCountRollup.objects.filter(count__gt=0)
         if mode:
             queryset = queryset.filter(type=mode)
-        queryset = queryset.select_related('model', 'category').values(
+        queryset = queryset.values(
             'model__category__name',
             'model__name',
             'status',
         ).annotate(
-            num=Count('status')
+            num=Sum('count')
         ).order_by('model__category__name')
 
         for item in queryset:
@@ -217,7 +265,7 @@ class ManufacturerCategoryModelReport(BaseReport):
             'category__name',
             'name',
         ).annotate(
-            num=Count('assets')
+            num=Sum('count_rollups__count')
         ).order_by('manufacturer__name')
 
         for item in queryset:
@@ -229,7 +277,7 @@ class ManufacturerCategoryModelReport(BaseReport):
             self.report.add(
                 name=item['name'],
                 parent=node,
-                count=item['num'],
+                count=item['num'] or 0,
             )
 
 
@@ -239,16 +287,16 @@ class StatusModelReport(BaseReport):
     name = _('Status - model')
 
     def prepare(self, mode=None, dc=None):
-        queryset = Asset.objects
+        queryset = AssetCountRollup.objects.filter(count__gt=0)
         if mode:
             queryset = queryset.filter(type=mode)
         if dc:
-            queryset = queryset.filter(device_info__data_center__name=dc)
+            queryset = queryset.filter(data_center=dc)
         queryset = queryset.values(
             'status',
             'model__name',
         ).annotate(
-            num=Count('model')
+            num=Sum('count')
         )
         for item in queryset:
             self.report.add(
@@ -264,84 +312,107 @@ class LinkedDevicesReport(BaseReport):
     name = _('Asset - device')
     with_modes = False
     links = True
-
-    def prepare(self, mode=None, *args, **kwargs):
-        assets = Asset.objects.raw("""
-        SELECT a.*
-        FROM
-            ralph_assets_asset a
-        JOIN
-            ralph_assets_deviceinfo di ON di.id=a.device_info_id
-        JOIN
-            discovery_device e on a.sn=e.sn or a.barcode=e.barcode
-        WHERE
-            di.ralph_device_id IS NULL
-            OR di.ralph_device_id=0
-            AND a.deleted=0
-        """)
-
-        ids = []
-        root = None
-        for asset in assets:
-            ids.append(str(asset.id))
-            link = {
-                'label': 'go to asset',
-                'url': asset.get_absolute_url(),
-            }
-
-            node, root = self.report.add(
-                parent=_('Matched SN or barcode but without linked device'),
+    page_size = 100
+
+    # UNION of two equi-joins, so both can use the sn/barcode indexes;
+    # soft-deleted devices are skipped like by ``Device.objects``
+    matched_sql = """
+        SELECT a.id FROM ralph_assets_asset a
+        JOIN ralph_assets_deviceinfo di ON di.id = a.device_info_id
+        JOIN discovery_device e ON e.sn = a.sn
+        WHERE (di.ralph_device_id IS NULL OR di.ralph_device_id = 0)
+            AND a.deleted = 0 AND e.deleted = 0
+        UNION
+        SELECT a.id FROM ralph_assets_asset a
+        JOIN ralph_assets_deviceinfo di ON di.id = a.device_info_id
+        JOIN discovery_device e ON e.barcode = a.barcode
+        WHERE (di.ralph_device_id IS NULL OR di.ralph_device_id = 0)
+            AND a.deleted = 0 AND e.deleted = 0
+    """
+    unlinked_sql = """
+        SELECT a.id FROM ralph_assets_asset a
+        JOIN ralph_assets_deviceinfo di ON di.id = a.device_info_id
+        WHERE di.ralph_device_id IS NULL AND a.deleted = 0
+    """
+    devices_without_asset_sql = """
+        SELECT COUNT(*) FROM discovery_device d
+        LEFT JOIN ralph_assets_deviceinfo di ON di.ralph_device_id = d.id
+        WHERE di.id IS NULL AND d.deleted = 0
+    """
+
+    def _fetch(self, sql, params=()):
+        cursor = connection.cursor()
+        cursor.execute(sql, params)
+        return cursor.fetchall()
+
+    def _count(self, sql):
+        return self._fetch(
+            'SELECT COUNT(*) FROM ({}) bucket'.format(sql),
+        )[0][0]
+
+    def _get_page(self):
+        try:
+            return max(int(self.request.GET.get('page', 1)), 1)
+        except (AttributeError, ValueError):
+            return 1
+
+    def _add_assets_page(self, root, bucket, sql, page):
+        """Show one page of assets of the *bucket* under its *root* node."""
+        ids = [row[0] for row in self._fetch(
+            'SELECT id FROM ({}) bucket ORDER BY id LIMIT %s OFFSET %s'.format(
+                sql,
+            ),
+            (self.page_size, (page - 1) * self.page_size),
+        )]
+        assets = Asset.objects.in_bulk(ids)
+        for asset in (assets[pk] for pk in ids if pk in assets):
+            self.report.add(
+                parent=root,
                 name='SN: %s, barcode: %s' % (asset.sn, asset.barcode),
                 count=1,
-                link=link,
+                link={
+                    'label': 'go to asset',
+                    'url': asset.get_absolute_url(),
+                },
                 unique=False,
             )
-        if root:
+        if page * self.page_size < root.count:
             root.link = {
-                'label': 'go to search',
-                'url': '/assets/dc/search?id={}'.format(','.join(ids)),
+                'label': 'next page',
+                'url': '?bucket={}&page={}'.format(bucket, page + 1),
             }
+        # listed assets are added back to the root by the rollup
+        root.count -= len(assets)
 
-        assets = Asset.objects.raw("""
-        SELECT a.*
-        FROM
-            ralph_assets_asset a
-        JOIN
-            ralph_assets_deviceinfo di ON di.id=a.device_info_id
-        WHERE
-            di.ralph_device_id IS NULL
-            AND a.deleted=0
-        """)
-        ids = []
-        for asset in assets:
-            ids.append(str(asset.id))
-            link = {
-                'label': 'go to asset',
-                'url': asset.get_absolute_url(),
-            }
-            node, root = self.report.add(
-                parent=_('Assets without linked device'),
-                name='SN: %s, barcode: %s' % (asset.sn, asset.barcode),
-                count=1,
-                link=link,
-                unique=False,
+    def prepare(self, mode=None, *args, **kwargs):
+        bucket = getattr(self.request, 'GET', {}).get('bucket')
+        matched = self._count(self.matched_sql)
+        if matched:
+            root, __ = self.report.add(
+                name=_('Matched SN or barcode but without linked device'),
+                count=matched,
+                link={'label': 'show assets', 'url': '?bucket=matched'},
+            )
+            if bucket == 'matched':
+                self._add_assets_page(
+                    root, bucket, self.matched_sql, self._get_page(),
+                )
+
+        unlinked = self._count(self.unlinked_sql)
+        if unlinked:
+            self.report.add(
+                name=_('Assets without linked device'),
+                count=unlinked,
+                link={
+                    'label': 'go to search',
+                    'url': '/assets/dc/search?unlinked=on',
+                },
             )
-        if root:
-            root.link = {
-                'label': 'go to search',
-                'url': '/assets/dc/search?id={}'.format(','.join(ids)),
-            }
 
-        device_info_ids = DeviceInfo.objects.exclude(
-            ralph_device_id=None
-        ).values_list(
-            'ralph_device_id', flat=True
-        )
-        devices = Device.objects.exclude(id__in=device_info_ids)
         node, root = self.report.add(
             parent=_('Devices without linked asset'),
             name=str('Total'),
-            count=devices.count()
+            count=self._fetch(self.devices_without_asset_sql)[0][0],
         )
         root.link = {
             'label': 'go to search',
@@ -361,31 +432,30 @@ class BaseRelationsReport(BaseReport):
         self.export = request.GET.get('csv')
         return self.export == 'on'
 
-    def get_response(self, request, result):
-        return csvutil.make_csv_response(data=result, filename=self.filename)
+    def get_result(self, *args, **kwargs):
+        return export_relations(
+            self.relations, filter_type=kwargs.get('mode'),
+            only_assigned_licences=self.only_assigned_licences,
+        )
+
+    def get_response(self, request, result, rebuild=None):
+        return make_csv_file_response(result, self.filename, rebuild=rebuild)
 
 
 class AssetRelationsReport(BaseRelationsReport):
     slug = 'asset-relations'
     name = _('Asset - relations')
     filename = 'asset_relations.csv'
-
-    def get_result(self, *args, **kwargs):
-        filter_type = kwargs.get('mode')
-        return list(get_assets_rows(filter_type=filter_type))
+    relations = 'assets'
+    only_assigned_licences = False
 
 
 class LicenceRelationsReport(BaseRelationsReport):
     slug = 'licence-relations'
     name = _('Licence - relations')
     filename = 'licence_relations.csv'
-
-    def get_result(self, *args, **kwargs):
-        filter_type = kwargs.get('mode')
-        data = []
-        for row in get_licences_rows(filter_type, True):
-            data.append([item.decode('utf-8') for item in row])
-        return data
+    relations = 'licences'
+    only_assigned_licences = True
 
 
 class ReportViewBase(AssetsBase):
@@ -478,7 +548,13 @@ class ReportDetail(Report, ReportViewBase):
         return report.get_result(*args, **kwargs)
 
     def get_response(self, request, result):
-        return self.report.get_response(request, result)
+        # the file of a finished job may be replaced by a newer export
+        return self.report.get_response(
+            request, result,
+            rebuild=lambda: self.get_result(
+                request, *self.args, **self.kwargs
+            ),
+        )
 
     def dispatch(self, request, *args, **kwargs):
         try:
@@ -490,6 +566,7 @@ class ReportDetail(Report, ReportViewBase):
         self.report = self.get_report(self.slug)
         if not self.report:
             raise Http404
+        self.report.request = request
         return super(ReportDetail, self).dispatch(request, *args, **kwargs)
 
     def get_context_data(self, **kwargs):
@@ -498,10 +575,11 @@ class ReportDetail(Report, ReportViewBase):
             'report': self.report,
             'subsection': self.report.name,
             'result': self.report.execute(self.asset_type, self.dc),
+            'rows': self.report.report.rows,
             'cache_key': (
                 (str(self.asset_type) or 'all') +
                 (str(self.dc.id) if self.dc else 'all') +
-                self.slug
+                self.slug + self.request.GET.urlencode()
             ),
             'modes': self.modes,
             'datacenters': self.datacenters,
@@ -6,337 +6,70 @@ from __future__ import print_function
 from __future__ import unicode_literals
 
 import logging
-import re
 
 from rq import get_current_job
 from bob.data_table import DataTableMixin
 
 from django.conf import settings
 from django.db.models import Q
+from django.db.models.fields import FieldDoesNotExist
+from django.db.models.fields.related import OneToOneField
 from django.contrib import messages
 from django.utils.translation import ugettext_lazy as _
 
-from ralph.util.reports import Report, set_progress
+from ralph.util.reports import Report
 # from ralph.business.models import Venture
 # from ralph.discovery.models_device import Device
+from ralph_assets.count_cache import cached_count
+from ralph_assets.csv_export import (
+    ProgressReporter,
+    get_export_path,
+    iter_chunks,
+    make_csv_file_response,
+    write_csv,
+)
 from ralph_assets.forms import (
     BackOfficeSearchAssetForm,
     DataCenterSearchAssetForm,
 )
 from ralph_assets.models import DCAsset, BOAsset, AssetCategory, Asset
+from ralph_assets.pagination import KeysetPaginator, capped_count
+from ralph_assets.search_query import (
+    ASSET_SEARCH_DATE_SPEC,
+    ASSET_SEARCH_SPEC,
+    compile_search_query,
+)
 from ralph_assets.views.base import AssetsBase, DataTableColumnAssets
 
 
 logger = logging.getLogger(__name__)
 
 
-QUOTATION_MARKS = re.compile(r"^\".+\"$")
-SEARCH_DELIMITERS = re.compile(r";|\|")
-
-
 class AssetsSearchQueryableMixin(object):
+    """Builds the asset search query from ``request.GET``.
+
+    Fields are described declaratively in
+    :data:`ralph_assets.search_query.ASSET_SEARCH_SPEC`; counting is left to
+    the caller so the result is counted once per request at most.
+    """
+    search_spec = ASSET_SEARCH_SPEC
+    search_date_spec = ASSET_SEARCH_DATE_SPEC
 
     def handle_search_data(self, *args, **kwargs):
-        search_fields = [
-            'barcode',
-            'budget_info',
-            'category',
-            'company',
-            'cost_center',
-            'deleted',
-            'department',
-            'deprecation_rate',
-            'device_environment',
-            'device_info',
-            'employee_id',
-            'guardian',
-            'hostname',
-            'id',
-            'imei',
-            'invoice_no',
-            'location',
-            'location_name',
-            'manufacturer',
-            'model',
-            'niw',
-            'order_no',
-            'owner',
-            'part_info',
-            'profit_center',
-            'provider',
-            'purpose',
-            # 'ralph_device_id',
-            'region',
-            'remarks',
-            'required_support',
-            'segment',
-            'service',
-            'service_name',
-            'sn',
-            'purchase_order',
-            'source',
-            'status',
-            'support_assigned',
-            'task_url',
-            'unlinked',
-            'user',
-            'venture_department',
-            'warehouse',
-            'without_assigned_location',
-        ]
-        # handle simple 'equals' search fields at once.
-        all_q = Q()
-        for field in search_fields:
-            field_value = self.request.GET.get(field)
-            if field_value:
-                exact = False
-                multi = False
-                # if search term is enclosed in "", we want exact matches
-                if isinstance(field_value, basestring) and \
-                        QUOTATION_MARKS.search(field_value):
-                    exact = True
-                    field_value = field_value[1:-1]
-                elif re.search(SEARCH_DELIMITERS, field_value):
-                    multi = True
-                if field == 'part_info':
-                    if field_value == 'device':
-                        all_q &= Q(part_info__isnull=True)
-                    elif field_value == 'part':
-                        all_q &= Q(part_info__gte=0)
-                elif field == 'model':
-                    if exact:
-                        all_q &= Q(model__name=field_value)
-                    else:
-                        all_q &= Q(model__name__icontains=field_value)
-                elif field == 'category':
-                    part = self.get_search_category_part(field_value)
-                    if part:
-                        all_q &= part
-                elif field == 'deleted':
-                    if field_value.lower() == 'on':
-                        all_q &= Q(deleted__in=(True, False))
-                elif field == 'manufacturer':
-                    if exact:
-                        all_q &= Q(model__manufacturer__name=field_value)
-                    else:
-                        all_q &= Q(
-                            model__manufacturer__name__icontains=field_value
-                        )
-                elif field == 'barcode':
-                    if exact:
-                        all_q &= Q(barcode=field_value)
-                    elif multi:
-                        all_q &= self._search_fields_or(
-                            ['barcode'],
-                            re.split(SEARCH_DELIMITERS, field_value),
-                        )
-                    else:
-                        all_q &= Q(barcode__contains=field_value)
-                elif field == 'hostname':
-                    if exact:
-                        all_q &= Q(hostname=field_value)
-                    elif multi:
-                        all_q &= self._search_fields_or(
-                            ['hostname'],
-                            re.split(SEARCH_DELIMITERS, field_value),
-                        )
-                    else:
-                        all_q &= Q(hostname__contains=field_value)
-                elif field == 'sn':
-                    if exact:
-                        all_q &= Q(sn=field_value)
-                    elif multi:
-                        all_q &= self._search_fields_or(
-                            ['sn'],
-                            re.split(SEARCH_DELIMITERS, field_value),
-                        )
-                    else:
-                        all_q &= Q(sn__icontains=field_value)
-                elif field == 'purchase_order':
-                    if exact:
-                        all_q &= Q(purchase_order=field_value)
-                    elif multi:
-                        all_q &= self._search_fields_or(
-                            ['purchase_order'],
-                            re.split(SEARCH_DELIMITERS, field_value),
-                        )
-                    else:
-                        all_q &= Q(purchase_order__icontains=field_value)
-                elif field == 'niw':
-                    if exact:
-                        all_q &= Q(niw=field_value)
-                    elif multi:
-                        all_q &= self._search_fields_or(
-                            ['niw'],
-                            re.split(SEARCH_DELIMITERS, field_value),
-                        )
-                    else:
-                        all_q &= Q(niw__icontains=field_value)
-                elif field == 'provider':
-                    if exact:
-                        all_q &= Q(provider=field_value)
-                    else:
-                        all_q &= Q(provider__icontains=field_value)
-                elif field == 'order_no':
-                    if exact:
-                        all_q &= Q(order_no=field_value)
-                    else:
-                        all_q &= Q(order_no__icontains=field_value)
-                elif field == 'invoice_no':
-                    if exact:
-                        all_q &= Q(invoice_no=field_value)
-                    else:
-                        all_q &= Q(invoice_no__icontains=field_value)
-                elif field == 'warehouse':
-                    all_q &= Q(warehouse__id=field_value)
-                elif field == 'owner':
-                    all_q &= Q(owner__id=field_value)
-                elif field == 'location':
-                    all_q &= Q(location__icontains=field_value)
-                elif field == 'employee_id':
-                    all_q &= Q(owner__profile__employee_id=field_value)
-                elif field == 'company':
-                    all_q &= Q(owner__profile__company__icontains=field_value)
-                elif field == 'segment':
-                    all_q &= Q(owner__profile__segment__icontains=field_value)
-                elif field == 'profit_center':
-                    all_q &= Q(owner__profile__profit_center=field_value)
-                elif field == 'cost_center':
-                    all_q &= Q(owner__profile__cost_center=field_value)
-                elif field == 'department':
-                    all_q &= Q(
-                        owner__profile__department__icontains=field_value
-                    )
-                elif field == 'remarks':
-                    all_q &= Q(remarks__icontains=field_value)
-                elif field == 'user':
-                    all_q &= Q(user__id=field_value)
-                elif field == 'guardian':
-                    all_q &= Q(guardian__id=field_value)
-                elif field == 'deprecation_rate':
-                    deprecation_rate_query_map = {
-                        'null': Q(deprecation_rate__isnull=True),
-                        'deprecated': Q(deprecation_rate=0),
-                        '6': Q(deprecation_rate__gt=0,
-                               deprecation_rate__lte=6),
-                        '12': Q(deprecation_rate__gt=6,
-                                deprecation_rate__lte=12),
-                        '24': Q(deprecation_rate__gt=12,
-                                deprecation_rate__lte=24),
-                        '48': Q(deprecation_rate__gt=24,
-                                deprecation_rate__lte=48),
-                        '48<': Q(deprecation_rate__gt=48),
-                    }
-                    all_q &= deprecation_rate_query_map[field_value]
-                elif field == 'unlinked' and field_value.lower() == 'on':
-                        all_q &= ~Q(device_info=None)
-                        all_q &= Q(device_info__ralph_device_id=None)
-                elif field == 'ralph_device_id':
-                    if exact:
-                        all_q &= Q(device_info__ralph_device_id=field_value)
-                    else:
-                        all_q &= Q(
-                            device_info__ralph_device_id__icontains=field_value
-                        )
-                elif field == 'task_url':
-                    if exact:
-                        all_q &= Q(task_url=field_value)
-                    else:
-                        all_q &= Q(task_url__icontains=field_value)
-                elif field == 'id':
-                        all_q &= Q(
-                            id__in=[int(id) for id in field_value.split(",")],
-                        )
-                elif field == 'imei':
-                    if exact:
-                        all_q &= Q(office_info__imei=field_value)
-                    else:
-                        all_q &= Q(office_info__imei__icontains=field_value)
-                elif field == 'service_name':
-                    all_q &= Q(service_name=field_value)
-                elif field == 'required_support':
-                    user_choice = True if field_value == 'yes' else False
-                    all_q &= Q(required_support=user_choice)
-                elif field == 'support_assigned':
-                    user_choice = True if field_value == 'none' else False
-                    all_q &= Q(supports__isnull=user_choice)
-                elif field == 'purpose':
-                    all_q &= Q(office_info__purpose=field_value)
-                elif field == 'budget_info':
-                    if exact:
-                        all_q &= Q(budget_info__name=field_value)
-                    else:
-                        all_q &= Q(budget_info__name__icontains=field_value)
-                elif field == 'service':
-                    if exact:
-                        all_q &= Q(service__name=field_value)
-                    else:
-                        all_q &= Q(service__name__icontains=field_value)
-                elif field == 'device_environment':
-                    if exact:
-                        all_q &= Q(device_environment__name=field_value)
-                    else:
-                        all_q &= Q(
-                            device_environment__name__icontains=field_value,
-                        )
-                elif field == 'without_assigned_location':
-                    empty_location = (
-                        Q(device_info__data_center=None) |
-                        Q(device_info__server_room=None) |
-                        Q(device_info__rack=None) |
-                        Q(device_info__position=None) |
-                        Q(device_info__orientation=None)
-                    )
-                    asset_without_category_and_location = (
-                        Q(model__category=None) & Q(empty_location)
-                    )
-                    blade_asset_with_empty_location = (
-                        Q(model__category__is_blade=True) &
-                        Q(empty_location | Q(device_info__slot_no=None))
-                    )
-                    not_blade_asset_with_empty_location = (
-                        Q(model__category__is_blade=False) & Q(empty_location)
-                    )
-                    all_q &= (
-                        asset_without_category_and_location |
-                        blade_asset_with_empty_location |
-                        not_blade_asset_with_empty_location
-                    )
-                elif field == 'region':
-                    all_q &= Q(region__id=field_value)
-                elif field == 'location_name':
-                    all_q &= (
-                        Q(device_info__rack__name=field_value) |
-                        Q(device_info__data_center__name=field_value) |
-                        Q(device_info__server_room__name=field_value) |
-                        Q(device_info__rack__server_room__name=field_value) |
-                        Q(device_info__rack__data_center__name=field_value)
-                    )
-                elif field == 'venture_department':
-                    devices = Device.objects.select_related(
-                        'venture__department'
-                    ).filter(
-                        venture__department__id=int(field_value)
-                    ).values_list('id', flat=True)
-                    all_q &= Q(device_info__ralph_device_id__in=devices)
-                else:
-                    q = Q(**{field: field_value})
-                    all_q = all_q & q
+        return compile_search_query(
+            self.request.GET,
+            spec=self.search_spec,
+            date_spec=self.search_date_spec,
+            view=self,
+        )
 
-        # now fields within ranges.
-        search_date_fields = [
-            'invoice_date', 'request_date', 'delivery_date',
-            'production_use_date', 'provider_order_date', 'loan_end_date',
-        ]
-        for date in search_date_fields:
-            start = self.request.GET.get(date + '_from')
-            end = self.request.GET.get(date + '_to')
-            if start:
-                all_q &= Q(**{date + '__gte': start})
-            if end:
-                all_q &= Q(**{date + '__lte': end})
-        self.items_count = Asset.objects.filter(all_q).count()
-        return all_q
+    def get_search_venture_department_part(self, field_value):
+        devices = Device.objects.select_related(
+            'venture__department'
+        ).filter(
+            venture__department__id=int(field_value)
+        ).values_list('id', flat=True)
+        return Q(device_info__ralph_device_id__in=devices)
 
 
 class GenericSearch(Report, AssetsBase, DataTableMixin):
@@ -378,7 +111,7 @@ class GenericSearch(Report, AssetsBase, DataTableMixin):
         if self.pre_selected:
             objects = objects.select_related(*self.pre_selected)
         query_set = objects.filter(query)
-        self.items_count = query_set.count()
+        self.items_count = cached_count(self.Model, query, query_set.count)
         return query_set.all()
 
 
@@ -430,16 +163,6 @@ class _AssetSearch(AssetsSearchQueryableMixin, AssetsBase):
             return self.admin_objects.filter(query)
         return self.objects.filter(query)
 
-    def _search_fields_or(self, fields, values):
-        q = Q()
-        for value in values:
-            value = value.strip()
-            if not value:
-                continue
-            for field in fields:
-                q |= Q(**{field: value})
-        return q
-
 
 class AssetSearchDataTable(_AssetSearch, DataTableMixin):
     """
@@ -448,6 +171,15 @@ class AssetSearchDataTable(_AssetSearch, DataTableMixin):
     """
     rows_per_page = 15
     csv_file_name = 'ralph.csv'
+    csv_chunk_size = 1000
+    csv_progress_every_rows = 500
+    csv_progress_every_seconds = 2
+    # opt-in seek pagination, see ralph_assets.pagination
+    keyset_pagination = settings.ASSETS_SEARCH['KEYSET_PAGINATION']
+    search_count_limit = settings.ASSETS_SEARCH['COUNT_LIMIT']
+    cursor_variable_name = 'cursor'
+    keyset_page = None
+    assets_count_capped = False
     sort_variable_name = 'sort'
     export_variable_name = 'export'
     _ = DataTableColumnAssets
@@ -548,50 +280,152 @@ class AssetSearchDataTable(_AssetSearch, DataTableMixin):
                 AssetSearchDataTable, self,
             ).handle_search_data(*args, **kwargs)
             queryset = self.get_all_items(all_q)
-            self.assets_count = queryset.count() if all_q.children else None
+            self.assets_count = (
+                self.count_search_results(queryset, all_q, exact=get_csv)
+                if all_q.children else None
+            )
+            self.items_count = self.assets_count
             if get_csv:
                 return self.get_csv_data(queryset)
+            elif self.keyset_pagination:
+                self.keyset_query(queryset)
             else:
                 self.data_table_query(queryset)
         else:
             queryset = self.objects.none()
-            self.assets_count = None
+            self.assets_count = self.items_count = None
             self.data_table_query(queryset)
             messages.error(self.request, _("Please correct the errors."))
 
+    def count_search_results(self, queryset, query, exact=False):
+        """Count search results (cached by *query*); in keyset mode stop at
+        ``search_count_limit`` unless *exact* is requested."""
+        model = queryset.model
+        if exact or not (self.keyset_pagination and self.search_count_limit):
+            return cached_count(model, query, queryset.count)
+        count, self.assets_count_capped = cached_count(
+            model, query,
+            lambda: capped_count(queryset, self.search_count_limit),
+            variant=self.search_count_limit,
+        )
+        return count
+
+    def get_keyset_ordering(self):
+        """Sort expression from request, if it belongs to any column."""
+        sort = self.request.GET.get(self.sort_variable_name) or ''
+        allowed = {
+            column.sort_expression for column in self.columns
+            if getattr(column, 'sort_expression', None)
+        }
+        if sort.lstrip('-') in allowed:
+            return sort
+        return None
+
+    def keyset_query(self, queryset):
+        """Seek pagination used instead of bob's OFFSET based one."""
+        # let bob set up sorting and export state without paginating
+        self.data_table_query(queryset.none())
+        paginator = KeysetPaginator(
+            queryset, self.rows_per_page, self.get_keyset_ordering(),
+        )
+        self.keyset_page = paginator.page(
+            self.request.GET.get(self.cursor_variable_name),
+        )
+
+    def get_keyset_page_url(self, cursor):
+        query = self.request.GET.copy()
+        query.pop(self.cursor_variable_name, None)
+        query.pop('page', None)
+        query[self.cursor_variable_name] = cursor
+        return '?' + query.urlencode()
+
     def get_csv_header(self):
         header = super(AssetSearchDataTable, self).get_csv_header()
         return ['type'] + header
 
+    def _get_related_path(self, model, lookup):
+        """Longest prefix of *lookup* following foreign keys and (also
+        reverse) one-to-one relations of *model*."""
+        current, path = model, []
+        for part in lookup.split('__'):
+            try:
+                field, __, direct, m2m = current._meta.get_field_by_name(part)
+            except FieldDoesNotExist:
+                break
+            if m2m:
+                break
+            if direct:
+                if not field.rel:
+                    break
+                current = field.rel.to
+            elif isinstance(field.field, OneToOneField):
+                current = field.model
+            else:
+                break
+            path.append(part)
+        return '__'.join(path)
+
+    def get_csv_related_paths(self, model, type=None):
+        """Relation paths used by exported rows (for select_related).
+
+        :param type: name of the relation read by columns of the mode (see
+            :meth:`get_csv_row`)
+        """
+        lookups = ['part_info']
+        for column in self.columns:
+            if not (column.field and column.export):
+                continue
+            if type and column.foreign_field_name == type:
+                lookups.append('{}__{}'.format(type, column.field))
+            else:
+                lookups.append(column.field)
+        paths = set(
+            self._get_related_path(model, lookup) for lookup in lookups
+        )
+        paths.discard('')
+        return sorted(paths)
+
+    def get_csv_row(self, asset, type, model):
+        row = ['part'] if asset.part_info else ['device']
+        for item in self.columns:
+            field = item.field
+            if field:
+                nested_field_name = item.foreign_field_name
+                if nested_field_name == type:
+                    cell = self.get_cell(
+                        getattr(asset, type), field, model
+                    )
+                # elif nested_field_name == 'part_info':
+                    # cell = self.get_cell(asset.part_info, field, PartInfo)
+                elif nested_field_name == 'venture':
+                    cell = self.get_cell(asset.venture, field, Venture)
+                elif nested_field_name == 'is_discovered':
+                    cell = unicode(asset.is_discovered)
+                else:
+                    cell = self.get_cell(asset, field, Asset)
+                row.append(unicode(cell))
+        return row
+
     def get_csv_rows(self, queryset, type, model):
-        data = [self.get_csv_header()]
-        total = queryset.count()
-        processed = 0
-        job = get_current_job()
-        for asset in queryset:
-            row = ['part'] if asset.part_info else ['device']
-            for item in self.columns:
-                field = item.field
-                if field:
-                    nested_field_name = item.foreign_field_name
-                    if nested_field_name == type:
-                        cell = self.get_cell(
-                            getattr(asset, type), field, model
-                        )
-                    # elif nested_field_name == 'part_info':
-                        # cell = self.get_cell(asset.part_info, field, PartInfo)
-                    elif nested_field_name == 'venture':
-                        cell = self.get_cell(asset.venture, field, Venture)
-                    elif nested_field_name == 'is_discovered':
-                        cell = unicode(asset.is_discovered)
-                    else:
-                        cell = self.get_cell(asset, field, Asset)
-                    row.append(unicode(cell))
-            data.append(row)
-            processed += 1
-            set_progress(job, processed / total)
-        set_progress(job, 1)
-        return data
+        """Yield the header and then rows, reading *queryset* in chunks."""
+        total = self.assets_count
+        if total is None:
+            total = queryset.count()
+        progress = ProgressReporter(
+            get_current_job(),
+            total,
+            every_rows=self.csv_progress_every_rows,
+            every_seconds=self.csv_progress_every_seconds,
+        )
+        yield self.get_csv_header()
+        queryset = queryset.select_related(
+            *self.get_csv_related_paths(queryset.model, type)
+        )
+        for chunk in iter_chunks(queryset, self.csv_chunk_size):
+            for asset in chunk:
+                yield self.get_csv_row(asset, type, model)
+            progress.step(len(chunk))
+        progress.finish()
 
     def get_context_data(self, *args, **kwargs):
         ret = super(
@@ -614,7 +448,22 @@ class AssetSearchDataTable(_AssetSearch, DataTableMixin):
             'asset_transitions_enable': settings.ASSETS_TRANSITIONS['ENABLE'],
             'asset_hide_action_search': settings.ASSET_HIDE_ACTION_SEARCH,
             'assets_count': self.assets_count,
+            'assets_count_capped': self.assets_count_capped,
         })
+        if self.keyset_page is not None:
+            page = self.keyset_page
+            ret.update({
+                'bob_page': page,
+                'keyset_pagination': True,
+                'keyset_next_url': (
+                    self.get_keyset_page_url(page.next_cursor)
+                    if page.has_next() else None
+                ),
+                'keyset_previous_url': (
+                    self.get_keyset_page_url(page.previous_cursor)
+                    if page.has_previous() else None
+                ),
+            })
         return ret
 
     def get(self, *args, **kwargs):
@@ -628,10 +477,21 @@ class AssetSearchDataTable(_AssetSearch, DataTableMixin):
         return self.export == 'csv'
 
     def get_result(self, request, *args, **kwargs):
+        """Stream the export into a file; only its path is kept in rq."""
         self.set_mode(kwargs['mode'])
-        return self.handle_search_data(get_csv=True)
+        rows = self.handle_search_data(get_csv=True)
+        if rows is None:
+            return []
+        return write_csv(rows, get_export_path(self.csv_file_name))
 
     def get_response(self, request, result):
+        if isinstance(result, basestring):
+            return make_csv_file_response(
+                result, self.csv_file_name,
+                rebuild=lambda: self.get_result(
+                    request, *self.args, **self.kwargs
+                ),
+            )
         return self.make_csv_response(result)
 
     def get_csv_data(self, queryset):
@@ -24,6 +24,7 @@ from lck.django.common import nested_commit_on_success
 from ralph_assets import signals
 from ralph_assets.exceptions import PostTransitionException
 from ralph_assets.forms_transitions import TransitionForm
+from ralph_assets.history.models import buffered_history
 from ralph_assets.models import (
     ReportOdtSourceLanguage,
     Transition,
@@ -190,6 +191,7 @@ class TransitionDispatcher(object):
         return self.file_name
 
     @nested_commit_on_success
+    @buffered_history()
     def run(self, request):
         self.file_name = None
         actions = self.transition.actions_names